@@ -0,0 +1,61 @@
+"""
+Micro-benchmark: table-driven mu-law codec vs. the previous soundfile round-trip.
+
+Run from backend/:
+    python -m benchmarks.bench_mulaw [--frames 20000]
+"""
+import argparse
+import timeit
+from io import BytesIO
+
+import numpy as np
+import soundfile as sf
+
+from services import mulaw_codec
+
+TWILIO_SAMPLE_RATE = 8000
+FRAME_BYTES = 160  # 20 ms of 8 kHz mu-law
+
+
+def soundfile_decode(mulaw_data: bytes) -> bytes:
+    pcm_data, _ = sf.read(BytesIO(mulaw_data), dtype='int16', channels=1, samplerate=TWILIO_SAMPLE_RATE, format='RAW', subtype='ULAW')
+    output_buffer = BytesIO()
+    sf.write(output_buffer, pcm_data, TWILIO_SAMPLE_RATE, format='RAW', subtype='PCM_16')
+    return output_buffer.getvalue()
+
+
+def soundfile_encode(pcm_data: bytes) -> bytes:
+    audio_np, _ = sf.read(BytesIO(pcm_data), dtype='int16', channels=1, samplerate=TWILIO_SAMPLE_RATE, format='RAW', subtype='PCM_16')
+    output_buffer = BytesIO()
+    sf.write(output_buffer, audio_np, TWILIO_SAMPLE_RATE, format='RAW', subtype='ULAW')
+    return output_buffer.getvalue()
+
+
+def report(name: str, seconds: float, frames: int) -> float:
+    per_frame_us = seconds / frames * 1e6
+    print(f"{name:<28} {per_frame_us:8.2f} us/frame")
+    return per_frame_us
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=20000, help="Number of 20 ms frames per measurement")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    mulaw_frame = rng.integers(0, 256, FRAME_BYTES, dtype=np.uint8).tobytes()
+    pcm_frame = (rng.standard_normal(FRAME_BYTES) * 4000).astype(np.int16).tobytes()
+
+    assert soundfile_decode(mulaw_frame) == mulaw_codec.ulaw_to_pcm16(mulaw_frame), "decode mismatch"
+    assert soundfile_encode(pcm_frame) == mulaw_codec.pcm16_to_ulaw(pcm_frame), "encode mismatch"
+
+    print(f"{args.frames} frames of {FRAME_BYTES} samples each")
+    sf_dec = report("decode soundfile", timeit.timeit(lambda: soundfile_decode(mulaw_frame), number=args.frames), args.frames)
+    tb_dec = report("decode table", timeit.timeit(lambda: mulaw_codec.ulaw_to_pcm16(mulaw_frame), number=args.frames), args.frames)
+    sf_enc = report("encode soundfile", timeit.timeit(lambda: soundfile_encode(pcm_frame), number=args.frames), args.frames)
+    tb_enc = report("encode table", timeit.timeit(lambda: mulaw_codec.pcm16_to_ulaw(pcm_frame), number=args.frames), args.frames)
+    print(f"speedup: decode x{sf_dec / tb_dec:.1f}, encode x{sf_enc / tb_enc:.1f}")
+
+
+if __name__ == "__main__":
+    main()
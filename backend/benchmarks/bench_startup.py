@@ -0,0 +1,135 @@
+"""
+Startup benchmark: import cost per module and time until the server is listening and ready.
+
+Each run imports main.py in a fresh interpreter with `-X importtime` and reports
+the median cumulative import time of main, its direct imports, the services
+modules and the heavy third-party packages, wherever they are first imported.
+With --serve it also starts uvicorn and times how long it takes for GET / to
+answer (listening) and for GET /ready to return 200 (warm).
+
+Run from backend/:
+    python -m benchmarks.bench_startup [--runs 5] [--serve] [--max-import-ms 800]
+"""
+import argparse
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+HEAVY_PACKAGES = ("fastapi", "uvicorn", "pydantic", "starlette", "numpy", "aiohttp", "twilio", "soundfile", "dotenv")
+_IMPORT_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s+)(\S+)$")
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def bench_env() -> dict:
+    env = dict(os.environ)
+    # A working config is not needed to measure startup, but the app must not try to reach real services.
+    env.setdefault("DEEPGRAM_API_KEY", "benchmark")
+    env.setdefault("DEEPGRAM_AGENT_URL", "ws://127.0.0.1:9/agent")
+    env.setdefault("TENANT_DB_PATH", os.path.join("/tmp", f"bench_startup_{os.getpid()}.db"))
+    env.setdefault("CONVERSATION_DIR", os.path.join("/tmp", f"bench_startup_{os.getpid()}_conversations"))
+    return env
+
+
+def import_profile() -> dict:
+    """One fresh `import main`. Returns {module: (self_us, cumulative_us, depth)} for first imports."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=BACKEND_DIR,
+                            env=bench_env(), capture_output=True, text=True, check=True)
+    entries = []
+    for line in result.stderr.splitlines():
+        match = _IMPORT_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            entries.append((name, int(self_us), int(cumulative_us), (len(indent) - 1) // 2))
+    # Children are listed before their parent: main's subtree runs back to the previous top-level import.
+    end = next(i for i, entry in enumerate(entries) if entry[0] == "main" and entry[3] == 0)
+    start = end
+    while start > 0 and entries[start - 1][3] > 0:
+        start -= 1
+    return {name: (self_us, cumulative_us, depth) for name, self_us, cumulative_us, depth in entries[start:end + 1]}
+
+
+def interesting(name: str, depth: int) -> bool:
+    return depth <= 1 or name.startswith("services.") or name in HEAVY_PACKAGES
+
+
+def serve_once(port: int, timeout_s: float) -> tuple:
+    """Starts uvicorn and returns (seconds until GET / answers, seconds until GET /ready is 200)."""
+    started = time.perf_counter()
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port)],
+                              cwd=BACKEND_DIR, env=bench_env(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    listening = ready = None
+    try:
+        while time.perf_counter() - started < timeout_s and ready is None:
+            path = "/" if listening is None else "/ready"
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}{path}", timeout=1) as resp:
+                    if resp.status == 200:
+                        elapsed = time.perf_counter() - started
+                        if listening is None:
+                            listening = elapsed
+                        else:
+                            ready = elapsed
+                        continue
+            except urllib.error.HTTPError:
+                pass   # /ready answers 503 until warm
+            except (urllib.error.URLError, ConnectionError, socket.timeout):
+                pass   # not listening yet
+            time.sleep(0.005)
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+    return listening, ready
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per measurement")
+    parser.add_argument("--serve", action="store_true", help="Also time uvicorn until listening and until /ready")
+    parser.add_argument("--max-import-ms", type=float, default=None, help="Exit with status 1 if importing main takes longer")
+    args = parser.parse_args()
+
+    profiles = [import_profile() for _ in range(args.runs)]
+    names = {name for profile in profiles for name, (_, _, depth) in profile.items() if interesting(name, depth)}
+    rows = []
+    for name in names:
+        samples = [profile[name] for profile in profiles if name in profile]
+        rows.append((statistics.median(s[1] for s in samples) / 1000, statistics.median(s[0] for s in samples) / 1000,
+                     min(s[2] for s in samples), name, len(samples)))
+    rows.sort(reverse=True)
+
+    print(f"import main: median of {args.runs} fresh interpreters (ms; cumulative includes first-time sub-imports)")
+    print(f"{'module':<36} {'cumulative':>10} {'self':>8}")
+    for cumulative_ms, self_ms, depth, name, seen in rows:
+        note = "" if seen == args.runs else f"  (imported in {seen}/{args.runs} runs)"
+        print(f"{'  ' * min(depth, 3) + name:<36} {cumulative_ms:10.1f} {self_ms:8.1f}{note}")
+    total_ms = next(row[0] for row in rows if row[3] == "main")
+
+    if args.serve:
+        timings = [serve_once(free_port(), timeout_s=60) for _ in range(max(1, args.runs // 2))]
+        listening = [t[0] for t in timings if t[0] is not None]
+        ready = [t[1] for t in timings if t[1] is not None]
+        print(f"\nuvicorn main:app: listening after {statistics.median(listening) * 1000:.0f} ms" if listening else "\nuvicorn main:app: never listened")
+        print(f"ready (GET /ready == 200) after {statistics.median(ready) * 1000:.0f} ms" if ready else "never became ready")
+
+    if args.max_import_ms is not None and total_ms > args.max_import_ms:
+        print(f"\nFAIL: import main took {total_ms:.0f} ms (limit {args.max_import_ms:.0f} ms)")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
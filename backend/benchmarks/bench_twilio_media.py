@@ -0,0 +1,86 @@
+"""
+Micro-benchmark: Twilio media framing (services.twilio_media) vs. the previous json path.
+
+Inbound: json.loads + dict lookups + base64.b64decode against parse_media().
+Outbound: json.dumps of the media dict with base64.b64encode against
+MediaFrameEncoder.encode(). Both inbound message layouts are measured: Twilio's
+compact JSON and the spaced json.dumps output the load test sends.
+
+Run from backend/:
+    python -m benchmarks.bench_twilio_media [--frames 100000]
+"""
+import argparse
+import base64
+import json
+import timeit
+
+import numpy as np
+
+from services import twilio_media
+
+FRAME_BYTES = 160  # 20 ms of 8 kHz mu-law
+STREAM_SID = "MZ" + "0123456789abcdef" * 2
+
+
+def json_parse(message: str):
+    data = json.loads(message)
+    if data.get('event') != 'media':
+        return None
+    media = data.get('media', {})
+    return int(data.get('sequenceNumber')), int(media.get('timestamp') or 0), base64.b64decode(media.get('payload'))
+
+
+def json_encode(mulaw_frame: bytes) -> str:
+    return json.dumps({
+        "event": "media", "streamSid": STREAM_SID,
+        "media": {"payload": base64.b64encode(mulaw_frame).decode('ascii')}
+    })
+
+
+def media_message(mulaw_frame: bytes, separators) -> str:
+    # Key order as Twilio sends it.
+    return json.dumps({
+        "event": "media", "sequenceNumber": "1234",
+        "media": {"track": "inbound", "chunk": "1233", "timestamp": "24660", "payload": base64.b64encode(mulaw_frame).decode('ascii')},
+        "streamSid": STREAM_SID,
+    }, separators=separators)
+
+
+def best_of(fn, frames: int) -> float:
+    return min(timeit.repeat(fn, number=frames, repeat=5))
+
+
+def report(name: str, seconds: float, frames: int) -> float:
+    per_frame_us = seconds / frames * 1e6
+    print(f"{name:<28} {per_frame_us:8.2f} us/frame")
+    return per_frame_us
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=100000, help="Number of 20 ms frames per measurement (best of 5)")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    mulaw_frame = rng.integers(0, 256, FRAME_BYTES, dtype=np.uint8).tobytes()
+    compact = media_message(mulaw_frame, (",", ":"))
+    spaced = media_message(mulaw_frame, None)
+    encoder = twilio_media.MediaFrameEncoder(STREAM_SID)
+
+    for message in (compact, spaced):
+        assert twilio_media.parse_media(message) == json_parse(message), "parse mismatch"
+    assert json.loads(encoder.encode(mulaw_frame)) == json.loads(json_encode(mulaw_frame)), "encode mismatch"
+    assert twilio_media.parse_media('{"event":"mark","streamSid":"MZ1","mark":{"name":"m"}}') is None, "control event on fast path"
+
+    print(f"{args.frames} frames of {FRAME_BYTES} bytes each")
+    js_in = report("parse json (compact)", best_of(lambda: json_parse(compact), args.frames), args.frames)
+    fp_in = report("parse fast (compact)", best_of(lambda: twilio_media.parse_media(compact), args.frames), args.frames)
+    js_sp = report("parse json (spaced)", best_of(lambda: json_parse(spaced), args.frames), args.frames)
+    fp_sp = report("parse fast (spaced)", best_of(lambda: twilio_media.parse_media(spaced), args.frames), args.frames)
+    js_out = report("encode json", best_of(lambda: json_encode(mulaw_frame), args.frames), args.frames)
+    tp_out = report("encode template", best_of(lambda: encoder.encode(mulaw_frame), args.frames), args.frames)
+    print(f"speedup: parse x{js_in / fp_in:.1f} (spaced x{js_sp / fp_sp:.1f}), encode x{js_out / tp_out:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""Audio helpers shared by the load-test stand-ins."""
+import wave
+
+import numpy as np
+
+from services import mulaw_codec
+from services.resampler import StreamingResampler
+
+TWILIO_SAMPLE_RATE = 8000
+TWILIO_FRAME_BYTES = 160
+
+
+def load_wav_pcm16(path: str):
+    """Reads a 16-bit PCM WAV and returns (mono int16 samples, sample rate)."""
+    with wave.open(path, "rb") as wav:
+        if wav.getsampwidth() != 2:
+            raise ValueError(f"{path}: only 16-bit PCM WAV files are supported")
+        channels = wav.getnchannels()
+        rate = wav.getframerate()
+        samples = np.frombuffer(wav.readframes(wav.getnframes()), dtype="<i2")
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1).astype(np.int16)
+    return samples, rate
+
+
+def synth_speech_like(seconds: float, sample_rate: int, seed: int = 0) -> np.ndarray:
+    """Syllable-like bursts (harmonic tone under an on/off envelope) with quiet gaps, as int16."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    pitch = 140 + 30 * np.sin(2 * np.pi * 0.7 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / sample_rate
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 6))
+    envelope = (np.sin(2 * np.pi * 2.5 * t) > -0.2).astype(np.float64)
+    envelope *= (np.sin(2 * np.pi * 0.25 * t) > -0.5)
+    signal = 6000 * voiced * envelope + rng.normal(0, 30, len(t))
+    return np.clip(signal, -32768, 32767).astype(np.int16)
+
+
+def to_twilio_frames(samples: np.ndarray, sample_rate: int) -> list:
+    """Converts PCM to the 20 ms, 8 kHz mu-law frames Twilio sends in media events."""
+    if sample_rate != TWILIO_SAMPLE_RATE:
+        samples = StreamingResampler(sample_rate, TWILIO_SAMPLE_RATE).process_array(samples).copy()
+    mulaw = mulaw_codec.pcm16_array_to_ulaw(np.ascontiguousarray(samples, dtype=np.int16)).tobytes()
+    usable = len(mulaw) - len(mulaw) % TWILIO_FRAME_BYTES
+    return [mulaw[offset:offset + TWILIO_FRAME_BYTES] for offset in range(0, usable, TWILIO_FRAME_BYTES)]
@@ -0,0 +1,102 @@
+"""
+Local stand-in for the Deepgram Agent WebSocket, for load tests.
+
+Accepts any Authorization header, answers the SettingsConfiguration with
+Welcome/SettingsApplied, and then either:
+  echo   - sends every inbound 16 kHz chunk straight back as 24 kHz audio
+  canned - every --turn-seconds of inbound audio, emits a user transcript and
+           plays a canned agent reply (a WAV file, or a generated tone) faster
+           than real time, followed by AgentAudioDone
+
+Run from backend/:
+    python -m benchmarks.loadtest.fake_deepgram --port 8765 --mode echo
+and point the backend at it with DEEPGRAM_AGENT_URL=ws://127.0.0.1:8765/agent.
+"""
+import argparse
+import asyncio
+import json
+import logging
+
+import numpy as np
+from aiohttp import WSMsgType, web
+
+from benchmarks.loadtest.audio import load_wav_pcm16, synth_speech_like
+from services.resampler import StreamingResampler
+
+INPUT_SAMPLE_RATE = 16000
+OUTPUT_SAMPLE_RATE = 24000
+REPLY_CHUNK_BYTES = 4800  # 100 ms of 24 kHz linear16
+
+
+def build_app(mode: str, canned_reply: bytes, turn_seconds: float) -> web.Application:
+    turn_bytes = int(turn_seconds * INPUT_SAMPLE_RATE * 2)
+
+    async def agent_handler(request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse(max_msg_size=0)
+        await ws.prepare(request)
+        await ws.send_str(json.dumps({"type": "Welcome", "session_id": "loadtest"}))
+        upsampler = StreamingResampler(INPUT_SAMPLE_RATE, OUTPUT_SAMPLE_RATE)
+        inbound_bytes = 0
+        turns = 0
+        reply_task = None
+
+        async def play_reply(turn: int):
+            await ws.send_str(json.dumps({"type": "ConversationText", "role": "user", "content": f"load test turn {turn}"}))
+            await ws.send_str(json.dumps({"type": "AgentThinking", "content": ""}))
+            await ws.send_str(json.dumps({"type": "AgentStartedSpeaking", "total_latency": 0.0}))
+            await ws.send_str(json.dumps({"type": "ConversationText", "role": "assistant", "content": f"canned reply {turn}"}))
+            for offset in range(0, len(canned_reply), REPLY_CHUNK_BYTES):
+                await ws.send_bytes(canned_reply[offset:offset + REPLY_CHUNK_BYTES])
+                await asyncio.sleep(0.01)
+            await ws.send_str(json.dumps({"type": "AgentAudioDone"}))
+
+        async for msg in ws:
+            if msg.type == WSMsgType.TEXT:
+                data = json.loads(msg.data)
+                if data.get("type") == "SettingsConfiguration":
+                    await ws.send_str(json.dumps({"type": "SettingsApplied"}))
+            elif msg.type == WSMsgType.BINARY:
+                if mode == "echo":
+                    await ws.send_bytes(upsampler.process(msg.data))
+                    continue
+                inbound_bytes += len(msg.data)
+                if inbound_bytes >= turn_bytes and (reply_task is None or reply_task.done()):
+                    inbound_bytes = 0
+                    turns += 1
+                    reply_task = asyncio.create_task(play_reply(turns))
+            elif msg.type in (WSMsgType.ERROR, WSMsgType.CLOSE):
+                break
+        if reply_task is not None:
+            reply_task.cancel()
+        return ws
+
+    app = web.Application()
+    app.router.add_get("/agent", agent_handler)
+    return app
+
+
+def load_canned_reply(wav_path: str) -> bytes:
+    if wav_path:
+        pcm, rate = load_wav_pcm16(wav_path)
+    else:
+        pcm, rate = synth_speech_like(seconds=3.0, sample_rate=OUTPUT_SAMPLE_RATE), OUTPUT_SAMPLE_RATE
+    if rate != OUTPUT_SAMPLE_RATE:
+        pcm = StreamingResampler(rate, OUTPUT_SAMPLE_RATE).process_array(pcm).copy()
+    return np.asarray(pcm, dtype=np.int16).tobytes()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--mode", choices=("echo", "canned"), default="echo")
+    parser.add_argument("--reply-wav", default=None, help="16-bit mono WAV used as the canned agent reply")
+    parser.add_argument("--turn-seconds", type=float, default=6.0, help="Inbound audio per simulated user turn (canned mode)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    app = build_app(args.mode, load_canned_reply(args.reply_wav), args.turn_seconds)
+    web.run_app(app, host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""
+Offline load test for the Twilio <-> Deepgram bridge.
+
+Starts the fake Deepgram agent and a `main.py` server (uvicorn) as
+subprocesses, with DEEPGRAM_AGENT_URL pointing at the stand-in. It then ramps
+up N concurrent synthetic Twilio calls and reports:
+- frame latency percentiles (echo mode: i-th frame sent -> i-th frame received)
+- dropped frames
+- server CPU per call
+- event-loop lag (scraped from GET /metrics)
+- turn latency (canned mode)
+
+Run from backend/:
+    python -m benchmarks.loadtest.run_loadtest --calls 50 --ramp-seconds 10 --duration 30
+    python -m benchmarks.loadtest.run_loadtest --calls 20 --mode canned --wav caller.wav
+Use --server-url to target an already running server instead of spawning one.
+Any extra KEY=VALUE arguments after `--` are passed to the spawned server's environment.
+The spawned server has the connect clip disabled (empty CONNECT_CLIP_TEXT and a
+fresh CLIP_DIR), since clip frames would otherwise be counted as echoes; start a
+--server-url target the same way.
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+import aiohttp
+
+from benchmarks.loadtest.audio import load_wav_pcm16, synth_speech_like, to_twilio_frames
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def percentile(sorted_values: list, fraction: float):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def process_cpu_seconds(pid: int):
+    """User + system CPU seconds of a process, from /proc (Linux only)."""
+    try:
+        with open(f"/proc/{pid}/stat") as stat_file:
+            fields = stat_file.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def histogram_quantiles(metrics_text: str, name: str, fractions=(0.5, 0.99)) -> dict:
+    """Approximate quantiles (bucket upper bounds) from a Prometheus histogram, summed over labels."""
+    buckets = {}
+    for match in re.finditer(rf'^{name}_bucket\{{(?:[^}}]*,)?le="([^"]+)"\}} (\S+)$', metrics_text, re.MULTILINE):
+        bound = float("inf") if match.group(1) == "+Inf" else float(match.group(1))
+        buckets[bound] = buckets.get(bound, 0) + float(match.group(2))
+    if not buckets:
+        return {}
+    bounds = sorted(buckets)
+    total = buckets[bounds[-1]]
+    result = {}
+    for fraction in fractions:
+        target = fraction * total
+        result[f"p{int(fraction * 100)}"] = next((bound for bound in bounds if buckets[bound] >= target), None) if total else None
+    return result
+
+
+def gauge_value(metrics_text: str, name: str):
+    match = re.search(rf"^{name} (\S+)$", metrics_text, re.MULTILINE)
+    return float(match.group(1)) if match else None
+
+
+async def wait_until_up(url: str, timeout: float = 20.0):
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            try:
+                async with session.get(url) as response:
+                    if response.status < 500:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+async def fetch_text(url: str) -> str:
+    async with aiohttp.ClientSession() as session:
+        async with session.get(url) as response:
+            return await response.text()
+
+
+async def run(args, server_pid):
+    from benchmarks.loadtest.twilio_client import run_call
+
+    if args.wav:
+        samples, rate = load_wav_pcm16(args.wav)
+    else:
+        samples, rate = synth_speech_like(args.duration, 8000), 8000
+    frames = to_twilio_frames(samples, rate)
+    frames_per_call = int(args.duration / 0.02)
+    frames = (frames * (frames_per_call // max(1, len(frames)) + 1))[:frames_per_call]
+
+    ws_base = args.server_url.replace("http://", "ws://").replace("https://", "wss://").rstrip("/")
+    cpu_before = process_cpu_seconds(server_pid) if server_pid else None
+    wall_before = time.monotonic()
+
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        async def delayed_call(index: int):
+            await asyncio.sleep(index * args.ramp_seconds / max(1, args.calls))
+            call_sid = f"CALOADTEST{index:05d}"
+            return await run_call(session, f"{ws_base}/ws/call/{call_sid}", call_sid, frames)
+
+        results = await asyncio.gather(*(delayed_call(index) for index in range(args.calls)))
+
+    wall = time.monotonic() - wall_before
+    cpu_after = process_cpu_seconds(server_pid) if server_pid else None
+    metrics_text = await fetch_text(f"{args.server_url.rstrip('/')}/metrics")
+
+    failed = [result for result in results if result["error"]]
+    latencies = sorted(latency for result in results for latency in result["frame_latencies"])
+    sent = sum(result["frames_sent"] for result in results)
+    received = sum(result["frames_received"] for result in results)
+    report = {
+        "calls": args.calls,
+        "failed_calls": len(failed),
+        "mode": args.mode,
+        "duration_s": args.duration,
+        "wall_s": round(wall, 2),
+        "frames_sent": sent,
+        "frames_received": received,
+        "frames_dropped": max(0, sent - received) if args.mode == "echo" else None,
+        "client_max_send_lag_ms": round(max((result["max_send_lag_s"] for result in results), default=0) * 1000, 1),
+        "marks": sum(result["marks"] for result in results),
+        "clears": sum(result["clears"] for result in results),
+    }
+    if args.mode == "echo" and latencies:
+        report["frame_latency_ms"] = {
+            name: round(percentile(latencies, fraction) * 1000, 1)
+            for name, fraction in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99), ("max", 1.0))
+        }
+    if cpu_before is not None and cpu_after is not None:
+        cpu_seconds = cpu_after - cpu_before
+        report["server_cpu_s"] = round(cpu_seconds, 2)
+        report["server_cpu_pct_of_core"] = round(100 * cpu_seconds / wall, 1)
+        report["server_cpu_pct_per_call"] = round(100 * cpu_seconds / wall / max(1, args.calls - len(failed)), 2)
+    report["event_loop_lag_s"] = histogram_quantiles(metrics_text, "event_loop_lag_seconds")
+    report["event_loop_lag_s"]["max"] = gauge_value(metrics_text, "event_loop_lag_max_seconds")
+    if args.mode == "canned":
+        report["turn_latency_s"] = histogram_quantiles(metrics_text, "bridge_turn_latency_seconds")
+    if failed:
+        report["first_errors"] = [result["error"] for result in failed[:5]]
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=10, help="Concurrent calls to ramp up to")
+    parser.add_argument("--ramp-seconds", type=float, default=5.0, help="Time over which calls are started")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds of audio each call sends")
+    parser.add_argument("--wav", default=None, help="16-bit PCM WAV to replay as the caller (default: synthetic speech)")
+    parser.add_argument("--mode", choices=("echo", "canned"), default="echo", help="Fake Deepgram behaviour")
+    parser.add_argument("--server-url", default=None, help="Use a running server instead of spawning one")
+    parser.add_argument("--port", type=int, default=8790, help="Port for the spawned server")
+    parser.add_argument("--deepgram-port", type=int, default=8791, help="Port for the fake Deepgram agent")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON only")
+    parser.add_argument("server_env", nargs="*", help="KEY=VALUE settings for the spawned server, after --")
+    args = parser.parse_args()
+
+    children = []
+    server_pid = None
+    clip_dir = tempfile.TemporaryDirectory(prefix="loadtest-clips-")
+    try:
+        deepgram_cmd = [sys.executable, "-m", "benchmarks.loadtest.fake_deepgram", "--port", str(args.deepgram_port), "--mode", args.mode]
+        children.append(subprocess.Popen(deepgram_cmd, cwd=BACKEND_DIR))
+        if args.server_url is None:
+            env = dict(os.environ)
+            env.update({
+                "DEEPGRAM_API_KEY": env.get("DEEPGRAM_API_KEY", "loadtest"),
+                "DEEPGRAM_AGENT_URL": f"ws://127.0.0.1:{args.deepgram_port}/agent",
+                "CONNECT_CLIP_TEXT": "",
+                "CLIP_DIR": clip_dir.name,
+            })
+            env.update(item.split("=", 1) for item in args.server_env)
+            server_cmd = [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(args.port), "--log-level", "warning"]
+            server = subprocess.Popen(server_cmd, cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL)
+            children.append(server)
+            server_pid = server.pid
+            args.server_url = f"http://127.0.0.1:{args.port}"
+        asyncio.run(wait_until_up(f"{args.server_url}/ready"))
+        report = asyncio.run(run(args, server_pid))
+    finally:
+        for child in children:
+            child.send_signal(signal.SIGINT)
+        for child in children:
+            try:
+                child.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                child.kill()
+        clip_dir.cleanup()
+
+    if args.json:
+        print(json.dumps(report))
+        return
+    for key, value in report.items():
+        print(f"{key:<28} {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Synthetic Twilio media-stream client: replays mu-law frames against /ws/call/{call_sid}."""
+import asyncio
+import base64
+import json
+import time
+
+import aiohttp
+
+FRAME_SECONDS = 0.02
+
+
+async def run_call(session: aiohttp.ClientSession, ws_url: str, call_sid: str, frames: list, tail_seconds: float = 1.0) -> dict:
+    """Plays `frames` in real time as Twilio would (start/media/stop) and records what comes back."""
+    stream_sid = f"MZ{call_sid}"
+    send_times = []
+    recv_times = []
+    send_lag = 0.0
+    marks = 0
+    clears = 0
+    error = None
+    started = time.monotonic()
+    try:
+        async with session.ws_connect(ws_url, max_msg_size=0) as ws:
+            connected_at = time.monotonic()
+
+            async def receive():
+                nonlocal marks, clears
+                async for msg in ws:
+                    if msg.type != aiohttp.WSMsgType.TEXT:
+                        break
+                    data = json.loads(msg.data)
+                    event = data.get("event")
+                    if event == "media":
+                        recv_times.append(time.monotonic())
+                    elif event == "mark":
+                        marks += 1
+                        # Twilio echoes each mark once the audio before it has played.
+                        await ws.send_str(json.dumps({"event": "mark", "streamSid": stream_sid, "mark": data.get("mark", {})}))
+                    elif event == "clear":
+                        clears += 1
+
+            receiver = asyncio.create_task(receive())
+            await ws.send_str(json.dumps({"event": "connected", "protocol": "Call", "version": "1.0.0"}))
+            await ws.send_str(json.dumps({
+                "event": "start", "sequenceNumber": "1", "streamSid": stream_sid,
+                "start": {"streamSid": stream_sid, "callSid": call_sid, "tracks": ["inbound"],
+                          "mediaFormat": {"encoding": "audio/x-mulaw", "sampleRate": 8000, "channels": 1}},
+            }))
+            schedule_start = time.monotonic()
+            for index, frame in enumerate(frames):
+                due = schedule_start + index * FRAME_SECONDS
+                delay = due - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                else:
+                    send_lag = max(send_lag, -delay)
+                send_times.append(time.monotonic())
+                await ws.send_str(json.dumps({
+                    "event": "media", "sequenceNumber": str(index + 2), "streamSid": stream_sid,
+                    "media": {"track": "inbound", "chunk": str(index + 1), "timestamp": str(index * 20),
+                              "payload": base64.b64encode(frame).decode("ascii")},
+                }))
+            await asyncio.sleep(tail_seconds)
+            await ws.send_str(json.dumps({"event": "stop", "sequenceNumber": str(len(frames) + 2), "streamSid": stream_sid}))
+            await asyncio.sleep(0.2)
+            receiver.cancel()
+            await ws.close()
+    except Exception as e:
+        error = repr(e)
+        connected_at = None
+
+    matched = min(len(send_times), len(recv_times))
+    return {
+        "call_sid": call_sid,
+        "error": error,
+        "connect_s": (connected_at - started) if connected_at else None,
+        "first_audio_s": (recv_times[0] - send_times[0]) if recv_times and send_times else None,
+        "frames_sent": len(send_times),
+        "frames_received": len(recv_times),
+        "frame_latencies": [recv_times[i] - send_times[i] for i in range(matched)],
+        "max_send_lag_s": send_lag,
+        "marks": marks,
+        "clears": clears,
+    }
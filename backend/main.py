@@ -1,25 +1,101 @@
+import asyncio
+import base64
+import binascii
 import os
+import time
 import uuid
-from fastapi import FastAPI, Response, Request, HTTPException, WebSocket, WebSocketDisconnect
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Response, Request, HTTPException, WebSocket, WebSocketDisconnect, Header
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 from pydantic import BaseModel, Field
 from typing import Dict, List, Optional
 import logging 
-from starlette.websockets import WebSocketState 
 
 from services import telephony_service
 from services import streaming_service 
+from services import deepgram_pool
+from services import metrics
+from services import transcoding
+from services import campaign_service
+from services import lazy_imports
+from services.call_registry import call_registry
+from services.clip_cache import clip_cache, ClipError, encode_audio_file, render_clip
+from services.conversation_store import conversation_store, format_history
+from services.event_hub import event_hub, HubFullError
+from services.recorder import recorder
+from services.tenant_store import tenant_store, DEFAULT_TENANT_ID
 
 load_dotenv()
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - [%(funcName)s] %(message)s') 
 
-knowledge_summary: Optional[str] = None
-company_name: Optional[str] = "Default AI Services Inc." 
 
+async def _start_deepgram():
+    await asyncio.to_thread(lazy_imports.load, deepgram_pool.aiohttp)
+    await deepgram_pool.start()
 
-app = FastAPI(title="AI Sales Agent API - Deepgram Integration")
+async def warm_up(app: FastAPI):
+    """
+    Loads the heavy modules and builds the API clients concurrently, after the server is already listening.
+    /ready reports ready (and calls can be placed) once every step has finished.
+    """
+    started = time.perf_counter()
+    steps = app.state.warmup_steps
+
+    async def step(name: str, work):
+        step_started = time.perf_counter()
+        await work
+        steps[name] = round(time.perf_counter() - step_started, 3)
+
+    try:
+        await asyncio.gather(
+            step("transcoding", transcoding.get_executor().warm_up()),
+            step("deepgram", _start_deepgram()),
+            step("twilio", asyncio.to_thread(telephony_service.init_client)),
+            step("clips", asyncio.to_thread(clip_cache.open)),
+        )
+    except Exception as e:
+        app.state.warmup_error = f"{type(e).__name__}: {e}"
+        logging.error(f"Startup warm-up failed; staying unready: {e}", exc_info=True)
+        return
+    app.state.ready = True
+    campaign_service.campaign_manager.notify()
+    logging.info(f"Ready: warm-up took {time.perf_counter() - started:.2f}s {steps}")
+
+def dial_capacity() -> int:
+    return call_registry.available() if app.state.ready else 0
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.ready = False
+    app.state.warmup_error = None
+    app.state.warmup_steps = {}
+    tenant_store.open()
+    conversation_store.start()
+    recorder.start()
+    loop_monitor = metrics.start_loop_monitor()
+    campaign_service.campaign_manager.configure(dialer=place_outbound_call, capacity_fn=dial_capacity,
+                                                outcome_store=tenant_store, release_call=call_registry.release)
+    campaign_service.campaign_manager.start()
+    call_registry.on_release = campaign_service.campaign_manager.notify
+    call_registry.install_sigterm_drain()
+    warmup_task = asyncio.create_task(warm_up(app), name="warm-up")
+    yield
+    warmup_task.cancel()
+    call_registry.uninstall_sigterm_drain()
+    await campaign_service.campaign_manager.stop()
+    if loop_monitor: loop_monitor.cancel()
+    await deepgram_pool.stop()
+    transcoding.shutdown_executor()
+    logging.info("Transcoding executor shut down.")
+    await conversation_store.stop()
+    recorder.stop()
+    tenant_store.close()
+
+
+app = FastAPI(title="AI Sales Agent API - Deepgram Integration", lifespan=lifespan)
 
 origins = ["http://localhost:5173", "http://localhost"] 
 app.add_middleware(
@@ -35,8 +111,20 @@ class CallRequest(BaseModel):
     user_name: str = Field(..., min_length=1)
 class KnowledgeUploadRequest(BaseModel):
     knowledge_text: str = Field(..., min_length=10)
+    document_id: str = Field("default", min_length=1)
+class ClipUploadRequest(BaseModel):
+    text: str = Field(..., min_length=1)
+    voice: Optional[str] = None
+    audio_base64: Optional[str] = None   # any soundfile-readable file; rendered with Deepgram TTS if omitted
 class CompanyInfoRequest(BaseModel):
     name: str = Field(..., min_length=2)
+class CampaignCreateRequest(BaseModel):
+    name: str = Field(..., min_length=1)
+    contacts_text: str = Field(..., min_length=1)
+    format: str = "csv"
+    calls_per_second: Optional[float] = Field(None, gt=0)
+    max_concurrent_calls: Optional[int] = Field(None, ge=1)
+    max_attempts: Optional[int] = Field(None, ge=1)
 
 # --- API Endpoints ---
 
@@ -44,60 +132,127 @@ class CompanyInfoRequest(BaseModel):
 async def read_root():
     return {"message": "AI Sales Agent Backend (Deepgram) is running!"}
 
+@app.get("/ready")
+async def readiness():
+    """Readiness probe: 200 once codecs, worker pools and API clients are warm, 503 while starting or draining."""
+    body = {"ready": app.state.ready and not call_registry.draining, "draining": call_registry.draining,
+            "warmup_s": app.state.warmup_steps, "error": app.state.warmup_error}
+    return JSONResponse(body, status_code=200 if body["ready"] else 503)
+
 @app.get("/company_info")
-async def get_company_info():
-    global company_name
-    logging.info("Fetching company info")
-    return {"company_name": company_name or "Not Set"}
+async def get_company_info(tenant_id: str = Header(DEFAULT_TENANT_ID, alias="X-Tenant-ID")):
+    logging.info(f"Fetching company info for tenant: {tenant_id}")
+    return {"company_name": (await tenant_store.get_async(tenant_id)).company_name or "Not Set"}
 
 @app.post("/company_info")
-async def set_company_info(request: CompanyInfoRequest):
-    global company_name
-    company_name = request.name
-    logging.info(f"Company name updated to: {company_name}")
-    return {"success": True, "message": f"Company name set to {company_name}"}
+async def set_company_info(request: CompanyInfoRequest, tenant_id: str = Header(DEFAULT_TENANT_ID, alias="X-Tenant-ID")):
+    tenant_store.set_company_name(tenant_id, request.name)
+    logging.info(f"Company name for tenant {tenant_id} updated to: {request.name}")
+    return {"success": True, "message": f"Company name set to {request.name}"}
 
 @app.get("/get_knowledge")
-async def get_knowledge():
-    global knowledge_summary
-    logging.info("Fetching knowledge summary")
-    return {"knowledge_summary": knowledge_summary or "No knowledge summary available yet."}
+async def get_knowledge(tenant_id: str = Header(DEFAULT_TENANT_ID, alias="X-Tenant-ID")):
+    logging.info(f"Fetching knowledge summary for tenant: {tenant_id}")
+    return {"knowledge_summary": tenant_store.latest_document_text(tenant_id) or "No knowledge summary available yet."}
 
 @app.post("/upload_knowledge")
-async def upload_knowledge(request: KnowledgeUploadRequest):
+async def upload_knowledge(request: KnowledgeUploadRequest, tenant_id: str = Header(DEFAULT_TENANT_ID, alias="X-Tenant-ID")):
+    """
+    Indexes the knowledge text for retrieval. Uploading under an existing document_id replaces
+    only that document; calls get a bounded summary plus the best passages, not the full text.
     """
-    Stores the raw knowledge text. Deepgram's internal OpenAI call will use this.
+    logging.info(f"Received knowledge text for tenant {tenant_id} (document: {request.document_id}).")
+    knowledge_text = request.knowledge_text.strip()
+    tenant_store.put_document(tenant_id, request.document_id, knowledge_text)
+    config = await tenant_store.get_async(tenant_id)
+    logging.info(f"Knowledge base updated (length: {len(knowledge_text)} chars, {config.knowledge.passage_count} passages in total).")
+    return {"success": True, "message": "Knowledge base text stored for AI agent.", "document_id": request.document_id, "passages": config.knowledge.passage_count}
+
+@app.get("/knowledge/search")
+async def search_knowledge(q: str, k: int = 5, tenant_id: str = Header(DEFAULT_TENANT_ID, alias="X-Tenant-ID")):
+    """Shows which knowledge passages the index retrieves for a query."""
+    return {"query": q, "results": (await tenant_store.get_async(tenant_id)).knowledge.search(q, max(1, min(k, 50)))}
+
+@app.get("/knowledge/context")
+async def get_knowledge_context(tenant_id: str = Header(DEFAULT_TENANT_ID, alias="X-Tenant-ID")):
+    """The knowledge block each call currently receives in its agent instructions."""
+    config = await tenant_store.get_async(tenant_id)
+    return {"context": config.agent_context(), "documents": config.knowledge.documents()}
+
+@app.post("/clips")
+async def upload_clip(request: ClipUploadRequest, tenant_id: str = Header(DEFAULT_TENANT_ID, alias="X-Tenant-ID")):
     """
-    global knowledge_summary
-    logging.info("Received knowledge text for agent.")
-    knowledge_summary = request.knowledge_text.strip()
-    logging.info(f"Knowledge base updated (length: {len(knowledge_summary)} chars).")
-    return {"success": True, "message": "Knowledge base text stored for AI agent."}
+    Adds a pre-rendered clip for the tenant, from an uploaded audio file or rendered once with Deepgram TTS.
+    The clip whose text is CONNECT_CLIP_TEXT plays while each call's agent gets ready.
+    """
+    voice = request.voice or deepgram_pool.AGENT_VOICE
+    try:
+        if request.audio_base64:
+            mulaw = await asyncio.to_thread(encode_audio_file, base64.b64decode(request.audio_base64))
+        else:
+            mulaw = await render_clip(request.text, voice)
+        meta = await clip_cache.add(tenant_id, request.text, voice, mulaw)
+    except (ClipError, binascii.Error) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    logging.info(f"Stored clip for tenant {tenant_id}: {meta}")
+    return meta
 
+@app.get("/clips")
+async def list_clips(tenant_id: str = Header(DEFAULT_TENANT_ID, alias="X-Tenant-ID")):
+    return {"clips": clip_cache.clips(tenant_id), "cache": clip_cache.stats()}
 
-@app.post("/initiate_call")
-async def handle_initiate_call(request: CallRequest):
-    """
-    Initiates the call using Twilio, providing a URL for Twilio to fetch TwiML.
+
+async def place_outbound_call(phone_to_call: str, user_name: str, tenant_id: str = DEFAULT_TENANT_ID) -> dict:
+    """Reserves an agent session and places the Twilio call without blocking the event loop.
+
+    A call refused for capacity (nothing was dialled) comes back with "refused": True.
     """
-    phone_to_call = request.phone_number
-    user_name = request.user_name
     call_sid_placeholder = f"TEMP_{uuid.uuid4()}"
-    logging.info(f"Received request to call: {phone_to_call} for user: {user_name} (placeholder: {call_sid_placeholder})")
+    logging.info(f"Placing call to: {phone_to_call} for user: {user_name}, tenant: {tenant_id} (placeholder: {call_sid_placeholder})")
 
-    result = telephony_service.make_call(
+    if not call_registry.reserve(call_sid_placeholder):
+        logging.warning(f"Refusing call to {phone_to_call}: {call_registry.summary()}")
+        return {"error": "Server is at call capacity or draining; try again later.", "refused": True}
+
+    # Start connecting and configuring the agent while Twilio dials, so the media stream can claim it on connect.
+    config = await tenant_store.get_async(tenant_id)
+    agent_settings = deepgram_pool.build_agent_settings(config.company_name, config.agent_context())
+    deepgram_pool.agent_pool.reserve(call_sid_placeholder, config.company_name, agent_settings)
+    metrics.mark_call_initiated(call_sid_placeholder)
+
+    result = await telephony_service.make_call_async(
         destination_number=phone_to_call,
         call_sid_placeholder=call_sid_placeholder
         )
 
     if result.get("success"):
         actual_call_sid = result["call_sid"]
-        logging.info(f"Call initiated with actual CallSid: {actual_call_sid}. Frontend can now use this SID.")
+        tenant_store.record_call(actual_call_sid, tenant_id)
+        call_registry.rebind(call_sid_placeholder, actual_call_sid)
+        deepgram_pool.agent_pool.rebind(call_sid_placeholder, actual_call_sid)
+        metrics.rebind_call(call_sid_placeholder, actual_call_sid)
+        event_hub.publish(tenant_id, actual_call_sid, {"type": "CallInitiated", "phone_number": phone_to_call, "user_name": user_name, "ts": time.time()})
+        logging.info(f"Call initiated with actual CallSid: {actual_call_sid}.")
     else:
+        deepgram_pool.agent_pool.release(call_sid_placeholder)
+        call_registry.release(call_sid_placeholder)
         logging.error(f"Call initiation failed: {result.get('error')}")
 
     return result
 
+
+@app.post("/initiate_call")
+async def handle_initiate_call(request: CallRequest, tenant_id: str = Header(DEFAULT_TENANT_ID, alias="X-Tenant-ID")):
+    """
+    Initiates the call using Twilio, providing a URL for Twilio to fetch TwiML.
+    """
+    logging.info(f"Received request to call: {request.phone_number} for user: {request.user_name}")
+    if not app.state.ready:
+        raise HTTPException(status_code=503, detail="Server is still starting; try again shortly.", headers={"Retry-After": "5"})
+    if call_registry.available() <= 0:
+        raise HTTPException(status_code=503, detail="Server is at call capacity or draining; try again later.", headers={"Retry-After": "30"})
+    return await place_outbound_call(request.phone_number, request.user_name, tenant_id)
+
 @app.post("/handle_call_start/{call_sid_placeholder}")
 async def handle_call_start(request: Request, call_sid_placeholder: str):
     """
@@ -140,32 +295,41 @@ async def websocket_call_handler(websocket: WebSocket, call_sid: str):
     """
     Handles the bidirectional audio stream between Twilio and Deepgram Agent.
     """
+    tenant_id = tenant_store.tenant_for_call(call_sid)
+    session = call_registry.admit(call_sid, tenant_id)
+    if session is None:
+        logging.warning(f"Rejecting media stream for CallSid: {call_sid}: {call_registry.summary()}")
+        await websocket.close(code=1013, reason="Server at capacity")
+        return
     await websocket.accept()
     logging.info(f"Twilio WebSocket connected for CallSid: {call_sid} from {websocket.client}")
-    global company_name, knowledge_summary 
-
     try:
-        current_company_name = company_name
-        current_knowledge_summary = knowledge_summary
+        tenant_config = await tenant_store.get_async(tenant_id)
+        current_company_name = tenant_config.company_name
+        current_knowledge_summary = tenant_config.agent_context()
 
         await streaming_service.handle_deepgram_connection(
             twilio_ws=websocket,
             call_sid=call_sid,
             company_name=current_company_name,
-            knowledge_summary=current_knowledge_summary
+            knowledge_summary=current_knowledge_summary,
+            session=session
         )
     except WebSocketDisconnect:
         logging.warning(f"Twilio WebSocket disconnected expectedly for CallSid: {call_sid}")
     except Exception as e:
         logging.error(f"Unexpected error in main WebSocket handler for CallSid {call_sid}: {e}", exc_info=True)
-        if websocket.client_state == WebSocketState.CONNECTED:
+        if streaming_service.is_open(websocket):
              try:
                  await websocket.close(code=1011, reason="Internal server error during streaming")
              except Exception as close_exc:
                   logging.error(f"Error closing WebSocket after exception for {call_sid}: {close_exc}")
     finally:
         logging.info(f"Main WebSocket handler finished processing for CallSid: {call_sid}")
-        if websocket.client_state == WebSocketState.CONNECTED:
+        call_registry.remove(call_sid)
+        campaign_service.campaign_manager.on_call_finished(call_sid)
+        tenant_store.forget_call(call_sid)
+        if streaming_service.is_open(websocket):
             logging.warning(f"WebSocket {call_sid} still connected in main handler finally block, attempting close.")
             try:
                 await websocket.close(code=1000, reason="Handler cleanup complete")
@@ -173,14 +337,181 @@ async def websocket_call_handler(websocket: WebSocket, call_sid: str):
                  logging.warning(f"Exception during final WebSocket close in main handler for {call_sid}: {final_close_exc}")
 
 
+@app.websocket("/ws/events")
+async def events_websocket(websocket: WebSocket, tenant_id: str = DEFAULT_TENANT_ID, call_sid: Optional[str] = None, types: Optional[str] = None):
+    """
+    Push stream of live call events for dashboards (transcripts, barge-ins, call start/end, Twilio callbacks),
+    for a whole tenant or, with call_sid, a single call. `types` is an optional comma-separated filter.
+    """
+    try:
+        subscription = event_hub.subscribe(tenant_id, call_sid, [t for t in types.split(",") if t] if types else None)
+    except HubFullError as e:
+        logging.warning(f"Rejecting event subscriber: {e}")
+        await websocket.close(code=1013, reason="Too many subscribers")
+        return
+    await websocket.accept()
+
+    async def send_events():
+        while True:
+            for message in await subscription.next_batch():
+                await websocket.send_text(message)
+
+    sender = asyncio.create_task(send_events())
+    try:
+        # Subscribers only listen; reading just notices when they go away.
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+    except Exception:
+        pass
+    finally:
+        sender.cancel()
+        try:
+            await sender
+        except (asyncio.CancelledError, Exception):
+            pass
+        event_hub.unsubscribe(subscription)
+
+@app.get("/get_conversation_history/{call_sid}")
+async def get_conversation_history(call_sid: str):
+    """Transcript and agent events of a call, live or finished."""
+    events = await conversation_store.history(call_sid)
+    if not events:
+        raise HTTPException(status_code=404, detail=f"No conversation recorded for call {call_sid} yet.")
+    return {"call_sid": call_sid, "events": events, "formatted_text": format_history(events)}
+
+
+@app.get("/recordings/{call_sid}")
+async def get_recording(call_sid: str):
+    """Stereo WAV of a finished call (left: caller, right: agent), streamed from disk."""
+    if recorder.is_recording(call_sid):
+        raise HTTPException(status_code=409, detail=f"Call {call_sid} is still being recorded.")
+    path = recorder.finished_path(call_sid)
+    if path is None:
+        raise HTTPException(status_code=404, detail=f"No recording for call {call_sid}.")
+    return FileResponse(path, media_type="audio/wav", filename=f"{call_sid}.wav")
+
+
+@app.get("/calls")
+async def list_calls():
+    """Live calls handled by this worker, plus capacity and drain state."""
+    return {**call_registry.summary(), "calls": [session.status() for session in call_registry.sessions()]}
+
+@app.get("/calls/{call_sid}")
+async def get_call(call_sid: str):
+    session = call_registry.get(call_sid)
+    if session is None:
+        raise HTTPException(status_code=404, detail=f"Call {call_sid} is not active on this worker.")
+    return session.status()
+
+@app.post("/admin/drain")
+async def start_drain(wait_s: float = 0):
+    """Stops accepting new calls; with wait_s, also waits up to that long for active calls to finish."""
+    call_registry.start_drain()
+    drained = await call_registry.wait_idle(wait_s) if wait_s > 0 else call_registry.in_use == 0
+    return {**call_registry.summary(), "drained": drained}
+
+@app.delete("/admin/drain")
+async def stop_drain():
+    call_registry.stop_drain()
+    return call_registry.summary()
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus-style process metrics for the media bridge."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.post("/call_status")
+async def call_status(request: Request):
+    """Twilio status callback; frees the campaign slot and any unclaimed agent socket once a call reaches a final state."""
+    form_data = await request.form()
+    call_sid = form_data.get("CallSid")
+    status = form_data.get("CallStatus")
+    logging.info(f"[{call_sid}] Call status callback: {status}")
+    publish_webhook("TwilioCallStatus", form_data, ("CallStatus", "CallDuration", "AnsweredBy"))
+    if call_sid and status in campaign_service.TERMINAL_CALL_STATUSES:
+        call_registry.release(call_sid)
+        deepgram_pool.agent_pool.release(call_sid)   # busy/no-answer/failed calls never open a media stream
+        campaign_service.campaign_manager.on_call_finished(call_sid, status)
+    return Response(status_code=200)
+
+
+def get_campaign_or_404(campaign_id: str):
+    campaign = campaign_service.campaign_manager.get(campaign_id)
+    if campaign is None:
+        raise HTTPException(status_code=404, detail=f"Campaign {campaign_id} not found.")
+    return campaign
+
+@app.post("/campaigns")
+async def create_campaign(request: CampaignCreateRequest, tenant_id: str = Header(DEFAULT_TENANT_ID, alias="X-Tenant-ID")):
+    """Creates a dialing campaign from CSV or JSONL contacts and starts dialing."""
+    try:
+        contacts = campaign_service.parse_contacts(request.contacts_text, request.format.lower())
+        campaign = campaign_service.campaign_manager.create(
+            request.name,
+            contacts,
+            calls_per_second=request.calls_per_second or campaign_service.CAMPAIGN_DEFAULT_CPS,
+            max_live_calls=request.max_concurrent_calls,
+            max_attempts=request.max_attempts or campaign_service.CAMPAIGN_MAX_ATTEMPTS,
+            tenant_id=tenant_id,
+        )
+    except campaign_service.CampaignError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    campaign.start()
+    logging.info(f"Campaign {campaign.campaign_id} ({campaign.name}) started with {len(contacts)} contacts.")
+    return campaign.summary()
+
+@app.get("/campaigns")
+async def list_campaigns():
+    return {"campaigns": [campaign.summary() for campaign in campaign_service.campaign_manager.campaigns.values()]}
+
+@app.get("/campaigns/{campaign_id}")
+async def get_campaign(campaign_id: str, include_contacts: bool = False):
+    campaign = get_campaign_or_404(campaign_id)
+    summary = campaign.summary()
+    if include_contacts:
+        summary["contacts"] = [contact.to_dict() for contact in campaign.contacts]
+    return summary
+
+@app.post("/campaigns/{campaign_id}/pause")
+async def pause_campaign(campaign_id: str):
+    campaign = get_campaign_or_404(campaign_id)
+    campaign.pause()
+    return campaign.summary()
+
+@app.post("/campaigns/{campaign_id}/resume")
+async def resume_campaign(campaign_id: str):
+    campaign = get_campaign_or_404(campaign_id)
+    campaign.resume()
+    return campaign.summary()
+
+@app.post("/campaigns/{campaign_id}/cancel")
+async def cancel_campaign(campaign_id: str):
+    campaign = get_campaign_or_404(campaign_id)
+    campaign.cancel()
+    return campaign.summary()
+
+
+def publish_webhook(event_type: str, form_data, fields: tuple):
+    """Forwards selected fields of a Twilio webhook to the call's tenant on the event hub."""
+    call_sid = form_data.get("CallSid")
+    if not call_sid:
+        return
+    event = {"type": event_type, "ts": time.time()}
+    event.update((field, form_data[field]) for field in fields if field in form_data)
+    event_hub.publish(tenant_store.tenant_for_call(call_sid), call_sid, event)
+
 @app.post("/recording_status")
 async def recording_status(request: Request):
     form_data = await request.form();
     logging.info(f"Recording Status Callback: {dict(form_data)}")
+    publish_webhook("TwilioRecordingStatus", form_data, ("RecordingStatus", "RecordingSid", "RecordingUrl", "RecordingDuration"))
     return Response(status_code=200)
 
 @app.post("/transcription_status")
 async def transcription_status(request: Request):
     form_data = await request.form();
     logging.info(f"Transcription Status Callback: {dict(form_data)}")
+    publish_webhook("TwilioTranscriptionStatus", form_data, ("TranscriptionStatus", "TranscriptionSid", "TranscriptionText"))
     return Response(status_code=200)
\ No newline at end of file
@@ -0,0 +1,227 @@
+import asyncio
+import logging
+import os
+import signal
+import threading
+import time
+
+from services.playback import FRAME_BYTES
+
+# In-process registry of live calls. Each media stream gets a compact CallSession
+# that the bridge attaches its metrics, lanes and playback queue to, so /calls can
+# report live state without touching the hot path. The registry also enforces the
+# per-process call capacity (calls being dialled count against it) and implements
+# drain mode: new calls are refused while existing ones run to completion. Drain is
+# started from POST /admin/drain or by SIGTERM, which is held back until the
+# process is idle or CALL_DRAIN_TIMEOUT_S has passed.
+
+CALL_CAPACITY = int(os.getenv("CALL_CAPACITY", "100"))
+CALL_PENDING_TTL_S = float(os.getenv("CALL_PENDING_TTL_S", "90"))
+CALL_DRAIN_TIMEOUT_S = float(os.getenv("CALL_DRAIN_TIMEOUT_S", "600"))
+
+
+class CallSession:
+    __slots__ = ("call_sid", "tenant_id", "state", "started_at", "_started_monotonic", "stream_sid",
+                 "call_metrics", "inbound_lane", "outbound_lane", "playback", "jitter_buffer", "vad", "recording")
+
+    def __init__(self, call_sid: str, tenant_id: str = None):
+        self.call_sid = call_sid
+        self.tenant_id = tenant_id
+        self.state = "connecting"   # connecting | active | ending
+        self.started_at = time.time()
+        self._started_monotonic = time.monotonic()
+        self.stream_sid = None
+        self.call_metrics = None
+        self.inbound_lane = None
+        self.outbound_lane = None
+        self.playback = None
+        self.jitter_buffer = None
+        self.vad = None
+        self.recording = None
+
+    @property
+    def duration_s(self) -> float:
+        return time.monotonic() - self._started_monotonic
+
+    def status(self) -> dict:
+        call_metrics = self.call_metrics
+        playback = self.playback
+        status = {
+            "call_sid": self.call_sid, "tenant_id": self.tenant_id, "state": self.state,
+            "stream_sid": self.stream_sid, "started_at": self.started_at, "duration_s": round(self.duration_s, 1),
+            "caller_speaking": self.vad.speaking if self.vad is not None else None,
+        }
+        if call_metrics is not None:
+            status["counters"] = {
+                "frames_in": call_metrics.frames_in, "bytes_in": call_metrics.bytes_in,
+                "frames_out": call_metrics.frames_out, "bytes_out": call_metrics.bytes_out,
+                "deepgram_bytes_in": call_metrics.dg_bytes_in, "deepgram_bytes_out": call_metrics.dg_bytes_out,
+            }
+        status["queues"] = {
+            "inbound_lane": self.inbound_lane.pending if self.inbound_lane else 0,
+            "outbound_lane": self.outbound_lane.pending if self.outbound_lane else 0,
+            "playback_frames": playback.queued_frames if playback else 0,
+            "pending_marks": len(playback.pending_marks) if playback else 0,
+        }
+        status["buffered_audio_bytes"] = status["queues"]["playback_frames"] * FRAME_BYTES
+        if self.recording is not None:
+            status["recording"] = self.recording.stats()
+        return status
+
+
+class CallRegistry:
+    """Live calls of this process, with admission control and drain mode."""
+
+    def __init__(self, capacity: int = CALL_CAPACITY):
+        self.capacity = capacity
+        self.draining = False
+        self.rejected = 0
+        self.on_release = None     # optional callable, run whenever a call slot frees up
+        self._sessions = {}        # call sid -> CallSession
+        self._pending = {}         # call sid -> monotonic time the outbound call was placed
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._previous_sigterm = None
+        self._sigterm_received = False
+        self._sigterm_task: asyncio.Task = None
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def get(self, call_sid: str) -> CallSession:
+        return self._sessions.get(call_sid)
+
+    def sessions(self) -> list:
+        return list(self._sessions.values())
+
+    def _expire_pending(self):
+        cutoff = time.monotonic() - CALL_PENDING_TTL_S
+        expired = [sid for sid, placed_at in self._pending.items() if placed_at < cutoff]
+        for call_sid in expired:
+            del self._pending[call_sid]
+        if expired and not self._sessions and not self._pending:
+            self._idle.set()
+
+    @property
+    def in_use(self) -> int:
+        self._expire_pending()
+        return len(self._sessions) + len(self._pending)
+
+    def available(self) -> int:
+        """Free call slots, counting calls that are still being dialled. Zero while draining."""
+        if self.draining:
+            return 0
+        return max(0, self.capacity - self.in_use)
+
+    def reserve(self, call_sid: str) -> bool:
+        """Holds a slot for an outbound call that is about to be dialled."""
+        if self.available() <= 0:
+            self.rejected += 1
+            return False
+        self._pending[call_sid] = time.monotonic()
+        self._idle.clear()
+        return True
+
+    def rebind(self, old_call_sid: str, new_call_sid: str):
+        placed_at = self._pending.pop(old_call_sid, None)
+        if placed_at is not None:
+            self._pending[new_call_sid] = placed_at
+
+    def release(self, call_sid: str):
+        if self._pending.pop(call_sid, None) is not None:
+            self._released()
+
+    def admit(self, call_sid: str, tenant_id: str = None) -> CallSession:
+        """Registers a media stream. Dialled calls always get in; unexpected ones need a free slot."""
+        if self._pending.pop(call_sid, None) is None and self.available() <= 0:
+            self.rejected += 1
+            return None
+        session = self._sessions[call_sid] = CallSession(call_sid, tenant_id)
+        self._idle.clear()
+        return session
+
+    def remove(self, call_sid: str):
+        if self._sessions.pop(call_sid, None) is not None:
+            self._released()
+
+    def _released(self):
+        if not self._sessions and not self._pending:
+            self._idle.set()
+        if self.on_release is not None:
+            self.on_release()
+
+    def start_drain(self):
+        if not self.draining:
+            self.draining = True
+            logging.info(f"Drain mode on: refusing new calls, {len(self._sessions)} active, {len(self._pending)} dialling.")
+
+    def stop_drain(self):
+        if self.draining:
+            self.draining = False
+            logging.info("Drain mode off: accepting new calls.")
+
+    async def wait_idle(self, timeout: float = None) -> bool:
+        """Waits until no calls are active or dialling. Returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            self._expire_pending()
+            if not self._sessions and not self._pending:
+                return True
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return False
+            try:
+                # Wake up periodically so dialled calls that never connect can expire.
+                await asyncio.wait_for(self._idle.wait(), timeout=5.0 if remaining is None else min(remaining, 5.0))
+            except asyncio.TimeoutError:
+                pass
+
+    def summary(self) -> dict:
+        return {
+            "active_calls": len(self._sessions), "dialling_calls": len(self._pending), "capacity": self.capacity,
+            "available": self.available(), "draining": self.draining, "rejected_calls": self.rejected,
+        }
+
+    def install_sigterm_drain(self):
+        """Makes SIGTERM drain live calls before the server's own shutdown runs (main thread only)."""
+        if CALL_DRAIN_TIMEOUT_S <= 0 or threading.current_thread() is not threading.main_thread():
+            return
+        loop = asyncio.get_running_loop()
+        self._previous_sigterm = signal.getsignal(signal.SIGTERM)
+
+        def handle_sigterm(sig, frame):
+            if self._sigterm_received:   # second SIGTERM: stop waiting
+                self._forward_sigterm(sig, frame)
+                return
+            self._sigterm_received = True
+            loop.call_soon_threadsafe(self._begin_sigterm_drain, sig)
+
+        signal.signal(signal.SIGTERM, handle_sigterm)
+
+    def uninstall_sigterm_drain(self):
+        if self._previous_sigterm is not None:
+            signal.signal(signal.SIGTERM, self._previous_sigterm)
+            self._previous_sigterm = None
+
+    def _begin_sigterm_drain(self, sig):
+        self.start_drain()
+        self._sigterm_task = asyncio.create_task(self._drain_then_exit(sig))
+
+    async def _drain_then_exit(self, sig):
+        drained = await self.wait_idle(CALL_DRAIN_TIMEOUT_S)
+        if not drained:
+            logging.warning(f"Drain timed out after {CALL_DRAIN_TIMEOUT_S}s with {len(self._sessions)} calls still active.")
+        else:
+            logging.info("All calls finished, shutting down.")
+        self._forward_sigterm(sig, None)
+
+    def _forward_sigterm(self, sig, frame):
+        previous = self._previous_sigterm
+        if callable(previous):
+            previous(sig, frame)
+        else:
+            self.uninstall_sigterm_drain()
+            signal.raise_signal(sig)
+
+
+call_registry = CallRegistry()
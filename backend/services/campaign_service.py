@@ -0,0 +1,384 @@
+import asyncio
+import csv
+import heapq
+import io
+import json
+import logging
+import os
+import random
+import time
+import uuid
+from collections import deque
+
+# Bulk outbound campaigns. A campaign is a list of contacts dialled by an async
+# scheduler, subject to:
+# - a per-campaign and an account-wide calls-per-second token bucket
+# - a cap on live calls (per campaign and process-wide)
+# - retries with exponential backoff
+# Calls are placed through the dialer coroutine the app registers, which
+# keeps Twilio's blocking REST client off the event loop. Each campaign dials on
+# behalf of one tenant.
+# A campaign lives in the worker that created it, but a call's status callback
+# or media stream may reach any worker. Those workers report the outcome to the
+# shared store, and the owning worker polls it for the calls it is waiting on.
+
+CAMPAIGN_MAX_LIVE_CALLS = int(os.getenv("CAMPAIGN_MAX_LIVE_CALLS", "50"))
+TWILIO_MAX_CPS = float(os.getenv("TWILIO_MAX_CPS", "1"))
+CAMPAIGN_DEFAULT_CPS = float(os.getenv("CAMPAIGN_DEFAULT_CPS", "1"))
+CAMPAIGN_MAX_ATTEMPTS = int(os.getenv("CAMPAIGN_MAX_ATTEMPTS", "3"))
+CAMPAIGN_RETRY_BASE_S = float(os.getenv("CAMPAIGN_RETRY_BASE_S", "60"))
+CAMPAIGN_RETRY_MAX_S = float(os.getenv("CAMPAIGN_RETRY_MAX_S", "3600"))
+CAMPAIGN_CALL_TIMEOUT_S = float(os.getenv("CAMPAIGN_CALL_TIMEOUT_S", "1800"))
+CAMPAIGN_OUTCOME_POLL_S = float(os.getenv("CAMPAIGN_OUTCOME_POLL_S", "2"))
+
+RETRY_CALL_STATUSES = {"busy", "no-answer", "failed"}
+TERMINAL_CALL_STATUSES = {"completed", "busy", "no-answer", "failed", "canceled"}
+PHONE_COLUMNS = ("phone_number", "phone", "number", "to")
+NAME_COLUMNS = ("user_name", "name", "full_name")
+
+
+class CampaignError(ValueError):
+    pass
+
+
+def parse_contacts(text: str, fmt: str) -> list:
+    """Parses CSV (with a header row) or JSONL into [{"phone_number", "user_name"}]."""
+    if fmt == "csv":
+        rows = csv.DictReader(io.StringIO(text))
+    elif fmt == "jsonl":
+        rows = []
+        for line_no, line in enumerate(text.splitlines(), start=1):
+            if not line.strip():
+                continue
+            try:
+                rows.append(json.loads(line))
+            except json.JSONDecodeError as e:
+                raise CampaignError(f"Line {line_no} is not valid JSON: {e}")
+    else:
+        raise CampaignError(f"Unsupported contacts format '{fmt}', expected 'csv' or 'jsonl'.")
+
+    contacts = []
+    for row in rows:
+        row = {str(key).strip().lower(): value for key, value in row.items() if key is not None}
+        phone_number = next((str(row[column]).strip() for column in PHONE_COLUMNS if row.get(column)), None)
+        if not phone_number:
+            continue
+        user_name = next((str(row[column]).strip() for column in NAME_COLUMNS if row.get(column)), "") or "there"
+        contacts.append({"phone_number": phone_number, "user_name": user_name})
+    if not contacts:
+        raise CampaignError(f"No contacts with a phone number column ({', '.join(PHONE_COLUMNS)}) found.")
+    return contacts
+
+
+class TokenBucket:
+    """Async token bucket: `rate` tokens per second, up to `burst` banked."""
+
+    def __init__(self, rate: float, burst: float = 1.0):
+        self.rate = max(rate, 0.001)
+        self.burst = max(burst, 1.0)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class Contact:
+    __slots__ = ("index", "phone_number", "user_name", "status", "attempts", "call_sid", "last_error", "placed_at")
+
+    def __init__(self, index: int, phone_number: str, user_name: str):
+        self.index = index
+        self.phone_number = phone_number
+        self.user_name = user_name
+        self.status = "pending"   # pending | dialing | in_progress | retry_wait | completed | failed | cancelled
+        self.attempts = 0
+        self.call_sid = None
+        self.last_error = None
+        self.placed_at = None
+
+    def to_dict(self) -> dict:
+        return {
+            "phone_number": self.phone_number, "user_name": self.user_name, "status": self.status,
+            "attempts": self.attempts, "call_sid": self.call_sid, "last_error": self.last_error,
+        }
+
+
+class Campaign:
+    def __init__(self, manager, name: str, contacts: list, calls_per_second: float, max_live_calls: int, max_attempts: int, tenant_id: str):
+        self.manager = manager
+        self.campaign_id = uuid.uuid4().hex[:12]
+        self.name = name
+        self.tenant_id = tenant_id
+        self.contacts = [Contact(index, c["phone_number"], c["user_name"]) for index, c in enumerate(contacts)]
+        self.max_live_calls = max(1, max_live_calls)
+        self.max_attempts = max(1, max_attempts)
+        self.bucket = TokenBucket(min(calls_per_second, TWILIO_MAX_CPS))
+        self.state = "created"    # created | running | paused | completed | cancelled
+        self.created_at = time.time()
+        self.live_calls = 0
+        self._pending = deque(range(len(self.contacts)))
+        self._retries = []        # heap of (due monotonic time, contact index)
+        self._resumed = asyncio.Event()
+        self._task: asyncio.Task = None
+
+    def start(self):
+        if self._task is None:
+            self.state = "running"
+            self._resumed.set()
+            self._task = asyncio.create_task(self._run(), name=f"campaign-{self.campaign_id}")
+
+    def pause(self):
+        if self.state == "running":
+            self.state = "paused"
+            self._resumed.clear()
+
+    def resume(self):
+        if self.state == "paused":
+            self.state = "running"
+            self._resumed.set()
+
+    def cancel(self):
+        if self.state in ("completed", "cancelled"):
+            return
+        self.state = "cancelled"
+        for index in list(self._pending) + [index for _, index in self._retries]:
+            self.contacts[index].status = "cancelled"
+        self._pending.clear()
+        self._retries.clear()
+        self._resumed.set()
+        if self._task is not None:
+            self._task.cancel()
+
+    def _next_contact(self):
+        """Returns the next contact index to dial, or the seconds until a retry is due (None if nothing is left)."""
+        if self._retries and self._retries[0][0] <= time.monotonic():
+            return heapq.heappop(self._retries)[1], 0
+        if self._pending:
+            return self._pending.popleft(), 0
+        if self._retries:
+            return None, self._retries[0][0] - time.monotonic()
+        return None, None
+
+    async def _run(self):
+        manager = self.manager
+        try:
+            while True:
+                await self._resumed.wait()
+                if self.state == "cancelled":
+                    return
+                index, wait_s = self._next_contact()
+                if index is None:
+                    if wait_s is None and self.live_calls == 0:
+                        break
+                    await manager.wait_for_change(wait_s if wait_s is not None else None)
+                    continue
+                await manager.acquire_slot(self)
+                try:
+                    await self.bucket.acquire()
+                    await manager.account_bucket.acquire()
+                except asyncio.CancelledError:
+                    # cancel() only sees contacts still queued; this one was already taken.
+                    manager.release_slot(self)
+                    self.contacts[index].status = "cancelled"
+                    raise
+                if self.state != "running":
+                    manager.release_slot(self)
+                    self._pending.appendleft(index)
+                    continue
+                asyncio.create_task(self._place(self.contacts[index]))
+            self.state = "completed"
+            logging.info(f"Campaign {self.campaign_id} ({self.name}) completed: {self.counts()}")
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logging.error(f"Campaign {self.campaign_id} scheduler stopped: {e}", exc_info=True)
+            self.state = "paused"
+
+    async def _place(self, contact: Contact):
+        contact.status = "dialing"
+        contact.placed_at = time.monotonic()
+        try:
+            result = await self.manager.dialer(contact.phone_number, contact.user_name, self.tenant_id)
+        except Exception as e:
+            result = {"error": f"{type(e).__name__}: {e}"}
+        if result.get("refused"):
+            # The process filled up between acquire_slot() and dialling: nothing was dialled, so no attempt is spent.
+            self.manager.release_slot(self)
+            if self.state == "cancelled":
+                contact.status = "cancelled"
+            else:
+                contact.status = "pending"
+                self._pending.appendleft(contact.index)
+            return
+        contact.attempts += 1
+        if result.get("success"):
+            contact.status = "in_progress"
+            contact.call_sid = result["call_sid"]
+            self.manager.track_call(contact.call_sid, self, contact)
+            return
+        self.manager.release_slot(self)
+        self.finish_contact(contact, "failed", result.get("error"))
+
+    def finish_contact(self, contact: Contact, call_status: str, error: str = None):
+        """Records a terminal outcome, scheduling a retry when the status is retryable."""
+        contact.last_error = error or (None if call_status == "completed" else call_status)
+        if call_status in RETRY_CALL_STATUSES and contact.attempts < self.max_attempts and self.state != "cancelled":
+            delay = min(CAMPAIGN_RETRY_MAX_S, CAMPAIGN_RETRY_BASE_S * 2 ** (contact.attempts - 1))
+            delay *= random.uniform(0.8, 1.2)
+            contact.status = "retry_wait"
+            heapq.heappush(self._retries, (time.monotonic() + delay, contact.index))
+        else:
+            contact.status = "completed" if call_status == "completed" else "failed"
+        self.manager.notify()
+
+    def counts(self) -> dict:
+        counts = {}
+        for contact in self.contacts:
+            counts[contact.status] = counts.get(contact.status, 0) + 1
+        return counts
+
+    def summary(self) -> dict:
+        return {
+            "campaign_id": self.campaign_id, "name": self.name, "tenant_id": self.tenant_id, "state": self.state,
+            "total_contacts": len(self.contacts), "live_calls": self.live_calls,
+            "max_live_calls": self.max_live_calls, "calls_per_second": self.bucket.rate,
+            "max_attempts": self.max_attempts, "counts": self.counts(), "created_at": self.created_at,
+        }
+
+
+class CampaignManager:
+    """Owns all campaigns of this process and the shared live-call budget."""
+
+    def __init__(self, max_live_calls: int = CAMPAIGN_MAX_LIVE_CALLS):
+        self.max_live_calls = max_live_calls
+        self.capacity_fn = None   # optional () -> int, free call slots in this process (e.g. the call registry)
+        self.dialer = None        # async (phone_number, user_name, tenant_id) -> make_call result dict
+        self.outcome_store = None # optional store shared by all workers (tenant_store), see track_call()
+        self.release_call = None  # optional (call_sid) -> None, frees the call's slot in this process
+        self.account_bucket = TokenBucket(TWILIO_MAX_CPS)
+        self.campaigns = {}
+        self.live_calls = 0
+        self._calls = {}          # call_sid -> (campaign, contact)
+        self._changed = asyncio.Condition()
+        self._reaper: asyncio.Task = None
+
+    def configure(self, dialer, capacity_fn=None, outcome_store=None, release_call=None):
+        self.dialer = dialer
+        self.capacity_fn = capacity_fn
+        self.outcome_store = outcome_store
+        self.release_call = release_call
+
+    def start(self):
+        if self._reaper is None:
+            self._reaper = asyncio.create_task(self._reap_stuck_calls(), name="campaign-reaper")
+
+    async def stop(self):
+        for campaign in self.campaigns.values():
+            if campaign.state in ("running", "paused"):
+                campaign.pause()
+        if self._reaper is not None:
+            self._reaper.cancel()
+            self._reaper = None
+
+    def create(self, name: str, contacts: list, calls_per_second: float = CAMPAIGN_DEFAULT_CPS,
+               max_live_calls: int = None, max_attempts: int = CAMPAIGN_MAX_ATTEMPTS, tenant_id: str = "default") -> Campaign:
+        if self.dialer is None:
+            raise CampaignError("Campaign dialer is not configured.")
+        campaign = Campaign(self, name, contacts, calls_per_second, max_live_calls or self.max_live_calls, max_attempts, tenant_id)
+        self.campaigns[campaign.campaign_id] = campaign
+        return campaign
+
+    def get(self, campaign_id: str) -> Campaign:
+        return self.campaigns.get(campaign_id)
+
+    def _available(self, campaign: Campaign) -> bool:
+        if self.capacity_fn is not None and self.capacity_fn() <= 0:
+            return False
+        return self.live_calls < self.max_live_calls and campaign.live_calls < campaign.max_live_calls
+
+    async def acquire_slot(self, campaign: Campaign):
+        async with self._changed:
+            await self._changed.wait_for(lambda: self._available(campaign))
+            self.live_calls += 1
+            campaign.live_calls += 1
+
+    def release_slot(self, campaign: Campaign):
+        self.live_calls = max(0, self.live_calls - 1)
+        campaign.live_calls = max(0, campaign.live_calls - 1)
+        self.notify()
+
+    def notify(self):
+        asyncio.create_task(self._notify())
+
+    async def _notify(self):
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def wait_for_change(self, timeout: float = None):
+        async with self._changed:
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def track_call(self, call_sid: str, campaign: Campaign, contact: Contact):
+        self._calls[call_sid] = (campaign, contact)
+        if self.outcome_store is not None:
+            self.outcome_store.track_campaign_call(call_sid)
+
+    def on_call_finished(self, call_sid: str, call_status: str = "completed") -> bool:
+        """Frees the live-call slot of a campaign call. Returns False if the call is not a (live) campaign call here.
+
+        Outcomes of calls owned by another worker are reported to the shared store for it to pick up.
+        """
+        entry = self._calls.pop(call_sid, None)
+        if entry is None:
+            if self.outcome_store is not None:
+                self.outcome_store.report_campaign_outcome(call_sid, call_status)
+            return False
+        if self.outcome_store is not None:
+            self.outcome_store.forget_campaign_call(call_sid)
+        campaign, contact = entry
+        self.release_slot(campaign)
+        campaign.finish_contact(contact, call_status)
+        return True
+
+    def _collect_outcomes(self):
+        """Finishes this worker's calls whose outcome another worker reported."""
+        if self.outcome_store is None or not self._calls:
+            return
+        for call_sid, call_status in self.outcome_store.take_campaign_outcomes(self._calls).items():
+            logging.info(f"[{call_sid}] Campaign call outcome from another worker: {call_status}")
+            if self.release_call is not None:
+                self.release_call(call_sid)
+            self.on_call_finished(call_sid, call_status)
+
+    async def _reap_stuck_calls(self):
+        """Picks up outcomes reported by other workers, and frees slots of calls whose final status never arrived."""
+        reaped_at = time.monotonic()
+        while True:
+            await asyncio.sleep(CAMPAIGN_OUTCOME_POLL_S)
+            try:
+                self._collect_outcomes()
+            except Exception as e:
+                logging.warning(f"Could not read campaign call outcomes: {e!r}")
+            now = time.monotonic()
+            if now - reaped_at < 60:
+                continue
+            reaped_at = now
+            for call_sid, (_, contact) in list(self._calls.items()):
+                if contact.placed_at is not None and now - contact.placed_at > CAMPAIGN_CALL_TIMEOUT_S:
+                    logging.warning(f"[{call_sid}] No final status after {CAMPAIGN_CALL_TIMEOUT_S}s, releasing campaign slot.")
+                    self.on_call_finished(call_sid, "completed")
+
+
+campaign_manager = CampaignManager()
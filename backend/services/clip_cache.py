@@ -0,0 +1,256 @@
+import argparse
+import asyncio
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+from collections import OrderedDict
+
+import numpy as np
+
+from services.deepgram_pool import AGENT_VOICE, DEEPGRAM_API_KEY
+from services.lazy_imports import lazy_import
+from services.mulaw_codec import MULAW_SILENCE, pcm16_array_to_ulaw
+from services.playback import FRAME_BYTES, FRAME_SECONDS
+from services.resampler import StreamingResampler
+from services.tenant_store import DEFAULT_TENANT_ID
+from services.transcoding import TWILIO_SAMPLE_RATE
+
+# Pre-rendered greeting and filler clips, played from Twilio's `start` event until
+# live agent audio arrives. Clips are stored as ready-to-send 20 ms mu-law frames
+# and keyed by tenant, text and voice. Recently used clips are kept in memory,
+# bounded by CLIP_CACHE_MAX_BYTES with LRU eviction. Every clip is also spilled to
+# CLIP_DIR, so evicted clips, clips added by other workers and clips from
+# earlier runs load from disk instead of being rendered again. Clips are rendered
+# offline with Deepgram TTS (`python -m services.clip_cache`) or supplied as audio
+# files. Calls never do network work for them.
+
+CLIP_DIR = os.getenv("CLIP_DIR", "clips")
+CLIP_CACHE_MAX_BYTES = int(os.getenv("CLIP_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+CLIP_MAX_SECONDS = float(os.getenv("CLIP_MAX_SECONDS", "15"))
+CONNECT_CLIP_TEXT = os.getenv("CONNECT_CLIP_TEXT", "Hi, this is Emma. One moment please.")
+DEEPGRAM_SPEAK_URL = os.getenv("DEEPGRAM_SPEAK_URL", "https://api.deepgram.com/v1/speak")
+
+aiohttp = lazy_import("aiohttp")
+_WHITESPACE = re.compile(r"\s+")
+
+
+class ClipError(ValueError):
+    pass
+
+
+def normalize_text(text: str) -> str:
+    return _WHITESPACE.sub(" ", text or "").strip()
+
+
+def clip_key(tenant_id: str, text: str, voice: str) -> str:
+    """Stable id of a clip, also used as its file name."""
+    raw = f"{tenant_id}\n{voice}\n{normalize_text(text)}".encode("utf-8")
+    return hashlib.sha1(raw).hexdigest()[:24]
+
+
+def split_frames(mulaw: bytes) -> tuple:
+    """Splits mu-law audio into 20 ms frames, padding the last one with silence."""
+    if len(mulaw) % FRAME_BYTES:
+        mulaw += bytes([MULAW_SILENCE]) * (FRAME_BYTES - len(mulaw) % FRAME_BYTES)
+    return tuple(mulaw[offset:offset + FRAME_BYTES] for offset in range(0, len(mulaw), FRAME_BYTES))
+
+
+def encode_audio_file(audio_file: bytes) -> bytes:
+    """Converts any soundfile-readable audio (WAV, FLAC, OGG...) to 8 kHz mono mu-law."""
+    import soundfile  # only needed when clips are supplied as files
+
+    try:
+        samples, sample_rate = soundfile.read(io.BytesIO(audio_file), dtype="int16", always_2d=True)
+    except Exception as e:
+        raise ClipError(f"Unreadable audio file: {e}") from e
+    mono = samples.mean(axis=1).astype(np.int16) if samples.shape[1] > 1 else samples[:, 0]
+    if sample_rate != TWILIO_SAMPLE_RATE:
+        resampler = StreamingResampler(sample_rate, TWILIO_SAMPLE_RATE)
+        # Trailing zeros flush the filter delay so the end of the clip is not cut off.
+        padded = np.concatenate([mono, np.zeros(sample_rate // 100, dtype=np.int16)])
+        mono = resampler.process_array(padded).copy()
+    return pcm16_array_to_ulaw(np.ascontiguousarray(mono)).tobytes()
+
+
+async def render_clip(text: str, voice: str = AGENT_VOICE) -> bytes:
+    """Renders text to 8 kHz mu-law with Deepgram TTS. For offline/admin use, never on a call."""
+    if not DEEPGRAM_API_KEY:
+        raise ClipError("DEEPGRAM_API_KEY is not set; supply the clip as an audio file instead.")
+    params = {"model": voice, "encoding": "mulaw", "sample_rate": str(TWILIO_SAMPLE_RATE), "container": "none"}
+    headers = {"Authorization": f"Token {DEEPGRAM_API_KEY}"}
+    try:
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30)) as session:
+            async with session.post(DEEPGRAM_SPEAK_URL, params=params, headers=headers, json={"text": normalize_text(text)}) as resp:
+                if resp.status != 200:
+                    raise ClipError(f"Deepgram TTS returned {resp.status}: {(await resp.text())[:200]}")
+                return await resp.read()
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        raise ClipError(f"Could not reach Deepgram TTS: {e}") from e
+
+
+class ClipCache:
+    """Memory LRU of clip frames over a directory of spilled clips."""
+
+    def __init__(self, directory: str = CLIP_DIR, max_bytes: int = CLIP_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._memory = OrderedDict()   # clip key -> tuple of frames
+        self._memory_bytes = 0
+        self._index = {}               # clip key -> metadata of every clip on disk
+        self.hits = 0
+        self.disk_loads = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def open(self):
+        """Indexes the clips already spilled to disk. Blocking; run it off the event loop."""
+        os.makedirs(self.directory, exist_ok=True)
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.directory, name), encoding="utf-8") as meta_file:
+                    meta = json.load(meta_file)
+                self._index[meta["key"]] = meta
+            except (OSError, ValueError, KeyError) as e:
+                logging.warning(f"Skipping unreadable clip metadata {name}: {e}")
+        if self._index:
+            logging.info(f"Clip cache: {len(self._index)} clips on disk in {os.path.abspath(self.directory)}.")
+
+    def _path(self, key: str, suffix: str) -> str:
+        return os.path.join(self.directory, f"{key}{suffix}")
+
+    def _prepare(self, tenant_id: str, text: str, voice: str, mulaw: bytes):
+        text = normalize_text(text)
+        if not text:
+            raise ClipError("Clip text must not be empty.")
+        if not mulaw:
+            raise ClipError("Clip audio is empty.")
+        if len(mulaw) > int(CLIP_MAX_SECONDS / FRAME_SECONDS) * FRAME_BYTES:
+            raise ClipError(f"Clip is longer than CLIP_MAX_SECONDS ({CLIP_MAX_SECONDS}s).")
+        key = clip_key(tenant_id, text, voice)
+        frames = split_frames(mulaw)
+        meta = {"key": key, "tenant_id": tenant_id, "text": text, "voice": voice,
+                "frames": len(frames), "duration_s": round(len(frames) * FRAME_SECONDS, 2)}
+        return key, frames, meta
+
+    def _spill(self, key: str, frames: tuple, meta: dict):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self._path(key, ".ulaw.tmp"), "wb") as audio_file:
+            audio_file.write(b"".join(frames))
+        os.replace(self._path(key, ".ulaw.tmp"), self._path(key, ".ulaw"))
+        with open(self._path(key, ".json"), "w", encoding="utf-8") as meta_file:
+            json.dump(meta, meta_file)
+
+    def _store(self, key: str, frames: tuple, meta: dict):
+        self._index[key] = meta
+        self._remember(key, frames)
+
+    def put(self, tenant_id: str, text: str, voice: str, mulaw: bytes) -> dict:
+        """Stores a clip (8 kHz mu-law) on disk and in memory. Blocking, for offline use."""
+        key, frames, meta = self._prepare(tenant_id, text, voice, mulaw)
+        self._spill(key, frames, meta)
+        self._store(key, frames, meta)
+        return meta
+
+    async def add(self, tenant_id: str, text: str, voice: str, mulaw: bytes) -> dict:
+        """Stores a clip like put(), writing it to disk off the event loop."""
+        key, frames, meta = self._prepare(tenant_id, text, voice, mulaw)
+        await asyncio.to_thread(self._spill, key, frames, meta)
+        self._store(key, frames, meta)
+        return meta
+
+    async def get(self, tenant_id: str, text: str, voice: str = AGENT_VOICE) -> tuple:
+        """Frames of a clip, from memory or (off the event loop) from disk. None if there is no such clip."""
+        key = clip_key(tenant_id, text, voice)
+        frames = self._memory.get(key)
+        if frames is not None:
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return frames
+        try:
+            mulaw = await asyncio.to_thread(self._read, key)
+        except OSError:
+            mulaw = None
+        if mulaw is None:
+            self._index.pop(key, None)
+            self.misses += 1
+            return None
+        frames = self._memory.get(key)
+        if frames is not None:
+            # Another call loaded the same clip while this one was reading it.
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return frames
+        self.disk_loads += 1
+        frames = split_frames(mulaw)
+        self._remember(key, frames)
+        return frames
+
+    def _read(self, key: str) -> bytes:
+        """The clip's audio from disk, or None if there is no such file. Blocking."""
+        path = self._path(key, ".ulaw")
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as audio_file:
+            return audio_file.read()
+
+    async def connect_clip(self, tenant_id: str, voice: str = AGENT_VOICE) -> tuple:
+        """The clip played when a call's stream starts: the tenant's own, else the default tenant's."""
+        if not CONNECT_CLIP_TEXT:
+            return None
+        frames = await self.get(tenant_id, CONNECT_CLIP_TEXT, voice)
+        if frames is None and tenant_id != DEFAULT_TENANT_ID:
+            frames = await self.get(DEFAULT_TENANT_ID, CONNECT_CLIP_TEXT, voice)
+        return frames
+
+    def _remember(self, key: str, frames: tuple):
+        self._forget(key)
+        size = len(frames) * FRAME_BYTES
+        if size > self.max_bytes:
+            return
+        self._memory[key] = frames
+        self._memory_bytes += size
+        while self._memory_bytes > self.max_bytes and self._memory:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted) * FRAME_BYTES
+            self.evictions += 1
+
+    def _forget(self, key: str):
+        frames = self._memory.pop(key, None)
+        if frames is not None:
+            self._memory_bytes -= len(frames) * FRAME_BYTES
+
+    def clips(self, tenant_id: str) -> list:
+        return [meta for meta in self._index.values() if meta.get("tenant_id") == tenant_id]
+
+    def stats(self) -> dict:
+        return {
+            "clips_on_disk": len(self._index), "clips_in_memory": len(self._memory), "memory_bytes": self._memory_bytes,
+            "hits": self.hits, "disk_loads": self.disk_loads, "misses": self.misses, "evictions": self.evictions,
+        }
+
+
+clip_cache = ClipCache()
+
+
+async def _main():
+    parser = argparse.ArgumentParser(description="Render or import a pre-recorded call clip into CLIP_DIR.")
+    parser.add_argument("--text", default=CONNECT_CLIP_TEXT, help="clip text (defaults to CONNECT_CLIP_TEXT)")
+    parser.add_argument("--tenant", default=DEFAULT_TENANT_ID)
+    parser.add_argument("--voice", default=AGENT_VOICE)
+    parser.add_argument("--file", help="audio file to import instead of rendering with Deepgram TTS")
+    args = parser.parse_args()
+    if args.file:
+        with open(args.file, "rb") as audio_file:
+            mulaw = encode_audio_file(audio_file.read())
+    else:
+        mulaw = await render_clip(args.text, args.voice)
+    print(json.dumps(clip_cache.put(args.tenant, args.text, args.voice, mulaw)))
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
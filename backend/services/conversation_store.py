@@ -0,0 +1,159 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+from collections import OrderedDict
+
+# Per-call conversation events (transcripts, agent turns, latencies, call start/end).
+# The media loop only appends the already-parsed event dict to a bounded queue
+# and to an in-memory LRU of recent calls. A background writer drains the queue
+# in batches and appends them, serialized off the event loop, to one JSONL file
+# per call. History requests are served from the LRU, falling back to the file
+# (for calls handled by another worker, or evicted from the LRU).
+
+CONVERSATION_DIR = os.getenv("CONVERSATION_DIR", "conversations")
+CONVERSATION_QUEUE_SIZE = int(os.getenv("CONVERSATION_QUEUE_SIZE", "10000"))
+CONVERSATION_BATCH_SIZE = int(os.getenv("CONVERSATION_BATCH_SIZE", "500"))
+CONVERSATION_FLUSH_INTERVAL_S = float(os.getenv("CONVERSATION_FLUSH_INTERVAL_S", "0.5"))
+CONVERSATION_CACHE_CALLS = int(os.getenv("CONVERSATION_CACHE_CALLS", "256"))
+CONVERSATION_MAX_EVENTS_PER_CALL = int(os.getenv("CONVERSATION_MAX_EVENTS_PER_CALL", "5000"))
+
+CALL_ENDED = "CallEnded"
+SAFE_CALL_SID = re.compile(r"^[A-Za-z0-9_-]{1,64}$")   # call sids that are safe to use as file names
+_STOP = object()
+
+
+def _write_batch(directory: str, batch: dict):
+    """Appends each call's events to its JSONL file. Runs on a worker thread."""
+    for call_sid, events in batch.items():
+        with open(os.path.join(directory, f"{call_sid}.jsonl"), "a", encoding="utf-8") as history_file:
+            history_file.write("".join(json.dumps(event, separators=(",", ":")) + "\n" for event in events))
+
+
+def _read_events(directory: str, call_sid: str) -> list:
+    path = os.path.join(directory, f"{call_sid}.jsonl")
+    events = []
+    try:
+        with open(path, encoding="utf-8") as history_file:
+            for line in history_file:
+                try:
+                    events.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue  # a line cut short by a crash mid-write
+    except FileNotFoundError:
+        return None
+    return events
+
+
+def format_history(events: list) -> str:
+    """Readable transcript: one line per utterance, with the offset from the first event."""
+    if not events:
+        return ""
+    started = events[0].get("ts", 0)
+    lines = []
+    for event in events:
+        event_type = event.get("type")
+        offset = max(0, int(event.get("ts", started) - started))
+        stamp = f"[{offset // 60:02d}:{offset % 60:02d}]"
+        if event_type == "ConversationText":
+            speaker = "User" if event.get("role") == "user" else "Agent"
+            lines.append(f"{stamp} {speaker}: {event.get('content', '')}")
+        elif event_type == "UserStartedSpeaking" and event.get("interrupted_agent"):
+            lines.append(f"{stamp} (user interrupted the agent)")
+        elif event_type == "CallStarted":
+            lines.append(f"{stamp} Call started ({event.get('company_name') or 'unknown company'})")
+        elif event_type == CALL_ENDED:
+            lines.append(f"{stamp} Call ended after {event.get('duration_s', 0):.0f}s")
+        elif event_type == "Error":
+            lines.append(f"{stamp} Agent error: {event.get('message') or event.get('description', '')}")
+    return "\n".join(lines)
+
+
+class ConversationStore:
+    """Bounded event queue, batched JSONL writer and LRU of recent call histories."""
+
+    def __init__(self, directory: str = CONVERSATION_DIR):
+        self.directory = directory
+        self.dropped_events = 0
+        self._queue = asyncio.Queue(maxsize=CONVERSATION_QUEUE_SIZE)
+        self._recent = OrderedDict()   # call sid -> list of events (complete from the call's start)
+        self._writer: asyncio.Task = None
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.create_task(self._write_loop(), name="conversation-writer")
+
+    async def stop(self):
+        """Flushes everything queued so far and stops the writer."""
+        if self._writer is None:
+            return
+        await self._queue.put(_STOP)
+        try:
+            await self._writer
+        except asyncio.CancelledError:
+            pass
+        self._writer = None
+
+    def record(self, call_sid: str, event: dict):
+        """Stores a conversation event for `call_sid` without blocking or formatting it."""
+        event["ts"] = time.time()
+        events = self._recent.get(call_sid)
+        if events is None:
+            events = self._recent[call_sid] = []
+            while len(self._recent) > CONVERSATION_CACHE_CALLS:
+                self._recent.popitem(last=False)
+        else:
+            self._recent.move_to_end(call_sid)
+        if len(events) < CONVERSATION_MAX_EVENTS_PER_CALL:
+            events.append(event)
+        if not SAFE_CALL_SID.match(call_sid):
+            return  # never turn an unexpected call id into a file name
+        try:
+            self._queue.put_nowait((call_sid, event))
+        except asyncio.QueueFull:
+            self.dropped_events += 1
+            if self.dropped_events % 1000 == 1:
+                logging.warning(f"Conversation event queue full; {self.dropped_events} events not persisted so far.")
+
+    async def _write_loop(self):
+        stopping = False
+        while not stopping:
+            items = [await self._queue.get()]
+            if items[0] is not _STOP:
+                await asyncio.sleep(CONVERSATION_FLUSH_INTERVAL_S)  # let a batch build up
+            while len(items) < CONVERSATION_BATCH_SIZE and not self._queue.empty():
+                items.append(self._queue.get_nowait())
+            batch = {}
+            for item in items:
+                if item is _STOP:
+                    stopping = True
+                    continue
+                call_sid, event = item
+                batch.setdefault(call_sid, []).append(event)
+            if batch:
+                try:
+                    await asyncio.to_thread(_write_batch, self.directory, batch)
+                except Exception as e:
+                    logging.error(f"Failed to persist {len(items)} conversation events: {e}", exc_info=True)
+
+    async def history(self, call_sid: str) -> list:
+        """Events of a call: from memory if recent, else from its file. None if the call is unknown."""
+        events = self._recent.get(call_sid)
+        if events is not None:
+            self._recent.move_to_end(call_sid)
+            return list(events)
+        if not SAFE_CALL_SID.match(call_sid):
+            return None
+        events = await asyncio.to_thread(_read_events, self.directory, call_sid)
+        # Only finished calls are cached from disk; a live call may be another worker's and still growing.
+        if events and events[-1].get("type") == CALL_ENDED:
+            self._recent[call_sid] = events
+            while len(self._recent) > CONVERSATION_CACHE_CALLS:
+                self._recent.popitem(last=False)
+        return events
+
+
+conversation_store = ConversationStore()
@@ -0,0 +1,254 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import deque
+
+from services.lazy_imports import lazy_import
+from services.transcoding import INPUT_SAMPLE_RATE, OUTPUT_SAMPLE_RATE
+
+# Shared Deepgram client state: one app-wide aiohttp session (started from the
+# FastAPI lifespan) and a pool of pre-connected, pre-configured agent sockets.
+# /initiate_call reserves a socket while Twilio is still dialling, so the
+# WebSocket handler can claim an agent that is already configured.
+
+aiohttp = lazy_import("aiohttp")
+
+DEEPGRAM_API_KEY = os.getenv("DEEPGRAM_API_KEY")
+DEEPGRAM_AGENT_URL = os.getenv("DEEPGRAM_AGENT_URL", "wss://agent.deepgram.com/agent")
+
+DEEPGRAM_CONNECTION_LIMIT = int(os.getenv("DEEPGRAM_CONNECTION_LIMIT", "500"))
+DEEPGRAM_CONNECT_TIMEOUT_S = float(os.getenv("DEEPGRAM_CONNECT_TIMEOUT_S", "10"))
+AGENT_VOICE = os.getenv("AGENT_VOICE", "aura-asteria-en")
+AGENT_PREWARM_ENABLED = os.getenv("AGENT_PREWARM_ENABLED", "true").lower() == "true"
+AGENT_POOL_IDLE_PER_KEY = int(os.getenv("AGENT_POOL_IDLE_PER_KEY", "0"))
+AGENT_POOL_MAX_IDLE = int(os.getenv("AGENT_POOL_MAX_IDLE", "20"))
+AGENT_POOL_MAX_RESERVATIONS = int(os.getenv("AGENT_POOL_MAX_RESERVATIONS", "200"))
+AGENT_POOL_IDLE_TTL_S = float(os.getenv("AGENT_POOL_IDLE_TTL_S", "60"))
+AGENT_RESERVATION_TTL_S = float(os.getenv("AGENT_RESERVATION_TTL_S", "90"))
+AGENT_KEEPALIVE_INTERVAL_S = float(os.getenv("AGENT_KEEPALIVE_INTERVAL_S", "5"))
+
+KEEPALIVE_MESSAGE = json.dumps({"type": "KeepAlive"})
+
+_session: "aiohttp.ClientSession" = None
+
+
+def build_agent_settings(company_name: str, knowledge_summary: str) -> dict:
+    """Builds the SettingsConfiguration message sent to the Deepgram agent."""
+    agent_instructions = (
+        f"You are an AI voice calling agent named Emma from {company_name or 'our company'}. "
+        f"Your goal is to engage the user, briefly introduce the services based on the following summary, "
+        f"understand their needs, and ultimately try to book a follow-up demo call. "
+        f"Keep responses concise and conversational for a voice call.\n\n"
+        f"Knowledge Summary:\n{knowledge_summary or 'No specific product knowledge provided.'}"
+    )
+    return {
+        "type": "SettingsConfiguration", "audio": {"input": {"encoding": "linear16", "sample_rate": INPUT_SAMPLE_RATE}, "output": {"encoding": "linear16", "sample_rate": OUTPUT_SAMPLE_RATE, "container": "none"}},
+        "agent": {"listen": {"model": "nova-2"}, "think": {"provider": {"type": "open_ai"}, "model": "gpt-4o", "instructions": agent_instructions}, "speak": {"model": AGENT_VOICE}}
+    }
+
+
+def settings_key(company_name: str, settings: dict) -> str:
+    """Pool key for interchangeable agent sockets: same company, same settings."""
+    digest = hashlib.sha1(json.dumps(settings, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+    return f"{company_name or ''}:{digest}"
+
+
+async def start():
+    """Creates the shared aiohttp session and starts pool maintenance."""
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(limit=DEEPGRAM_CONNECTION_LIMIT, ttl_dns_cache=300)
+        _session = aiohttp.ClientSession(connector=connector)
+        logging.info(f"Deepgram client session started (connection limit: {DEEPGRAM_CONNECTION_LIMIT}).")
+    agent_pool.start()
+
+
+async def stop():
+    global _session
+    await agent_pool.close()
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+    logging.info("Deepgram client session closed.")
+
+
+def get_session() -> "aiohttp.ClientSession":
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=DEEPGRAM_CONNECTION_LIMIT, ttl_dns_cache=300))
+    return _session
+
+
+async def connect_agent(settings: dict) -> "aiohttp.ClientWebSocketResponse":
+    """Opens a Deepgram agent socket on the shared session and sends its settings."""
+    deepgram_headers = {"Authorization": f"Token {DEEPGRAM_API_KEY}"}
+    ws = await asyncio.wait_for(
+        get_session().ws_connect(DEEPGRAM_AGENT_URL, headers=deepgram_headers),
+        timeout=DEEPGRAM_CONNECT_TIMEOUT_S,
+    )
+    try:
+        await ws.send_str(json.dumps(settings))
+    except Exception:
+        await ws.close()
+        raise
+    return ws
+
+
+class AgentSessionPool:
+    """Pre-connected agent sockets: idle spares per settings key, plus per-call reservations."""
+
+    def __init__(self):
+        self._idle = {}           # key -> deque of (ws, created_at)
+        self._reservations = {}   # call id -> (key, settings, task, reserved_at)
+        self._replenishing = {}   # key -> replenish task
+        self._maintenance_task: asyncio.Task = None
+
+    @property
+    def idle_count(self) -> int:
+        return sum(len(sockets) for sockets in self._idle.values())
+
+    @property
+    def reservation_count(self) -> int:
+        return len(self._reservations)
+
+    def start(self):
+        if AGENT_PREWARM_ENABLED and (self._maintenance_task is None or self._maintenance_task.done()):
+            self._maintenance_task = asyncio.create_task(self._maintain(), name="agent-pool-maintenance")
+
+    def reserve(self, call_id: str, company_name: str, settings: dict) -> bool:
+        """Starts (or hands over) a configured agent socket for `call_id`. Returns False if not reserved."""
+        if not AGENT_PREWARM_ENABLED or not DEEPGRAM_API_KEY:
+            return False
+        if len(self._reservations) >= AGENT_POOL_MAX_RESERVATIONS:
+            logging.warning(f"[{call_id}] Agent reservation limit ({AGENT_POOL_MAX_RESERVATIONS}) reached, call will connect on demand.")
+            return False
+        key = settings_key(company_name, settings)
+        ws = self._pop_idle(key)
+        if ws is not None:
+            task = asyncio.get_running_loop().create_future()
+            task.set_result(ws)
+        else:
+            task = asyncio.create_task(connect_agent(settings), name=f"agent-connect-{call_id}")
+        self._reservations[call_id] = (key, settings, task, time.monotonic())
+        if AGENT_POOL_IDLE_PER_KEY > 0 and key not in self._replenishing:
+            self._replenishing[key] = asyncio.create_task(self._replenish(key, settings))
+        return True
+
+    def rebind(self, old_call_id: str, new_call_id: str):
+        """Moves a reservation made under a placeholder id to the real CallSid."""
+        reservation = self._reservations.pop(old_call_id, None)
+        if reservation is not None:
+            self._reservations[new_call_id] = reservation
+
+    def release(self, call_id: str):
+        reservation = self._reservations.pop(call_id, None)
+        if reservation is not None:
+            asyncio.create_task(self._close_when_ready(reservation[2]))
+
+    async def claim(self, call_id: str, settings: dict):
+        """Returns the reserved socket for `call_id` if it is open and has matching settings, else None."""
+        reservation = self._reservations.pop(call_id, None)
+        if reservation is None:
+            return None
+        _, reserved_settings, task, _ = reservation
+        if reserved_settings != settings:
+            logging.info(f"[{call_id}] Agent settings changed since reservation, discarding pre-warmed socket.")
+            asyncio.create_task(self._close_when_ready(task))
+            return None
+        try:
+            ws = await asyncio.wait_for(asyncio.shield(task), timeout=DEEPGRAM_CONNECT_TIMEOUT_S)
+        except asyncio.CancelledError:
+            asyncio.create_task(self._close_when_ready(task))
+            raise
+        except Exception as e:
+            # The shielded connect may still finish; nothing else owns its socket now.
+            logging.warning(f"[{call_id}] Pre-warmed agent socket unavailable: {e!r}")
+            asyncio.create_task(self._close_when_ready(task))
+            return None
+        if ws.closed:
+            asyncio.create_task(self._close_when_ready(task))
+            return None
+        return ws
+
+    def _pop_idle(self, key: str):
+        sockets = self._idle.get(key)
+        while sockets:
+            ws, _ = sockets.popleft()
+            if not ws.closed:
+                return ws
+        return None
+
+    async def _replenish(self, key: str, settings: dict):
+        try:
+            while len(self._idle.get(key, ())) < AGENT_POOL_IDLE_PER_KEY and self.idle_count < AGENT_POOL_MAX_IDLE:
+                try:
+                    ws = await connect_agent(settings)
+                except Exception as e:
+                    logging.warning(f"Could not pre-warm agent socket for {key}: {e!r}")
+                    return
+                self._idle.setdefault(key, deque()).append((ws, time.monotonic()))
+        finally:
+            self._replenishing.pop(key, None)
+
+    async def _close_when_ready(self, task):
+        try:
+            ws = await task
+            await ws.close()
+        except Exception:
+            pass
+
+    async def _maintain(self):
+        """Expires idle sockets and stale reservations, and keeps the rest alive."""
+        while True:
+            await asyncio.sleep(AGENT_KEEPALIVE_INTERVAL_S)
+            now = time.monotonic()
+            try:
+                for key in list(self._idle):
+                    sockets = self._idle[key]
+                    kept = deque()
+                    for ws, created_at in sockets:
+                        if ws.closed:
+                            continue
+                        if now - created_at > AGENT_POOL_IDLE_TTL_S:
+                            await ws.close()
+                            continue
+                        await ws.send_str(KEEPALIVE_MESSAGE)
+                        kept.append((ws, created_at))
+                    if kept:
+                        self._idle[key] = kept
+                    else:
+                        del self._idle[key]
+                for call_id, reservation in list(self._reservations.items()):
+                    task, reserved_at = reservation[2], reservation[3]
+                    if now - reserved_at > AGENT_RESERVATION_TTL_S:
+                        logging.info(f"[{call_id}] Agent reservation expired unclaimed.")
+                        self.release(call_id)
+                    elif task.done() and not task.cancelled() and task.exception() is None and not task.result().closed:
+                        await task.result().send_str(KEEPALIVE_MESSAGE)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.warning(f"Agent pool maintenance error: {e!r}")
+
+    async def close(self):
+        if self._maintenance_task is not None:
+            self._maintenance_task.cancel()
+            self._maintenance_task = None
+        for task in list(self._replenishing.values()):
+            task.cancel()
+        for call_id in list(self._reservations):
+            task = self._reservations.pop(call_id)[2]
+            if task.done():
+                await self._close_when_ready(task)
+            else:
+                task.cancel()
+        for sockets in self._idle.values():
+            for ws, _ in sockets:
+                await ws.close()
+        self._idle.clear()
+
+
+agent_pool = AgentSessionPool()
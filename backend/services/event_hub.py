@@ -0,0 +1,118 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import deque
+
+from services import metrics
+
+# In-process pub/sub for live call events: bridge events (transcripts, barge-ins,
+# call start/end) and Twilio webhooks are published here and fanned out to
+# dashboard WebSockets, each subscribed to a tenant and optionally to one call.
+# publish() never waits. It serializes the event once, and only when someone is
+# listening to that tenant, then appends it to each matching subscriber's bounded
+# queue. A subscriber that falls behind loses its oldest events (and is told how
+# many), so a slow dashboard can never hold up the media path.
+
+EVENT_HUB_QUEUE_SIZE = int(os.getenv("EVENT_HUB_QUEUE_SIZE", "256"))
+EVENT_HUB_MAX_SUBSCRIBERS = int(os.getenv("EVENT_HUB_MAX_SUBSCRIBERS", "1000"))
+
+metrics.registry.describe("event_hub_events_dropped_total", "Events dropped from slow dashboard subscribers' queues.")
+
+
+class HubFullError(RuntimeError):
+    pass
+
+
+class Subscription:
+    """One subscriber's filter and its bounded, drop-oldest queue of serialized events."""
+
+    __slots__ = ("tenant_id", "call_sid", "types", "_queue", "_wakeup", "dropped", "_dropped_unreported", "delivered")
+
+    def __init__(self, tenant_id: str, call_sid: str = None, types: frozenset = None, queue_size: int = EVENT_HUB_QUEUE_SIZE):
+        self.tenant_id = tenant_id
+        self.call_sid = call_sid
+        self.types = types
+        self._queue = deque(maxlen=max(1, queue_size))
+        self._wakeup = asyncio.Event()
+        self.dropped = 0
+        self._dropped_unreported = 0
+        self.delivered = 0
+
+    def matches(self, call_sid: str, event_type: str) -> bool:
+        return (self.call_sid is None or self.call_sid == call_sid) and (self.types is None or event_type in self.types)
+
+    def push(self, message: str):
+        if len(self._queue) == self._queue.maxlen:
+            self.dropped += 1
+            self._dropped_unreported += 1
+        self._queue.append(message)
+        self._wakeup.set()
+
+    async def next_batch(self) -> list:
+        """Waits for events and returns everything queued, led by a drop notice if events were lost."""
+        while not self._queue:
+            self._wakeup.clear()
+            await self._wakeup.wait()
+        batch = list(self._queue)
+        self._queue.clear()
+        if self._dropped_unreported:
+            metrics.registry.inc("event_hub_events_dropped_total", self._dropped_unreported)
+            batch.insert(0, json.dumps({"type": "EventsDropped", "count": self._dropped_unreported, "ts": time.time()}))
+            self._dropped_unreported = 0
+        self.delivered += len(batch)
+        return batch
+
+
+class EventHub:
+    """Tenant-indexed fan-out of call events to subscriptions."""
+
+    def __init__(self, max_subscribers: int = EVENT_HUB_MAX_SUBSCRIBERS):
+        self.max_subscribers = max_subscribers
+        self._by_tenant = {}   # tenant id -> set of Subscriptions
+        self._count = 0
+        self.published = 0
+
+    def subscribe(self, tenant_id: str, call_sid: str = None, types=None) -> Subscription:
+        if self._count >= self.max_subscribers:
+            raise HubFullError(f"Too many event subscribers ({self._count}).")
+        subscription = Subscription(tenant_id, call_sid, frozenset(types) if types else None)
+        self._by_tenant.setdefault(tenant_id, set()).add(subscription)
+        self._count += 1
+        metrics.registry.set_gauge("event_hub_subscribers", self._count)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscribers = self._by_tenant.get(subscription.tenant_id)
+        if subscribers is None or subscription not in subscribers:
+            return
+        subscribers.discard(subscription)
+        if not subscribers:
+            del self._by_tenant[subscription.tenant_id]
+        self._count -= 1
+        metrics.registry.set_gauge("event_hub_subscribers", self._count)
+
+    def publish(self, tenant_id: str, call_sid: str, event: dict):
+        """Fans an event out to matching subscribers without blocking. The event must be JSON-serializable."""
+        subscribers = self._by_tenant.get(tenant_id)
+        if not subscribers:
+            return
+        event_type = event.get("type")
+        message = None
+        for subscription in subscribers:
+            if subscription.matches(call_sid, event_type):
+                if message is None:
+                    try:
+                        message = json.dumps({**event, "call_sid": call_sid, "tenant_id": tenant_id}, default=str)
+                    except (TypeError, ValueError) as e:
+                        logging.warning(f"[{call_sid}] Event {event_type} not published: {e}")
+                        return
+                    self.published += 1
+                subscription.push(message)
+
+    def summary(self) -> dict:
+        return {"subscribers": self._count, "tenants": len(self._by_tenant), "published": self.published}
+
+
+event_hub = EventHub()
@@ -0,0 +1,77 @@
+import os
+
+from services.mulaw_codec import MULAW_SILENCE
+
+# Inbound jitter buffer for Twilio media frames. Frames are collected for one
+# aggregation window, put back in sequenceNumber order, and released as a
+# single contiguous mu-law batch. Gaps in Twilio's media timestamps are filled
+# with mu-law silence so downstream audio keeps real-time spacing.
+
+INBOUND_AGGREGATION_MS = int(os.getenv("INBOUND_AGGREGATION_MS", "40"))
+MAX_GAP_FILL_MS = int(os.getenv("INBOUND_MAX_GAP_FILL_MS", "200"))
+TWILIO_BYTES_PER_MS = 8  # 8 kHz mu-law, one byte per sample
+
+
+class InboundJitterBuffer:
+    """Reorders and aggregates Twilio mu-law frames into fixed-duration batches."""
+
+    def __init__(self, window_ms: int = INBOUND_AGGREGATION_MS, max_gap_fill_ms: int = MAX_GAP_FILL_MS):
+        self.window_ms = max(20, window_ms)
+        self.window_bytes = self.window_ms * TWILIO_BYTES_PER_MS
+        self.max_gap_fill_ms = max_gap_fill_ms
+        self._pending = []
+        self._pending_bytes = 0
+        self._last_seq = None       # highest sequence number released so far
+        self._next_ts = None        # media timestamp (ms) expected for the next released frame
+        self.frames_in = 0
+        self.late_frames = 0
+        self.duplicate_frames = 0
+        self.gap_fill_ms = 0
+
+    def push(self, sequence_number: int, timestamp_ms: int, payload: bytes):
+        """Adds a frame. Returns a batch of mu-law bytes once a full window is buffered, else None."""
+        self.frames_in += 1
+        if self._last_seq is not None and sequence_number <= self._last_seq:
+            self.late_frames += 1
+            return None
+        for pending_seq, _, _ in self._pending:
+            if pending_seq == sequence_number:
+                self.duplicate_frames += 1
+                return None
+        self._pending.append((sequence_number, timestamp_ms, payload))
+        self._pending_bytes += len(payload)
+        if self._pending_bytes < self.window_bytes:
+            return None
+        return self.flush()
+
+    def flush(self) -> bytes:
+        """Releases everything buffered, in sequence order, with timestamp gaps filled by silence."""
+        if not self._pending:
+            return b''
+        frames = self._pending
+        if len(frames) > 1:
+            frames.sort(key=lambda frame: frame[0])
+        parts = []
+        next_ts = self._next_ts
+        for _, timestamp_ms, payload in frames:
+            if next_ts is not None:
+                gap_ms = timestamp_ms - next_ts
+                if gap_ms >= 10:
+                    gap_ms = min(gap_ms, self.max_gap_fill_ms)
+                    parts.append(bytes([MULAW_SILENCE]) * (gap_ms * TWILIO_BYTES_PER_MS))
+                    self.gap_fill_ms += gap_ms
+            parts.append(payload)
+            next_ts = timestamp_ms + len(payload) // TWILIO_BYTES_PER_MS
+        self._next_ts = next_ts
+        self._last_seq = frames[-1][0]
+        self._pending = []
+        self._pending_bytes = 0
+        return parts[0] if len(parts) == 1 else b''.join(parts)
+
+    def stats(self) -> dict:
+        return {
+            "frames_in": self.frames_in,
+            "late_frames": self.late_frames,
+            "duplicate_frames": self.duplicate_frames,
+            "gap_fill_ms": self.gap_fill_ms,
+        }
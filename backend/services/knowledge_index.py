@@ -0,0 +1,194 @@
+import logging
+import math
+import os
+import re
+from collections import Counter
+
+# Local BM25 index over uploaded knowledge. Uploads are split into overlapping
+# word-window passages and added to an inverted index incrementally (re-uploading
+# a document only touches that document's passages). Each call gets a compact
+# instruction block instead of the full upload: a short lead summary per document
+# plus the best-scoring passages, capped at KNOWLEDGE_CONTEXT_MAX_CHARS.
+
+KNOWLEDGE_CHUNK_WORDS = int(os.getenv("KNOWLEDGE_CHUNK_WORDS", "120"))
+KNOWLEDGE_CHUNK_OVERLAP_WORDS = int(os.getenv("KNOWLEDGE_CHUNK_OVERLAP_WORDS", "20"))
+KNOWLEDGE_TOP_K = int(os.getenv("KNOWLEDGE_TOP_K", "4"))
+KNOWLEDGE_CONTEXT_MAX_CHARS = int(os.getenv("KNOWLEDGE_CONTEXT_MAX_CHARS", "2500"))
+KNOWLEDGE_SUMMARY_SENTENCES = int(os.getenv("KNOWLEDGE_SUMMARY_SENTENCES", "2"))
+KNOWLEDGE_SEED_QUERY = os.getenv("KNOWLEDGE_SEED_QUERY", "products services pricing plans features benefits customers demo")
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have how i in is it its of on or our so that the their them "
+    "there these this to was we were what when where which who why will with you your".split()
+)
+
+
+def _stem(token: str) -> str:
+    """Folds simple plurals ("plans" -> "plan") so queries match either form."""
+    if len(token) > 3 and token.endswith("s") and not token.endswith(("ss", "us", "is")):
+        return token[:-3] + "y" if token.endswith("ies") else token[:-1]
+    return token
+
+
+def tokenize(text: str) -> list:
+    return [_stem(token) for token in _TOKEN_RE.findall(text.lower()) if token not in STOPWORDS]
+
+
+def chunk_text(text: str, chunk_words: int = KNOWLEDGE_CHUNK_WORDS, overlap_words: int = KNOWLEDGE_CHUNK_OVERLAP_WORDS) -> list:
+    """Splits text into passages of about `chunk_words` words, breaking at paragraph or sentence ends where possible."""
+    chunk_words = max(1, chunk_words)
+    overlap_words = max(0, min(overlap_words, chunk_words - 1))  # each passage must move past the last one
+    sentences = [sentence for paragraph in re.split(r"\n\s*\n", text) for sentence in _SENTENCE_RE.split(paragraph.strip()) if sentence.strip()]
+    passages = []
+    current = []
+    for sentence in sentences:
+        words = sentence.split()
+        while len(words) > chunk_words:  # a single run-on "sentence" longer than a passage
+            if current:
+                passages.append(current)
+                current = []
+            passages.append(words[:chunk_words])
+            words = words[chunk_words - overlap_words:]
+        if current and len(current) + len(words) > chunk_words:
+            passages.append(current)
+            current = current[-overlap_words:] if overlap_words else []
+        current = current + words
+    if current:
+        passages.append(current)
+    return [" ".join(words) for words in passages]
+
+
+def lead_summary(text: str, sentences: int = KNOWLEDGE_SUMMARY_SENTENCES) -> str:
+    return " ".join(_SENTENCE_RE.split(" ".join(text.split()))[:sentences])
+
+
+class KnowledgeIndex:
+    """Incremental BM25 inverted index over knowledge passages."""
+
+    def __init__(self):
+        self.version = 0
+        self._passages = {}       # passage id -> (doc id, text, token count)
+        self._postings = {}       # term -> {passage id: term frequency}
+        self._documents = {}      # doc id -> (list of passage ids, lead summary, char count)
+        self._next_passage_id = 0
+        self._total_tokens = 0
+        self._context_cache = {}  # (version, company, query, max chars) -> context text
+
+    @property
+    def passage_count(self) -> int:
+        return len(self._passages)
+
+    @property
+    def document_count(self) -> int:
+        return len(self._documents)
+
+    def copy(self) -> "KnowledgeIndex":
+        """An independent copy, so an update can be built while this index keeps serving searches."""
+        clone = KnowledgeIndex()
+        clone.version = self.version
+        clone._passages = dict(self._passages)
+        clone._postings = {term: dict(postings) for term, postings in self._postings.items()}
+        clone._documents = dict(self._documents)
+        clone._next_passage_id = self._next_passage_id
+        clone._total_tokens = self._total_tokens
+        return clone
+
+    def add_document(self, doc_id: str, text: str) -> int:
+        """Indexes `text` under `doc_id`, replacing an earlier version of that document. Returns the passage count."""
+        self.remove_document(doc_id)
+        passage_ids = []
+        for passage in chunk_text(text):
+            tokens = tokenize(passage)
+            if not tokens:
+                continue
+            passage_id = self._next_passage_id
+            self._next_passage_id += 1
+            self._passages[passage_id] = (doc_id, passage, len(tokens))
+            for term, count in Counter(tokens).items():
+                self._postings.setdefault(term, {})[passage_id] = count
+            self._total_tokens += len(tokens)
+            passage_ids.append(passage_id)
+        self._documents[doc_id] = (passage_ids, lead_summary(text), len(text))
+        self._changed()
+        logging.info(f"Knowledge document '{doc_id}' indexed: {len(passage_ids)} passages ({self.passage_count} total).")
+        return len(passage_ids)
+
+    def remove_document(self, doc_id: str) -> bool:
+        document = self._documents.pop(doc_id, None)
+        if document is None:
+            return False
+        for passage_id in document[0]:
+            _, passage, length = self._passages.pop(passage_id)
+            self._total_tokens -= length
+            for term in set(tokenize(passage)):
+                postings = self._postings.get(term)
+                if postings is not None:
+                    postings.pop(passage_id, None)
+                    if not postings:
+                        del self._postings[term]
+        self._changed()
+        return True
+
+    def _changed(self):
+        self.version += 1
+        self._context_cache.clear()
+
+    def search(self, query: str, k: int = KNOWLEDGE_TOP_K) -> list:
+        """Returns up to `k` passages ranked by BM25 score for `query`."""
+        total = len(self._passages)
+        if not total:
+            return []
+        avg_length = self._total_tokens / total
+        scores = {}
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for passage_id, tf in postings.items():
+                length = self._passages[passage_id][2]
+                norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length)
+                scores[passage_id] = scores.get(passage_id, 0.0) + idf * tf * (BM25_K1 + 1) / norm
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:k]
+        return [
+            {"document_id": self._passages[passage_id][0], "passage_id": passage_id, "score": round(score, 4), "text": self._passages[passage_id][1]}
+            for passage_id, score in ranked
+        ]
+
+    def documents(self) -> list:
+        return [
+            {"document_id": doc_id, "passages": len(passage_ids), "chars": chars, "summary": summary}
+            for doc_id, (passage_ids, summary, chars) in self._documents.items()
+        ]
+
+    def agent_context(self, company_name: str = None, query: str = None, max_chars: int = KNOWLEDGE_CONTEXT_MAX_CHARS) -> str:
+        """Bounded knowledge block for the agent prompt: per-document summaries, then the top passages."""
+        if not self._documents:
+            return None
+        query = query or f"{company_name or ''} {KNOWLEDGE_SEED_QUERY}"
+        cache_key = (self.version, company_name, query, max_chars)
+        cached = self._context_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        parts = ["Overview:"] + [f"- {summary}" for _, summary, _ in self._documents.values() if summary]
+        parts.append("\nKey details:")
+        used = sum(len(part) + 1 for part in parts)
+        for hit in self.search(query, KNOWLEDGE_TOP_K):
+            passage = f"- {hit['text']}"
+            if used + len(passage) + 1 > max_chars:
+                passage = passage[:max(0, max_chars - used - 4)].rsplit(" ", 1)[0] + "..."
+                if len(passage) > 20:
+                    parts.append(passage)
+                break
+            parts.append(passage)
+            used += len(passage) + 1
+        context = "\n".join(parts)[:max_chars]
+        self._context_cache[cache_key] = context
+        return context
+
@@ -0,0 +1,31 @@
+import importlib.util
+import sys
+
+# Deferred imports for packages that are slow to import but not needed to serve
+# requests until the app has warmed up (aiohttp spends most of its import time
+# building SSL contexts). lazy_import() returns a module whose code only runs on
+# first attribute access, so importing main.py does not pay for it. The startup
+# warm-up loads such modules on a worker thread with load() before /ready reports
+# ready, so calls never trigger an import on the event loop.
+
+
+def lazy_import(name: str):
+    """Returns the module `name`, imported on first use (or the module itself if already imported)."""
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+def load(module):
+    """Forces a lazily imported module to finish importing now."""
+    getattr(module, "__dict__")
+    return module
@@ -0,0 +1,288 @@
+import asyncio
+import os
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+
+# In-process metrics for the media bridge, rendered in the Prometheus text
+# format by GET /metrics. Per-frame work only touches plain counters on a
+# CallMetrics object; histograms are observed once per batch. When metrics are
+# disabled, start_call() hands out a no-op object so the hot path only pays
+# for a method call.
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+LOOP_LAG_INTERVAL_S = float(os.getenv("METRICS_LOOP_LAG_INTERVAL_S", "0.25"))
+MAX_TRACKED_INITIATIONS = 10000
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+TURN_BUCKETS = (0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0, 30.0)
+DEPTH_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500, 1000, 5000)
+
+clock = time.perf_counter
+
+
+class Histogram:
+    """Cumulative-bucket histogram compatible with the Prometheus exposition format."""
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._counters = OrderedDict()     # (name, labels) -> value
+        self._gauges = OrderedDict()       # (name, labels) -> value or callable
+        self._histograms = OrderedDict()   # (name, labels) -> Histogram
+        self._help = {}
+
+    def describe(self, name: str, help_text: str):
+        self._help[name] = help_text
+
+    def inc(self, name: str, value: float = 1, labels: tuple = ()):
+        key = (name, labels)
+        self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name: str, value, labels: tuple = ()):
+        self._gauges[(name, labels)] = value
+
+    def add_gauge(self, name: str, delta: float, labels: tuple = ()):
+        key = (name, labels)
+        self._gauges[key] = self._gauges.get(key, 0) + delta
+
+    def histogram(self, name: str, buckets=LATENCY_BUCKETS, labels: tuple = ()) -> Histogram:
+        key = (name, labels)
+        hist = self._histograms.get(key)
+        if hist is None:
+            hist = self._histograms[key] = Histogram(buckets)
+        return hist
+
+    def observe(self, name: str, value: float, buckets=LATENCY_BUCKETS, labels: tuple = ()):
+        self.histogram(name, buckets, labels).observe(value)
+
+    def render(self) -> str:
+        lines = []
+        seen = set()
+
+        def header(name, kind):
+            if name not in seen:
+                seen.add(name)
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in _grouped(self._counters):
+            header(name, "counter")
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+        for (name, labels), value in _grouped(self._gauges):
+            header(name, "gauge")
+            lines.append(f"{name}{_format_labels(labels)} {value() if callable(value) else value}")
+        for (name, labels), hist in _grouped(self._histograms):
+            header(name, "histogram")
+            cumulative = 0
+            for bound, count in zip(hist.buckets, hist.counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', repr(float(bound))),))} {cumulative}")
+            lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {hist.count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {hist.sum}")
+            lines.append(f"{name}_count{_format_labels(labels)} {hist.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _grouped(series: dict):
+    """Series ordered so every sample of a metric name is contiguous, as the exposition format requires."""
+    order = {}
+    for name, _ in series:
+        order.setdefault(name, len(order))
+    return sorted(series.items(), key=lambda item: order[item[0][0]])
+
+
+def _format_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+registry = MetricsRegistry()
+registry.describe("bridge_stage_seconds", "Time spent per media-bridge stage, per batch.")
+registry.describe("bridge_queue_depth", "Queue depth sampled when work is enqueued.")
+registry.describe("bridge_turn_latency_seconds", "End of user speech to first agent audio byte.")
+registry.describe("call_time_to_first_audio_seconds", "/initiate_call to first agent audio frame sent to Twilio.")
+registry.describe("call_time_to_first_clip_audio_seconds", "/initiate_call to first pre-rendered clip frame sent to Twilio.")
+registry.describe("bridge_frames_total", "Audio frames/messages moved by the bridge.")
+registry.describe("bridge_bytes_total", "Audio bytes moved by the bridge.")
+registry.describe("inbound_vad_frames_total", "Inbound 10 ms frames by VAD decision; silence frames skip transcoding.")
+registry.describe("calls_active", "Calls currently bridged by this process.")
+registry.describe("calls_total", "Calls bridged by this process since start.")
+registry.describe("event_loop_lag_seconds", "How late the event loop woke a periodic timer.")
+registry.describe("event_loop_lag_max_seconds", "Largest event loop lag seen since start.")
+
+_initiated_at = OrderedDict()   # call id -> monotonic time of /initiate_call
+
+
+def mark_call_initiated(call_id: str):
+    if not METRICS_ENABLED:
+        return
+    _initiated_at[call_id] = time.monotonic()
+    while len(_initiated_at) > MAX_TRACKED_INITIATIONS:
+        _initiated_at.popitem(last=False)
+
+
+def rebind_call(old_call_id: str, new_call_id: str):
+    initiated_at = _initiated_at.pop(old_call_id, None)
+    if initiated_at is not None:
+        _initiated_at[new_call_id] = initiated_at
+
+
+class CallMetrics:
+    """Counters and timings for one bridged call."""
+
+    __slots__ = ("call_sid", "started_at", "frames_in", "bytes_in", "frames_out", "bytes_out",
+                 "dg_messages_in", "dg_bytes_in", "dg_messages_out", "dg_bytes_out",
+                 "stage_seconds", "max_queue_depth", "turn_latencies", "first_audio_at",
+                 "first_clip_audio_at", "_user_turn_ended_at", "_initiated_at")
+
+    enabled = True
+
+    def __init__(self, call_sid: str):
+        self.call_sid = call_sid
+        self.started_at = time.monotonic()
+        self.frames_in = self.bytes_in = 0            # Twilio -> bridge
+        self.frames_out = self.bytes_out = 0          # bridge -> Twilio
+        self.dg_messages_out = self.dg_bytes_out = 0  # bridge -> Deepgram
+        self.dg_messages_in = self.dg_bytes_in = 0    # Deepgram -> bridge
+        self.stage_seconds = {}
+        self.max_queue_depth = {}
+        self.turn_latencies = []
+        self.first_audio_at = None
+        self.first_clip_audio_at = None
+        self._user_turn_ended_at = None
+        self._initiated_at = _initiated_at.pop(call_sid, None)
+        registry.add_gauge("calls_active", 1)
+        registry.inc("calls_total")
+
+    def observe_stage(self, stage: str, seconds: float):
+        self.stage_seconds[stage] = self.stage_seconds.get(stage, 0.0) + seconds
+        registry.observe("bridge_stage_seconds", seconds, labels=(("stage", stage),))
+
+    def observe_queue(self, queue: str, depth: int):
+        if depth > self.max_queue_depth.get(queue, -1):
+            self.max_queue_depth[queue] = depth
+        registry.observe("bridge_queue_depth", depth, DEPTH_BUCKETS, labels=(("queue", queue),))
+
+    def user_turn_ended(self):
+        self._user_turn_ended_at = time.monotonic()
+
+    def agent_audio_received(self):
+        if self._user_turn_ended_at is not None:
+            latency = time.monotonic() - self._user_turn_ended_at
+            self._user_turn_ended_at = None
+            if len(self.turn_latencies) < 1000:
+                self.turn_latencies.append(latency)
+            registry.observe("bridge_turn_latency_seconds", latency, TURN_BUCKETS)
+
+    def audio_sent(self, num_bytes: int, clip: bool = False):
+        """Counts a frame sent to Twilio. Clip frames are timed separately from the agent's own audio."""
+        self.frames_out += 1
+        self.bytes_out += num_bytes
+        if clip:
+            if self.first_clip_audio_at is None:
+                self.first_clip_audio_at = time.monotonic()
+                if self._initiated_at is not None:
+                    registry.observe("call_time_to_first_clip_audio_seconds", self.first_clip_audio_at - self._initiated_at, TURN_BUCKETS)
+            return
+        if self.first_audio_at is None:
+            self.first_audio_at = time.monotonic()
+            if self._initiated_at is not None:
+                registry.observe("call_time_to_first_audio_seconds", self.first_audio_at - self._initiated_at, TURN_BUCKETS)
+
+    def finish(self) -> dict:
+        """Folds the call's counters into the process totals and returns a summary for the teardown log."""
+        registry.add_gauge("calls_active", -1)
+        for direction, frames, num_bytes in (
+            ("twilio_in", self.frames_in, self.bytes_in),
+            ("twilio_out", self.frames_out, self.bytes_out),
+            ("deepgram_in", self.dg_messages_in, self.dg_bytes_in),
+            ("deepgram_out", self.dg_messages_out, self.dg_bytes_out),
+        ):
+            registry.inc("bridge_frames_total", frames, labels=(("direction", direction),))
+            registry.inc("bridge_bytes_total", num_bytes, labels=(("direction", direction),))
+        duration = time.monotonic() - self.started_at
+        turns = sorted(self.turn_latencies)
+        return {
+            "duration_s": round(duration, 2),
+            "twilio_frames_in": self.frames_in, "twilio_bytes_in": self.bytes_in,
+            "twilio_frames_out": self.frames_out, "twilio_bytes_out": self.bytes_out,
+            "deepgram_messages_out": self.dg_messages_out, "deepgram_bytes_out": self.dg_bytes_out,
+            "deepgram_messages_in": self.dg_messages_in, "deepgram_bytes_in": self.dg_bytes_in,
+            "stage_ms": {stage: round(seconds * 1000, 1) for stage, seconds in self.stage_seconds.items()},
+            "max_queue_depth": dict(self.max_queue_depth),
+            "turns": len(turns),
+            "turn_latency_p50_ms": round(turns[len(turns) // 2] * 1000) if turns else None,
+            "turn_latency_max_ms": round(turns[-1] * 1000) if turns else None,
+            "time_to_first_audio_s": round(self.first_audio_at - self._initiated_at, 3) if self.first_audio_at and self._initiated_at else None,
+            "time_to_first_clip_audio_s": round(self.first_clip_audio_at - self._initiated_at, 3) if self.first_clip_audio_at and self._initiated_at else None,
+        }
+
+
+class NullCallMetrics:
+    """Stand-in used when metrics are disabled; only the live byte counters are kept."""
+
+    __slots__ = ("frames_in", "bytes_in", "frames_out", "bytes_out", "dg_messages_in", "dg_bytes_in", "dg_messages_out", "dg_bytes_out")
+
+    enabled = False
+
+    def __init__(self):
+        self.frames_in = self.bytes_in = 0
+        self.frames_out = self.bytes_out = 0
+        self.dg_messages_in = self.dg_bytes_in = 0
+        self.dg_messages_out = self.dg_bytes_out = 0
+
+    def observe_stage(self, stage: str, seconds: float): pass
+    def observe_queue(self, queue: str, depth: int): pass
+    def user_turn_ended(self): pass
+    def agent_audio_received(self): pass
+    def audio_sent(self, num_bytes: int, clip: bool = False):
+        self.frames_out += 1
+        self.bytes_out += num_bytes
+    def finish(self) -> dict: return {}
+
+
+def start_call(call_sid: str):
+    if not METRICS_ENABLED:
+        return NullCallMetrics()
+    return CallMetrics(call_sid)
+
+
+def render() -> str:
+    return registry.render()
+
+
+async def monitor_event_loop(interval: float = LOOP_LAG_INTERVAL_S):
+    """Samples event-loop lag: how much later than requested a sleep returns."""
+    loop = asyncio.get_running_loop()
+    max_lag = 0.0
+    registry.set_gauge("event_loop_lag_max_seconds", max_lag)
+    while True:
+        scheduled = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - scheduled - interval)
+        registry.observe("event_loop_lag_seconds", lag)
+        if lag > max_lag:
+            max_lag = lag
+            registry.set_gauge("event_loop_lag_max_seconds", max_lag)
+
+
+def start_loop_monitor():
+    if not METRICS_ENABLED:
+        return None
+    return asyncio.create_task(monitor_event_loop(), name="event-loop-lag-monitor")
@@ -0,0 +1,80 @@
+import numpy as np
+
+# G.711 mu-law codec backed by precomputed lookup tables. The decode table maps
+# every 8-bit code to its 16-bit linear sample; the encode table maps every
+# 16-bit sample (viewed as uint16) to its 8-bit code. Both are bit-exact with
+# libsndfile's ULAW subtype, so they are drop-in replacements for sf.read/sf.write.
+# The tables are built on first use rather than at import; the startup warm-up
+# builds them off the event loop before the server reports ready.
+
+MULAW_BIAS = 0x84
+MULAW_CLIP = 32635
+MULAW_SILENCE = 0xFF
+
+
+def _build_decode_table() -> np.ndarray:
+    codes = ~np.arange(256, dtype=np.int32) & 0xFF
+    sign = codes & 0x80
+    exponent = (codes >> 4) & 0x07
+    mantissa = codes & 0x0F
+    magnitude = (((mantissa << 3) + MULAW_BIAS) << exponent) - MULAW_BIAS
+    return np.where(sign, -magnitude, magnitude).astype(np.int16)
+
+
+def _build_encode_table() -> np.ndarray:
+    samples = np.arange(65536, dtype=np.int32)
+    samples = np.where(samples >= 32768, samples - 65536, samples)
+    sign = np.where(samples < 0, 0x80, 0)
+    magnitude = np.minimum(np.abs(samples), MULAW_CLIP) + MULAW_BIAS
+    exponent = np.floor(np.log2(magnitude)).astype(np.int32) - 7
+    mantissa = (magnitude >> (exponent + 3)) & 0x0F
+    return (~(sign | (exponent << 4) | mantissa) & 0xFF).astype(np.uint8)
+
+
+_decode_table: np.ndarray = None
+_encode_table: np.ndarray = None
+
+
+def decode_table() -> np.ndarray:
+    """int16 sample for each of the 256 mu-law codes."""
+    global _decode_table
+    if _decode_table is None:
+        _decode_table = _build_decode_table()
+    return _decode_table
+
+
+def encode_table() -> np.ndarray:
+    """mu-law code for each 16-bit sample, indexed by the sample viewed as uint16."""
+    global _encode_table
+    if _encode_table is None:
+        _encode_table = _build_encode_table()
+    return _encode_table
+
+
+def load_tables():
+    decode_table()
+    encode_table()
+
+
+def ulaw_to_pcm16_array(mulaw_data) -> np.ndarray:
+    """Decodes mu-law bytes (bytes/bytearray/memoryview or a uint8 array) to an int16 array."""
+    return decode_table()[np.frombuffer(mulaw_data, dtype=np.uint8)]
+
+
+def ulaw_to_pcm16(mulaw_data) -> bytes:
+    """Decodes mu-law bytes to little-endian 16-bit PCM bytes."""
+    if not mulaw_data: return b''
+    return ulaw_to_pcm16_array(mulaw_data).tobytes()
+
+
+def pcm16_array_to_ulaw(pcm_np: np.ndarray) -> np.ndarray:
+    """Encodes an int16 array to a uint8 array of mu-law codes."""
+    return encode_table()[pcm_np.view(np.uint16)]
+
+
+def pcm16_to_ulaw(pcm_data) -> bytes:
+    """Encodes little-endian 16-bit PCM bytes to mu-law bytes. A trailing odd byte is ignored."""
+    if not pcm_data: return b''
+    usable = len(pcm_data) & ~1
+    samples = np.frombuffer(pcm_data, dtype=np.uint16, count=usable // 2)
+    return encode_table()[samples].tobytes()
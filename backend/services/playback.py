@@ -0,0 +1,186 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from itertools import islice
+
+import numpy as np
+
+from services.mulaw_codec import MULAW_SILENCE, pcm16_array_to_ulaw, ulaw_to_pcm16_array
+
+# Outbound playback queue for one call. Agent audio is re-chunked into fixed
+# 20 ms mu-law frames and paced to real time, keeping only a small lead in
+# Twilio's own buffer. That way a barge-in can drop the rest of the utterance
+# locally and a Twilio `clear` only has to discard a few frames. A pre-rendered
+# clip can be played ahead of the agent; it is faded out and dropped as soon as
+# live agent audio arrives.
+
+FRAME_BYTES = 160           # 20 ms of 8 kHz mu-law
+FRAME_SECONDS = 0.02
+PLAYBACK_LEAD_MS = int(os.getenv("PLAYBACK_LEAD_MS", "100"))
+PLAYBACK_TICK_MS = int(os.getenv("PLAYBACK_TICK_MS", "40"))
+PLAYBACK_MAX_BUFFER_S = float(os.getenv("PLAYBACK_MAX_BUFFER_S", "120"))
+CLIP_FADE_FRAMES = 3        # 60 ms fade-out when live audio takes over from a clip
+
+
+class PlaybackQueue:
+    """Paced, interruptible outbound audio for one Twilio media stream."""
+
+    def __init__(self, send_media, send_mark, send_clear, name: str,
+                 lead_ms: int = PLAYBACK_LEAD_MS, tick_ms: int = PLAYBACK_TICK_MS, max_buffer_s: float = PLAYBACK_MAX_BUFFER_S):
+        self.send_media = send_media   # async (frame: bytes, from_clip: bool)
+        self.send_mark = send_mark     # async (name: str)
+        self.send_clear = send_clear   # async ()
+        self.name = name
+        self.lead_frames = max(1, lead_ms // 20)
+        self.tick_seconds = max(FRAME_SECONDS, tick_ms / 1000)
+        self.max_frames = max(1, int(max_buffer_s / FRAME_SECONDS))
+        self._items = deque()          # bytes frames, or str mark names
+        self._clip = deque()           # pre-rendered frames, played before anything in _items
+        self._queued_frames = 0
+        self._remainder = b''
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task = None
+        self._restart_clock = False
+        self._utterance = 0
+        self.pending_marks = set()
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.frames_flushed = 0
+        self.barge_ins = 0
+        self.clip_frames_skipped = 0
+
+    @property
+    def queued_frames(self) -> int:
+        return self._queued_frames
+
+    def start(self):
+        """Starts pacing. Audio queued before the Twilio stream started is played from here."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._pace(), name=f"playback-{self.name}")
+
+    def play_clip(self, frames) -> bool:
+        """Queues pre-rendered 20 ms frames to play until agent audio arrives. Ignored once the agent has spoken."""
+        if not frames or self.frames_sent or self._queued_frames:
+            return False
+        self._clip.extend(frames)
+        self._queued_frames += len(self._clip)
+        self._wakeup.set()
+        return True
+
+    def _hand_off_clip(self):
+        """Live agent audio arrived: fade out the next few clip frames and drop the rest."""
+        clip = self._clip
+        tail = list(islice(clip, CLIP_FADE_FRAMES))
+        skipped = len(clip) - len(tail)
+        clip.clear()
+        if tail:
+            samples = ulaw_to_pcm16_array(b"".join(tail))
+            ramp = np.linspace(1.0, 0.0, len(samples), endpoint=False, dtype=np.float32)
+            faded = pcm16_array_to_ulaw((samples * ramp).astype(np.int16)).tobytes()
+            clip.extend(faded[offset:offset + FRAME_BYTES] for offset in range(0, len(faded), FRAME_BYTES))
+        self._queued_frames -= skipped
+        self.clip_frames_skipped += skipped
+
+    def enqueue(self, mulaw_data: bytes):
+        """Adds agent audio, split into whole 20 ms frames; a partial frame waits for the next chunk."""
+        if not mulaw_data: return
+        if self._clip:
+            self._hand_off_clip()
+        data = self._remainder + mulaw_data if self._remainder else mulaw_data
+        usable = len(data) - len(data) % FRAME_BYTES
+        items = self._items
+        for offset in range(0, usable, FRAME_BYTES):
+            items.append(data[offset:offset + FRAME_BYTES])
+        self._queued_frames += usable // FRAME_BYTES
+        self._remainder = data[usable:]
+        while self._queued_frames > self.max_frames:
+            if isinstance(items.popleft(), bytes):
+                self._queued_frames -= 1
+                self.frames_dropped += 1
+        self._wakeup.set()
+
+    def end_utterance(self) -> str:
+        """Pads the trailing partial frame with silence and queues a mark for the utterance boundary."""
+        if self._remainder:
+            self._items.append(self._remainder + bytes([MULAW_SILENCE]) * (FRAME_BYTES - len(self._remainder)))
+            self._queued_frames += 1
+            self._remainder = b''
+        self._utterance += 1
+        mark_name = f"utterance-{self._utterance}"
+        self._items.append(mark_name)
+        self._wakeup.set()
+        return mark_name
+
+    def flush(self) -> int:
+        """Drops all queued audio and marks. Returns the number of frames dropped."""
+        dropped = self._queued_frames
+        self._items.clear()
+        self._clip.clear()
+        self._queued_frames = 0
+        self._remainder = b''
+        self.frames_flushed += dropped
+        return dropped
+
+    async def barge_in(self):
+        """Stops agent playback immediately: drops the local queue and tells Twilio to clear its buffer."""
+        dropped = self.flush()
+        self.barge_ins += 1
+        self.pending_marks.clear()
+        self._restart_clock = True
+        await self.send_clear()
+        logging.info(f"[{self.name}] Barge-in: cleared playback ({dropped} queued frames dropped).")
+
+    def on_mark(self, mark_name: str):
+        """Twilio echoes a mark once the audio before it has played (or was cleared)."""
+        self.pending_marks.discard(mark_name)
+
+    async def _pace(self):
+        items = self._items
+        clip = self._clip
+        started_at = None
+        sent_since_start = 0
+        while True:
+            if not items and not clip:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            now = time.monotonic()
+            if self._restart_clock or started_at is None or now - started_at > sent_since_start * FRAME_SECONDS:
+                # Twilio has played (or cleared) everything sent so far: start a new real-time timeline.
+                self._restart_clock = False
+                started_at = now
+                sent_since_start = 0
+            budget = int((now - started_at) / FRAME_SECONDS) + self.lead_frames - sent_since_start
+            while budget > 0 and (items or clip):
+                from_clip = bool(clip)
+                item = clip.popleft() if from_clip else items.popleft()
+                if isinstance(item, bytes):
+                    self._queued_frames -= 1
+                    await self.send_media(item, from_clip)
+                    self.frames_sent += 1
+                    sent_since_start += 1
+                    budget -= 1
+                else:
+                    self.pending_marks.add(item)
+                    await self.send_mark(item)
+            await asyncio.sleep(self.tick_seconds)
+
+    async def close(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+
+    def stats(self) -> dict:
+        return {
+            "frames_sent": self.frames_sent,
+            "frames_dropped": self.frames_dropped,
+            "frames_flushed": self.frames_flushed,
+            "barge_ins": self.barge_ins,
+            "clip_frames_skipped": self.clip_frames_skipped,
+            "pending_marks": len(self.pending_marks),
+        }
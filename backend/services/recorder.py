@@ -0,0 +1,271 @@
+import logging
+import os
+import struct
+import threading
+import time
+
+import numpy as np
+
+from services import metrics
+from services.conversation_store import SAFE_CALL_SID
+from services.mulaw_codec import MULAW_SILENCE, ulaw_to_pcm16_array
+
+# Local two-leg call recordings (left: caller audio as received from Twilio, right:
+# agent audio as sent to Twilio), both 8 kHz mu-law. The media path only copies
+# each frame into a preallocated per-leg ring buffer, at a sample position taken
+# from the call's clock. One background thread drains every active recording,
+# interleaves the legs, and appends them to a streaming stereo WAV file, either
+# mu-law or decoded to 16-bit PCM. Writes are limited by a process-wide disk
+# budget. Audio the writer cannot keep up with is dropped and counted, never
+# waited for.
+
+RECORDING_ENABLED = os.getenv("RECORDING_ENABLED", "false").lower() == "true"
+RECORDING_DIR = os.getenv("RECORDING_DIR", "recordings")
+RECORDING_FORMAT = os.getenv("RECORDING_FORMAT", "mulaw")   # mulaw | pcm
+RECORDING_RING_SECONDS = float(os.getenv("RECORDING_RING_SECONDS", "5"))
+RECORDING_FLUSH_INTERVAL_S = float(os.getenv("RECORDING_FLUSH_INTERVAL_S", "0.5"))
+RECORDING_WRITE_BUDGET_BYTES_PER_S = int(os.getenv("RECORDING_WRITE_BUDGET_BYTES_PER_S", str(8 * 1024 * 1024)))
+
+SAMPLE_RATE = 8000
+WRITER_LAG_SAMPLES = SAMPLE_RATE // 2     # stay behind real time: playback runs ahead, jitter batches arrive late
+RESYNC_SAMPLES = SAMPLE_RATE // 4         # a leg re-anchors to the clock after a gap or drift beyond this
+
+metrics.registry.describe("recording_dropped_bytes_total", "Recorded audio bytes dropped (ring overrun or disk budget).")
+metrics.registry.describe("recording_written_bytes_total", "Bytes written to call recordings.")
+
+
+class LegRingBuffer:
+    """Preallocated mu-law ring addressed by absolute sample position."""
+
+    __slots__ = ("buffer", "capacity", "next_pos", "high_water")
+
+    def __init__(self, capacity: int):
+        self.buffer = np.full(capacity, MULAW_SILENCE, dtype=np.uint8)
+        self.capacity = capacity
+        self.next_pos = None
+        self.high_water = 0
+
+    def write(self, data: bytes, clock_pos: int):
+        """Copies a frame in, contiguous with the previous one unless the leg drifted from the clock."""
+        pos = self.next_pos
+        if pos is None or abs(clock_pos - pos) > RESYNC_SAMPLES:
+            pos = clock_pos
+        frame = np.frombuffer(data, dtype=np.uint8)
+        count = min(len(frame), self.capacity)
+        start = pos % self.capacity
+        first = min(count, self.capacity - start)
+        self.buffer[start:start + first] = frame[:first]
+        if first < count:
+            self.buffer[:count - first] = frame[first:count]
+        self.next_pos = pos + len(frame)
+        if self.next_pos > self.high_water:
+            self.high_water = self.next_pos
+
+    def take(self, start_pos: int, end_pos: int) -> np.ndarray:
+        """Copies out [start_pos, end_pos) and resets it to silence for the next lap."""
+        start = start_pos % self.capacity
+        count = end_pos - start_pos
+        first = min(count, self.capacity - start)
+        out = np.empty(count, dtype=np.uint8)
+        out[:first] = self.buffer[start:start + first]
+        self.buffer[start:start + first] = MULAW_SILENCE
+        if first < count:
+            out[first:] = self.buffer[:count - first]
+            self.buffer[:count - first] = MULAW_SILENCE
+        return out
+
+
+def _wav_header(audio_format: str, data_bytes: int) -> bytes:
+    if audio_format == "pcm":
+        fmt = struct.pack("<HHIIHH", 1, 2, SAMPLE_RATE, SAMPLE_RATE * 4, 4, 16)
+        return b"RIFF" + struct.pack("<I", 36 + data_bytes) + b"WAVEfmt " + struct.pack("<I", len(fmt)) + fmt + b"data" + struct.pack("<I", data_bytes)
+    # WAVE_FORMAT_MULAW: non-PCM formats carry cbSize and a fact chunk with the frame count.
+    fmt = struct.pack("<HHIIHHH", 7, 2, SAMPLE_RATE, SAMPLE_RATE * 2, 2, 8, 0)
+    fact = b"fact" + struct.pack("<II", 4, data_bytes // 2)
+    return b"RIFF" + struct.pack("<I", 4 + 8 + len(fmt) + len(fact) + 8 + data_bytes) + b"WAVEfmt " + struct.pack("<I", len(fmt)) + fmt + fact + b"data" + struct.pack("<I", data_bytes)
+
+
+class CallRecording:
+    """Per-call recorder state. inbound()/outbound() run on the event loop; everything else on the writer thread."""
+
+    def __init__(self, call_sid: str, path: str, audio_format: str):
+        self.call_sid = call_sid
+        self.path = path
+        self.audio_format = audio_format
+        capacity = int(RECORDING_RING_SECONDS * SAMPLE_RATE)
+        self.caller = LegRingBuffer(capacity)
+        self.agent = LegRingBuffer(capacity)
+        self.started = time.monotonic()
+        self.finished = False
+        self.closed = False
+        self.read_pos = 0
+        self.data_bytes = 0
+        self.dropped_bytes = 0
+        self._file = None
+
+    def _clock_pos(self) -> int:
+        return int((time.monotonic() - self.started) * SAMPLE_RATE)
+
+    def inbound(self, mulaw: bytes):
+        self.caller.write(mulaw, self._clock_pos())
+
+    def outbound(self, mulaw: bytes):
+        self.agent.write(mulaw, self._clock_pos())
+
+    def finish(self):
+        self.finished = True
+
+    def stats(self) -> dict:
+        return {
+            "path": self.path, "format": self.audio_format, "recorded_s": round(self.read_pos / SAMPLE_RATE, 1),
+            "bytes_written": self.data_bytes, "dropped_bytes": self.dropped_bytes, "finished": self.finished,
+        }
+
+    def drain(self, budget: "_WriteBudget"):
+        """Moves settled audio from the rings to disk (all of it once the call has finished)."""
+        if self.finished:
+            end_pos = max(self.caller.high_water, self.agent.high_water)
+        else:
+            end_pos = self._clock_pos() - WRITER_LAG_SAMPLES
+        if end_pos <= self.read_pos:
+            return
+        capacity = self.caller.capacity
+        if end_pos - self.read_pos > capacity:
+            # The rings have wrapped over audio we never wrote out.
+            skipped = end_pos - capacity - self.read_pos
+            self._dropped(skipped * self._bytes_per_frame())
+            self.read_pos = end_pos - capacity
+        frame_count = end_pos - self.read_pos
+        interleaved = np.empty(frame_count * 2, dtype=np.uint8)
+        interleaved[0::2] = self.caller.take(self.read_pos, end_pos)
+        interleaved[1::2] = self.agent.take(self.read_pos, end_pos)
+        self.read_pos = end_pos
+        payload = ulaw_to_pcm16_array(interleaved).astype("<i2").tobytes() if self.audio_format == "pcm" else interleaved.tobytes()
+        if not budget.take(len(payload)):
+            self._dropped(len(payload))
+            return
+        if self._file is None:
+            self._file = open(self.path, "wb")
+            self._file.write(_wav_header(self.audio_format, 0))
+        self._file.write(payload)
+        self.data_bytes += len(payload)
+        metrics.registry.inc("recording_written_bytes_total", len(payload))
+
+    def _bytes_per_frame(self) -> int:
+        return 4 if self.audio_format == "pcm" else 2
+
+    def _dropped(self, num_bytes: int):
+        self.dropped_bytes += num_bytes
+        metrics.registry.inc("recording_dropped_bytes_total", num_bytes)
+
+    def close(self):
+        """Patches the WAV header with the final sizes."""
+        if self._file is not None:
+            self._file.seek(0)
+            self._file.write(_wav_header(self.audio_format, self.data_bytes))
+            self._file.close()
+            self._file = None
+        self.closed = True
+        if self.dropped_bytes:
+            logging.warning(f"[{self.call_sid}] Recording dropped {self.dropped_bytes} bytes (writer behind or disk budget exhausted).")
+        logging.info(f"[{self.call_sid}] Recording finished: {self.stats()}")
+
+
+class _WriteBudget:
+    """Token bucket over bytes written to disk, shared by all recordings."""
+
+    def __init__(self, bytes_per_s: int):
+        self.rate = bytes_per_s
+        self.tokens = float(bytes_per_s)
+        self.updated = time.monotonic()
+
+    def take(self, num_bytes: int) -> bool:
+        now = time.monotonic()
+        self.tokens = min(float(self.rate), self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < num_bytes:
+            return False
+        self.tokens -= num_bytes
+        return True
+
+
+class Recorder:
+    """Owns the active recordings and the background writer thread."""
+
+    def __init__(self, directory: str = RECORDING_DIR, audio_format: str = RECORDING_FORMAT):
+        self.directory = directory
+        self.audio_format = audio_format if audio_format in ("mulaw", "pcm") else "mulaw"
+        self._active = {}   # call sid -> CallRecording
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread = None
+        self._budget = _WriteBudget(RECORDING_WRITE_BUDGET_BYTES_PER_S)
+        self._rotation = 0
+
+    def start(self):
+        if not RECORDING_ENABLED or (self._thread is not None and self._thread.is_alive()):
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="recording-writer", daemon=True)
+        self._thread.start()
+        logging.info(f"Call recording enabled ({self.audio_format}) in {os.path.abspath(self.directory)}.")
+
+    def stop(self):
+        if self._thread is None:
+            return
+        with self._lock:
+            for recording in self._active.values():
+                recording.finish()
+        self._stop.set()
+        self._thread.join(timeout=10)
+        self._thread = None
+
+    def start_recording(self, call_sid: str) -> CallRecording:
+        """Returns a recording for the call, or None when recording is off (or not running)."""
+        if self._thread is None or not SAFE_CALL_SID.match(call_sid):
+            return None
+        recording = CallRecording(call_sid, self.path_for(call_sid), self.audio_format)
+        with self._lock:
+            self._active[call_sid] = recording
+        return recording
+
+    def path_for(self, call_sid: str) -> str:
+        return os.path.join(self.directory, f"{call_sid}.wav")
+
+    def finished_path(self, call_sid: str) -> str:
+        """Path of a finished recording on disk, or None."""
+        if not SAFE_CALL_SID.match(call_sid):
+            return None
+        path = self.path_for(call_sid)
+        return path if os.path.isfile(path) else None
+
+    def is_recording(self, call_sid: str) -> bool:
+        return call_sid in self._active
+
+    def _run(self):
+        while True:
+            stopping = self._stop.wait(RECORDING_FLUSH_INTERVAL_S)
+            with self._lock:
+                recordings = list(self._active.values())
+            if recordings:
+                # Rotate the starting call so a short budget is not always spent on the same calls.
+                self._rotation = (self._rotation + 1) % len(recordings)
+                recordings = recordings[self._rotation:] + recordings[:self._rotation]
+            for recording in recordings:
+                try:
+                    recording.drain(self._budget)
+                    if recording.finished:
+                        recording.close()
+                except Exception as e:
+                    logging.error(f"[{recording.call_sid}] Recording writer error: {e}", exc_info=True)
+                    recording.finished = True
+                    recording.close()
+                if recording.closed:
+                    with self._lock:
+                        self._active.pop(recording.call_sid, None)
+            if stopping:
+                return
+
+
+recorder = Recorder()
@@ -0,0 +1,113 @@
+from math import gcd
+
+import numpy as np
+
+# Streaming polyphase FIR resampler. One instance is created per call and per
+# direction; it keeps the filter history (and any partial sample) between
+# chunks so consecutive 20 ms frames resample as one continuous signal.
+
+DEFAULT_TAPS_PER_PHASE = 16
+KAISER_BETA = 8.0
+CUTOFF_MARGIN = 0.92
+
+
+def design_lowpass(up: int, down: int, taps_per_phase: int) -> np.ndarray:
+    """Kaiser-windowed sinc lowpass for an up/down rational resampler, with DC gain `up`."""
+    num_taps = taps_per_phase * max(up, down)
+    num_taps += (-num_taps) % up
+    cutoff = CUTOFF_MARGIN * 0.5 / max(up, down)
+    n = np.arange(num_taps) - (num_taps - 1) / 2.0
+    taps = 2 * cutoff * np.sinc(2 * cutoff * n) * np.kaiser(num_taps, KAISER_BETA)
+    return taps * (up / taps.sum())
+
+
+class StreamingResampler:
+    """Resamples a stream of 16-bit mono PCM chunks from `input_rate` to `output_rate`."""
+
+    def __init__(self, input_rate: int, output_rate: int, taps_per_phase: int = DEFAULT_TAPS_PER_PHASE):
+        divisor = gcd(input_rate, output_rate)
+        self.input_rate = input_rate
+        self.output_rate = output_rate
+        self.up = output_rate // divisor
+        self.down = input_rate // divisor
+        self.passthrough = self.up == self.down
+
+        taps = design_lowpass(self.up, self.down, taps_per_phase)
+        # phases[p, j] = taps[p + j * up], stored reversed so each output is a dot product with a forward window.
+        self._phases = np.ascontiguousarray(taps.reshape(-1, self.up).T[:, ::-1], dtype=np.float32)
+        self._taps_per_phase = self._phases.shape[1]
+        self._history_len = self._taps_per_phase - 1
+
+        self._capacity = 0
+        self._work = np.zeros(self._history_len, dtype=np.float32)
+        self._out_f = np.empty(0, dtype=np.float32)
+        self._out_i16 = np.empty(0, dtype=np.int16)
+        self._next_pos = 0  # position of the next output, in 1/up input samples, relative to the next chunk
+        self._pending_byte = b''
+
+    def reset(self):
+        """Clears the filter history, e.g. after a discontinuity in the input stream."""
+        self._work[:self._history_len] = 0
+        self._next_pos = 0
+        self._pending_byte = b''
+
+    def _ensure_capacity(self, num_samples: int):
+        if num_samples <= self._capacity:
+            return
+        capacity = max(num_samples, 2 * self._capacity)
+        work = np.zeros(self._history_len + capacity, dtype=np.float32)
+        work[:self._history_len] = self._work[:self._history_len]
+        self._work = work
+        max_out = (capacity * self.up) // self.down + self.up + 1
+        self._out_f = np.empty(max_out, dtype=np.float32)
+        self._out_i16 = np.empty(max_out, dtype=np.int16)
+        self._capacity = capacity
+
+    def process_array(self, samples: np.ndarray) -> np.ndarray:
+        """Resamples an int16 array. The returned array is a view into an internal buffer; copy it to keep it."""
+        num_in = len(samples)
+        if self.passthrough or num_in == 0:
+            return samples
+        self._ensure_capacity(num_in)
+        hist = self._history_len
+        work = self._work
+        work[hist:hist + num_in] = samples
+        windows = np.lib.stride_tricks.sliding_window_view(work[:hist + num_in], self._taps_per_phase)
+
+        up, down = self.up, self.down
+        if down == 1:
+            num_out = num_in * up
+            np.matmul(windows[:num_in], self._phases.T, out=self._out_f[:num_out].reshape(num_in, up))
+        elif up == 1:
+            start = self._next_pos
+            selected = windows[start:num_in:down]
+            num_out = len(selected)
+            np.matmul(selected, self._phases[0], out=self._out_f[:num_out])
+            self._next_pos = start + num_out * down - num_in
+        else:
+            positions = np.arange(self._next_pos, num_in * up, down)
+            num_out = len(positions)
+            np.einsum('ij,ij->i', windows[positions // up], self._phases[positions % up], out=self._out_f[:num_out])
+            self._next_pos = (positions[-1] + down - num_in * up) if num_out else self._next_pos - num_in * up
+
+        work[:hist] = work[num_in:num_in + hist]
+        out_f = self._out_f[:num_out]
+        np.rint(out_f, out=out_f)
+        np.clip(out_f, -32768, 32767, out=out_f)
+        out = self._out_i16[:num_out]
+        out[:] = out_f
+        return out
+
+    def process(self, pcm_data: bytes) -> bytes:
+        """Resamples little-endian 16-bit PCM bytes, carrying a trailing odd byte over to the next chunk."""
+        if self._pending_byte:
+            pcm_data = self._pending_byte + pcm_data
+            self._pending_byte = b''
+        if len(pcm_data) & 1:
+            self._pending_byte = pcm_data[-1:]
+            pcm_data = pcm_data[:-1]
+        if not pcm_data:
+            return b''
+        if self.passthrough:
+            return bytes(pcm_data)
+        return self.process_array(np.frombuffer(pcm_data, dtype=np.int16)).tobytes()
@@ -1,209 +1,314 @@
 import asyncio
-import base64
+import binascii
 import json
-import os
-import aiohttp 
-import numpy as np
-import soundfile as sf
-from io import BytesIO
 import logging
-import ssl
 from starlette.websockets import WebSocketState, WebSocketDisconnect
 
-DEEPGRAM_API_KEY = os.getenv("DEEPGRAM_API_KEY")
-DEEPGRAM_AGENT_URL = "wss://agent.deepgram.com/agent"
-INPUT_SAMPLE_RATE = 16000
-OUTPUT_SAMPLE_RATE = 24000
-TWILIO_SAMPLE_RATE = 8000
+from services import deepgram_pool
+from services import metrics
+from services import transcoding
+from services import twilio_media
+from services import vad
+from services.call_registry import CallSession
+from services.clip_cache import clip_cache
+from services.conversation_store import conversation_store, CALL_ENDED
+from services.event_hub import event_hub
+from services.deepgram_pool import DEEPGRAM_API_KEY
+from services.jitter_buffer import InboundJitterBuffer
+from services.lazy_imports import lazy_import
+from services.playback import PlaybackQueue
+from services.recorder import recorder
+from services.tenant_store import DEFAULT_TENANT_ID
 
-logging.info(f"Using aiohttp version: {aiohttp.__version__}")
 
+aiohttp = lazy_import("aiohttp")
 
-async def resample_audio(audio_data: bytes, current_rate: int, target_rate: int) -> bytes:
-    """Resamples raw audio data using numpy and soundfile."""
-    if not audio_data: return b''
-    try:
-        audio_np, _ = sf.read(BytesIO(audio_data), dtype='int16', channels=1, samplerate=current_rate, format='RAW', subtype='PCM_16')
-        if current_rate == target_rate: return audio_data
-        num_samples = len(audio_np)
-        target_num_samples = int(num_samples * target_rate / current_rate)
-        if num_samples > 0 and target_num_samples == 0: target_num_samples = 1
-        if target_num_samples == 0: return b''
-        resampled_audio = np.interp(
-            np.linspace(0, num_samples -1 if num_samples > 0 else 0, target_num_samples),
-            np.arange(num_samples), audio_np
-        ).astype(np.int16)
-        output_buffer = BytesIO()
-        sf.write(output_buffer, resampled_audio, target_rate, format='RAW', subtype='PCM_16')
-        return output_buffer.getvalue()
-    except Exception as e:
-        logging.error(f"Error during resampling from {current_rate} to {target_rate}: {e}", exc_info=True)
-        return b''
-
-async def decode_twilio_mulaw(base64_data: str) -> bytes:
-    """Decodes Twilio's base64 Mulaw audio to raw PCM bytes."""
-    if not base64_data: return b''
-    try:
-        mulaw_data = base64.b64decode(base64_data)
-        if not mulaw_data: return b''
-        pcm_data, sr = sf.read(BytesIO(mulaw_data), dtype='int16', channels=1, samplerate=TWILIO_SAMPLE_RATE, format='RAW', subtype='ULAW')
-        output_buffer = BytesIO()
-        sf.write(output_buffer, pcm_data, TWILIO_SAMPLE_RATE, format='RAW', subtype='PCM_16')
-        return output_buffer.getvalue()
-    except sf.SoundFileError as sf_err:
-         logging.error(f"SoundFileError decoding Twilio Mulaw: {sf_err} (Payload Size: {len(base64_data)})", exc_info=False)
-         return b''
-    except Exception as e:
-        logging.error(f"Error decoding Twilio Mulaw: {e}", exc_info=True)
-        return b''
-
-async def encode_to_twilio_mulaw(pcm_data: bytes, sample_rate: int) -> str:
-    """Encodes raw PCM audio bytes (from Deepgram) to base64 Mulaw for Twilio."""
-    if not pcm_data: return ""
-    try:
-        if sample_rate != TWILIO_SAMPLE_RATE:
-            logging.debug(f"Resampling Deepgram output from {sample_rate}Hz to {TWILIO_SAMPLE_RATE}Hz for Twilio")
-            pcm_data = await resample_audio(pcm_data, sample_rate, TWILIO_SAMPLE_RATE)
-            if not pcm_data:
-                logging.error("Resampling Deepgram output failed, returning empty.")
-                return ""
-        audio_np, read_sr = sf.read(BytesIO(pcm_data), dtype='int16', channels=1, samplerate=TWILIO_SAMPLE_RATE, format='RAW', subtype='PCM_16')
-        if read_sr != TWILIO_SAMPLE_RATE:
-             logging.warning(f"Read sample rate {read_sr} != expected {TWILIO_SAMPLE_RATE} before Mulaw encoding.")
-        output_buffer = BytesIO()
-        sf.write(output_buffer, audio_np, TWILIO_SAMPLE_RATE, format='RAW', subtype='ULAW')
-        mulaw_data = output_buffer.getvalue()
-        base64_encoded = base64.b64encode(mulaw_data).decode('utf-8')
-        return base64_encoded
-    except Exception as e:
-        logging.error(f"Error encoding to Twilio Mulaw: {e}", exc_info=True)
-        return ""
-
-
-async def handle_deepgram_connection(twilio_ws, call_sid: str, company_name: str, knowledge_summary: str):
+
+def is_open(websocket) -> bool:
+    """True while both sides of a Starlette WebSocket are connected (we have not sent a close either)."""
+    return websocket.client_state == WebSocketState.CONNECTED and websocket.application_state == WebSocketState.CONNECTED
+
+
+async def handle_deepgram_connection(twilio_ws, call_sid: str, company_name: str, knowledge_summary: str, session: CallSession = None):
     """Handles the connection to Deepgram Agent using aiohttp and bridges audio with Twilio."""
+    session = session or CallSession(call_sid)
     if not DEEPGRAM_API_KEY:
         logging.error(f"[{call_sid}] Error: DEEPGRAM_API_KEY not found.")
-        if twilio_ws.client_state == WebSocketState.CONNECTED:
+        if is_open(twilio_ws):
             await twilio_ws.close(code=1011, reason="Internal configuration error")
         return
 
     logging.info(f"[{call_sid}] Attempting to connect to Deepgram Agent using aiohttp.")
     deepgram_aiohttp_ws = None 
     twilio_stream_sid = "UNKNOWN"
+    media_encoder = twilio_media.MediaFrameEncoder(twilio_stream_sid)
     forward_twilio_task = None
     forward_deepgram_task = None
-    aiohttp_session = None 
+    inbound_lane = None
+    outbound_lane = None
+    playback = None
+    call_metrics = session.call_metrics = metrics.start_call(call_sid)
+    tenant_id = session.tenant_id or DEFAULT_TENANT_ID
 
-    try:
-        aiohttp_session = aiohttp.ClientSession()
+    def record_event(event: dict):
+        conversation_store.record(call_sid, event)
+        event_hub.publish(tenant_id, call_sid, event)
 
-        deepgram_headers = {"Authorization": f"Token {DEEPGRAM_API_KEY}"}
+    record_event({"type": "CallStarted", "tenant_id": session.tenant_id, "company_name": company_name})
 
-        async with aiohttp_session.ws_connect(
-            DEEPGRAM_AGENT_URL,
-            headers=deepgram_headers,
-            # timeout=30.0 
-        ) as dg_ws:
-            deepgram_aiohttp_ws = dg_ws 
+    try:
+        settings = deepgram_pool.build_agent_settings(company_name, knowledge_summary)
+
+        async def open_agent_socket():
+            dg_ws = await deepgram_pool.agent_pool.claim(call_sid, settings)
+            if dg_ws is not None:
+                logging.info(f"[{call_sid}] Claimed pre-warmed Deepgram Agent connection.")
+                return dg_ws
+            dg_ws = await deepgram_pool.connect_agent(settings)
             logging.info(f"[{call_sid}] Successfully connected to Deepgram Agent (aiohttp).")
+            return dg_ws
 
-            agent_instructions = (
-                f"You are an AI voice calling agent named Emma from {company_name or 'our company'}. "
-                f"Your goal is to engage the user, briefly introduce the services based on the following summary, "
-                f"understand their needs, and ultimately try to book a follow-up demo call. "
-                f"Keep responses concise and conversational for a voice call.\n\n"
-                f"Knowledge Summary:\n{knowledge_summary or 'No specific product knowledge provided.'}"
-            )
-            settings = {
-                "type": "SettingsConfiguration", "audio": {"input": {"encoding": "linear16", "sample_rate": INPUT_SAMPLE_RATE}, "output": {"encoding": "linear16", "sample_rate": OUTPUT_SAMPLE_RATE, "container": "none"}},
-                "agent": {"listen": {"model": "nova-2"}, "think": {"provider": {"type": "open_ai"}, "model": "gpt-4o", "instructions": agent_instructions}, "speak": {"model": "aura-asteria-en"}}
-            }
-            await deepgram_aiohttp_ws.send_str(json.dumps(settings))
-            logging.info(f"[{call_sid}] Sent configuration to Deepgram (aiohttp).")
-
-            async def forward_twilio_to_deepgram_task_func():
-                nonlocal twilio_stream_sid
-                """Task to receive audio from Twilio and forward to Deepgram via aiohttp."""
-                while True:
-                    try:
-                        if twilio_ws.client_state != WebSocketState.CONNECTED or deepgram_aiohttp_ws.closed:
-                            logging.warning(f"[{call_sid}] WS state invalid, stopping forward_twilio task. Twilio: {twilio_ws.client_state}, Deepgram Closed: {deepgram_aiohttp_ws.closed}")
-                            break
-                        message = await twilio_ws.receive_text()
-                        data = json.loads(message)
-                        event = data.get('event')
-                        if event == 'start':
-                            twilio_stream_sid = data.get('streamSid', 'UNKNOWN')
-                            logging.info(f"[{call_sid}] Twilio Stream Started: {twilio_stream_sid}")
-                        elif event == 'media':
-                            payload = data.get('media', {}).get('payload')
-                            if not payload: continue
-                            pcm_8k_data = await decode_twilio_mulaw(payload)
-                            if pcm_8k_data:
-                                pcm_16k_data = await resample_audio(pcm_8k_data, TWILIO_SAMPLE_RATE, INPUT_SAMPLE_RATE)
-                                if pcm_16k_data and not deepgram_aiohttp_ws.closed:
-                                    
-                                    await deepgram_aiohttp_ws.send_bytes(pcm_16k_data)
-                        elif event == 'stop':
-                            logging.info(f"[{call_sid}] Twilio Stream Stopped.")
-                            break
-                        elif event == 'mark':
-                             logging.info(f"[{call_sid}] Received Twilio Mark: {data.get('mark', {}).get('name')}")
-                    except WebSocketDisconnect:
-                         logging.info(f"[{call_sid}] Twilio WebSocket disconnected (forward_twilio task).")
-                         break
-                    except json.JSONDecodeError as e:
-                        logging.error(f"[{call_sid}] Error decoding JSON from Twilio: {e} - Message: {message[:100]}...")
-                    except Exception as e: 
-                        logging.error(f"[{call_sid}] Error in forward_twilio task (aiohttp): {e}", exc_info=True)
-                        break
-                if not deepgram_aiohttp_ws.closed:
-                     logging.info(f"[{call_sid}] forward_twilio task ending, closing Deepgram WS (aiohttp).")
-                     await deepgram_aiohttp_ws.close()
-
-            async def forward_deepgram_to_twilio_task_func():
-                """Task to receive audio from Deepgram via aiohttp and forward to Twilio."""
-                while True:
-                    try:
-                        if deepgram_aiohttp_ws.closed or twilio_ws.client_state != WebSocketState.CONNECTED:
-                             logging.warning(f"[{call_sid}] WS state invalid, stopping forward_deepgram task. Deepgram Closed: {deepgram_aiohttp_ws.closed}, Twilio: {twilio_ws.client_state}")
-                             break
-
-                        msg = await deepgram_aiohttp_ws.receive()
-
-                        if msg.type == aiohttp.WSMsgType.BINARY:
-                             if not msg.data: continue
-                             base64_mulaw_output = await encode_to_twilio_mulaw(msg.data, OUTPUT_SAMPLE_RATE)
-                             if base64_mulaw_output and twilio_ws.client_state == WebSocketState.CONNECTED:
-                                 await twilio_ws.send_text(json.dumps({
-                                     "event": "media", "streamSid": twilio_stream_sid,
-                                     "media": {"payload": base64_mulaw_output}
-                                 }))
-                        elif msg.type == aiohttp.WSMsgType.TEXT:
-                            try:
-                                dg_data = json.loads(msg.data)
-                                logging.info(f"[{call_sid}] Deepgram Text (aiohttp): {json.dumps(dg_data)}")
-                            except json.JSONDecodeError:
-                                 logging.warning(f"[{call_sid}] Received non-JSON text from Deepgram (aiohttp): {msg.data[:100]}")
-                        elif msg.type == aiohttp.WSMsgType.CLOSED:
-                             logging.info(f"[{call_sid}] Deepgram WebSocket closed message received (aiohttp).")
-                             break 
-                        elif msg.type == aiohttp.WSMsgType.ERROR:
-                             logging.error(f"[{call_sid}] Deepgram WebSocket error message received (aiohttp): {deepgram_aiohttp_ws.exception()}")
-                             break 
-                    except WebSocketDisconnect:
-                        logging.warning(f"[{call_sid}] Twilio connection closed during send in forward_deepgram task (aiohttp).")
+        # The agent connects while the Twilio stream starts, so the connect clip covers the handshake.
+        agent_task = asyncio.create_task(open_agent_socket(), name=f"agent-connect-{call_sid}")
+        agent_backlog = []   # inbound PCM produced before the agent socket is ready (bounded by the connect timeouts)
+
+        def agent_closed() -> bool:
+            return deepgram_aiohttp_ws is not None and deepgram_aiohttp_ws.closed
+
+        async def send_to_deepgram(pcm_16k_data: bytes):
+            if pcm_16k_data and deepgram_aiohttp_ws is None:
+                agent_backlog.append(pcm_16k_data)
+            elif pcm_16k_data and not deepgram_aiohttp_ws.closed:
+                call_metrics.dg_messages_out += 1
+                call_metrics.dg_bytes_out += len(pcm_16k_data)
+                if not call_metrics.enabled:
+                    await deepgram_aiohttp_ws.send_bytes(pcm_16k_data)
+                    return
+                started = metrics.clock()
+                await deepgram_aiohttp_ws.send_bytes(pcm_16k_data)
+                call_metrics.observe_stage("deepgram_send", metrics.clock() - started)
+
+        async def send_media_to_twilio(mulaw_frame: bytes, from_clip: bool = False):
+            if is_open(twilio_ws):
+                started = metrics.clock() if call_metrics.enabled else 0.0
+                await twilio_ws.send_text(media_encoder.encode(mulaw_frame))
+                call_metrics.audio_sent(len(mulaw_frame), clip=from_clip)
+                if session.recording is not None:
+                    session.recording.outbound(mulaw_frame)
+                if started:
+                    call_metrics.observe_stage("twilio_send", metrics.clock() - started)
+
+        async def send_mark_to_twilio(mark_name: str):
+            if is_open(twilio_ws):
+                await twilio_ws.send_text(json.dumps({"event": "mark", "streamSid": twilio_stream_sid, "mark": {"name": mark_name}}))
+
+        async def send_clear_to_twilio():
+            if is_open(twilio_ws):
+                await twilio_ws.send_text(json.dumps({"event": "clear", "streamSid": twilio_stream_sid}))
+
+        playback = session.playback = PlaybackQueue(send_media_to_twilio, send_mark_to_twilio, send_clear_to_twilio, name=call_sid)
+
+        async def queue_for_playback(mulaw_data: bytes):
+            playback.enqueue(mulaw_data)
+
+        def make_transcode_observer(direction: str):
+            if not call_metrics.enabled:
+                return None
+            def observe_transcode(transcoder, job_seconds: float):
+                call_metrics.observe_stage(f"transcode_{direction}", job_seconds)
+                for stage, seconds in transcoder.timings:
+                    call_metrics.observe_stage(stage, seconds)
+            return observe_transcode
+
+        executor = transcoding.get_executor()
+        inbound_lane = session.inbound_lane = transcoding.TranscodeLane(
+            executor, transcoding.InboundTranscoder(timed=call_metrics.enabled), send_to_deepgram,
+            name=f"{call_sid}-in", observer=make_transcode_observer("in")
+        )
+        jitter_buffer = session.jitter_buffer = InboundJitterBuffer()
+        outbound_lane = session.outbound_lane = transcoding.TranscodeLane(
+            executor, transcoding.OutboundTranscoder(timed=call_metrics.enabled), queue_for_playback,
+            name=f"{call_sid}-out", observer=make_transcode_observer("out")
+        )
+        inbound_vad = session.vad = vad.InboundVad() if vad.VAD_ENABLED else None
+
+        async def submit_inbound(mulaw_batch: bytes):
+            if inbound_vad is not None:
+                kind, audio = inbound_vad.process(mulaw_batch)
+                if kind == vad.SILENCE:
+                    # Silence skips transcoding; it is only worth sending when no speech is queued or being transcoded ahead of it.
+                    if inbound_lane.unfinished == 0:
+                        await send_to_deepgram(audio)
+                    return
+                if kind == vad.KEEPALIVE:
+                    if deepgram_aiohttp_ws is not None and not deepgram_aiohttp_ws.closed:
+                        await deepgram_aiohttp_ws.send_str(deepgram_pool.KEEPALIVE_MESSAGE)
+                    return
+                if kind is None:
+                    return
+                mulaw_batch = audio
+            call_metrics.observe_queue("inbound_lane", inbound_lane.pending)
+            await inbound_lane.submit(mulaw_batch)
+
+        async def on_inbound_media(sequence_number: int, timestamp: int, mulaw_frame: bytes):
+            call_metrics.frames_in += 1
+            call_metrics.bytes_in += len(mulaw_frame)
+            inbound_batch = jitter_buffer.push(sequence_number or jitter_buffer.frames_in + 1, timestamp, mulaw_frame)
+            if inbound_batch:
+                if session.recording is not None:
+                    session.recording.inbound(inbound_batch)
+                await submit_inbound(inbound_batch)
+
+        async def forward_twilio_to_deepgram_task_func():
+            nonlocal twilio_stream_sid, media_encoder
+            """Task to receive audio from Twilio and forward to Deepgram via aiohttp."""
+            while True:
+                try:
+                    if not is_open(twilio_ws) or agent_closed():
+                        logging.warning(f"[{call_sid}] WS state invalid, stopping forward_twilio task. Twilio: {twilio_ws.client_state}, Deepgram Closed: {agent_closed()}")
                         break
-                    except Exception as e: 
-                        logging.error(f"[{call_sid}] Error in forward_deepgram task (aiohttp): {e}", exc_info=True)
+                    message = await twilio_ws.receive_text()
+                    media = twilio_media.parse_media(message)
+                    if media is not None:
+                        if media[2]:
+                            await on_inbound_media(*media)
+                        continue
+                    data = json.loads(message)
+                    event = data.get('event')
+                    if event == 'start':
+                        twilio_stream_sid = session.stream_sid = data.get('streamSid', 'UNKNOWN')
+                        media_encoder = twilio_media.MediaFrameEncoder(twilio_stream_sid)
+                        session.state = "active"
+                        session.recording = recorder.start_recording(call_sid)
+                        logging.info(f"[{call_sid}] Twilio Stream Started: {twilio_stream_sid}")
+                        playback.start()
+                        if connect_clip and playback.play_clip(connect_clip):
+                            logging.info(f"[{call_sid}] Playing connect clip ({len(connect_clip)} frames) until the agent speaks.")
+                    elif event == 'media':
+                        # Only media messages the fast path could not read get here.
+                        metrics.registry.inc("twilio_media_slow_path_total")
+                        media = data.get('media', {})
+                        payload = media.get('payload')
+                        if not payload: continue
+                        await on_inbound_media(int(data.get('sequenceNumber') or 0), int(media.get('timestamp') or 0), binascii.a2b_base64(payload))
+                    elif event == 'stop':
+                        logging.info(f"[{call_sid}] Twilio Stream Stopped.")
+                        session.state = "ending"
                         break
-                if twilio_ws.client_state == WebSocketState.CONNECTED:
-                    logging.info(f"[{call_sid}] forward_deepgram task ending, closing Twilio WS.")
-                    await twilio_ws.close()
+                    elif event == 'mark':
+                         mark_name = data.get('mark', {}).get('name')
+                         playback.on_mark(mark_name)
+                         logging.info(f"[{call_sid}] Received Twilio Mark: {mark_name}")
+                except WebSocketDisconnect:
+                     logging.info(f"[{call_sid}] Twilio WebSocket disconnected (forward_twilio task).")
+                     break
+                except json.JSONDecodeError as e:
+                    logging.error(f"[{call_sid}] Error decoding JSON from Twilio: {e} - Message: {message[:100]}...")
+                except Exception as e: 
+                    logging.error(f"[{call_sid}] Error in forward_twilio task (aiohttp): {e}", exc_info=True)
+                    break
+            try:
+                remaining_audio = jitter_buffer.flush()
+                if remaining_audio and session.recording is not None:
+                    session.recording.inbound(remaining_audio)
+                if remaining_audio and not agent_closed():
+                    await submit_inbound(remaining_audio)
+                if inbound_vad is not None and not agent_closed():
+                    remaining_audio = inbound_vad.flush()
+                    if remaining_audio:
+                        await inbound_lane.submit(remaining_audio)
+                await inbound_lane.close()
+            except Exception as e:
+                logging.warning(f"[{call_sid}] Could not flush buffered inbound audio: {e}")
+            if inbound_vad is not None:
+                vad_stats = inbound_vad.stats()
+                metrics.registry.inc("inbound_vad_frames_total", vad_stats["speech_frames"], labels=(("decision", "speech"),))
+                metrics.registry.inc("inbound_vad_frames_total", vad_stats["silence_frames"], labels=(("decision", "silence"),))
+                logging.info(f"[{call_sid}] Inbound VAD stats: {vad_stats}")
+            logging.info(f"[{call_sid}] Inbound jitter buffer stats: {jitter_buffer.stats()}")
+            if deepgram_aiohttp_ws is not None and not deepgram_aiohttp_ws.closed:
+                 logging.info(f"[{call_sid}] forward_twilio task ending, closing Deepgram WS (aiohttp).")
+                 await deepgram_aiohttp_ws.close()
+
+        async def forward_deepgram_to_twilio_task_func():
+            """Task to receive audio from Deepgram via aiohttp and forward to Twilio."""
+            while True:
+                try:
+                    if deepgram_aiohttp_ws.closed or not is_open(twilio_ws):
+                         logging.warning(f"[{call_sid}] WS state invalid, stopping forward_deepgram task. Deepgram Closed: {deepgram_aiohttp_ws.closed}, Twilio: {twilio_ws.client_state}")
+                         break
+
+                    msg = await deepgram_aiohttp_ws.receive()
 
+                    if msg.type == aiohttp.WSMsgType.BINARY:
+                         if not msg.data: continue
+                         call_metrics.dg_messages_in += 1
+                         call_metrics.dg_bytes_in += len(msg.data)
+                         call_metrics.agent_audio_received()
+                         call_metrics.observe_queue("outbound_lane", outbound_lane.pending)
+                         call_metrics.observe_queue("playback", playback.queued_frames)
+                         await outbound_lane.submit(msg.data)
+                    elif msg.type == aiohttp.WSMsgType.TEXT:
+                        try:
+                            dg_data = json.loads(msg.data)
+                        except json.JSONDecodeError:
+                             logging.warning(f"[{call_sid}] Received non-JSON text from Deepgram (aiohttp): {msg.data[:100]}")
+                             continue
+                        dg_event = dg_data.get('type')
+                        if dg_event == 'UserStartedSpeaking':
+                            dg_data['interrupted_agent'] = bool(playback.queued_frames or playback.pending_marks)
+                            record_event(dg_data)
+                            outbound_lane.discard_pending()
+                            await outbound_lane.drain()
+                            await playback.barge_in()
+                            continue
+                        record_event(dg_data)
+                        if dg_event == 'ConversationText' and dg_data.get('role') == 'user':
+                            call_metrics.user_turn_ended()
+                        elif dg_event == 'AgentAudioDone':
+                            await outbound_lane.drain()
+                            playback.end_utterance()
+                        elif dg_event in ('Error', 'Warning'):
+                            logging.warning(f"[{call_sid}] Deepgram {dg_event}: {msg.data[:300]}")
+                    elif msg.type == aiohttp.WSMsgType.CLOSED:
+                         logging.info(f"[{call_sid}] Deepgram WebSocket closed message received (aiohttp).")
+                         break 
+                    elif msg.type == aiohttp.WSMsgType.ERROR:
+                         logging.error(f"[{call_sid}] Deepgram WebSocket error message received (aiohttp): {deepgram_aiohttp_ws.exception()}")
+                         break 
+                except WebSocketDisconnect:
+                    logging.warning(f"[{call_sid}] Twilio connection closed during send in forward_deepgram task (aiohttp).")
+                    break
+                except Exception as e: 
+                    logging.error(f"[{call_sid}] Error in forward_deepgram task (aiohttp): {e}", exc_info=True)
+                    break
+            await outbound_lane.close()
+            await playback.close()
+            logging.info(f"[{call_sid}] Outbound playback stats: {playback.stats()}")
+            if is_open(twilio_ws):
+                logging.info(f"[{call_sid}] forward_deepgram task ending, closing Twilio WS.")
+                await twilio_ws.close()
 
-            forward_twilio_task = asyncio.create_task(forward_twilio_to_deepgram_task_func())
+
+        connect_clip = await clip_cache.connect_clip(tenant_id)
+        forward_twilio_task = asyncio.create_task(forward_twilio_to_deepgram_task_func())
+        await asyncio.wait((agent_task, forward_twilio_task), return_when=asyncio.FIRST_COMPLETED)
+        if not agent_task.done():
+            logging.info(f"[{call_sid}] Twilio stream ended before the agent connected.")
+            agent_task.cancel()
+            return
+        dg_ws = agent_task.result()
+        async with dg_ws:
+            # Send what the caller said while connecting, then switch to sending directly (no await in between).
+            while agent_backlog and not dg_ws.closed:
+                pcm_16k_data = agent_backlog.pop(0)
+                call_metrics.dg_messages_out += 1
+                call_metrics.dg_bytes_out += len(pcm_16k_data)
+                await dg_ws.send_bytes(pcm_16k_data)
+            agent_backlog.clear()
+            deepgram_aiohttp_ws = dg_ws
+            if forward_twilio_task.done():
+                return
             forward_deepgram_task = asyncio.create_task(forward_deepgram_to_twilio_task_func())
             await asyncio.gather(forward_twilio_task, forward_deepgram_task)
             logging.info(f"[{call_sid}] Both forwarding tasks finished (aiohttp).")
@@ -211,33 +316,38 @@ async def handle_deepgram_connection(twilio_ws, call_sid: str, company_name: str
     # --- Exception Handling ---
     except aiohttp.ClientConnectionError as e: 
          logging.error(f"[{call_sid}] aiohttp failed to connect to Deepgram: {e}", exc_info=True)
-         if twilio_ws.client_state == WebSocketState.CONNECTED:
+         if is_open(twilio_ws):
              await twilio_ws.close(code=1011, reason="Failed to connect to AI Agent")
     except aiohttp.WSServerHandshakeError as e: 
         logging.error(f"[{call_sid}] aiohttp Deepgram handshake error (check API key?): {e}", exc_info=True)
-        if twilio_ws.client_state == WebSocketState.CONNECTED:
+        if is_open(twilio_ws):
             await twilio_ws.close(code=1011, reason="AI Agent authentication error")
     except Exception as e: 
         logging.error(f"[{call_sid}] Unexpected error in handle_deepgram_connection (aiohttp): {e}", exc_info=True)
-        if twilio_ws.client_state == WebSocketState.CONNECTED:
+        if is_open(twilio_ws):
             await twilio_ws.close(code=1011, reason="Unexpected agent error")
 
 
     finally:
         logging.info(f"[{call_sid}] Cleaning up Deepgram connection handler (aiohttp).")
+        session.state = "ending"
         if forward_twilio_task and not forward_twilio_task.done():
              forward_twilio_task.cancel()
              logging.info(f"[{call_sid}] Cancelled forward_twilio task.")
         if forward_deepgram_task and not forward_deepgram_task.done():
              forward_deepgram_task.cancel()
              logging.info(f"[{call_sid}] Cancelled forward_deepgram task.")
+        if inbound_lane: inbound_lane.cancel()
+        if outbound_lane: outbound_lane.cancel()
+        if playback: await playback.close()
+        if session.recording is not None:
+            session.recording.finish()
+        call_summary = call_metrics.finish()
+        if call_metrics.enabled:
+            logging.info(f"[{call_sid}] Call metrics summary: {json.dumps(call_summary)}")
+        record_event({"type": CALL_ENDED, "duration_s": round(session.duration_s, 1), "metrics": call_summary})
 
-        if aiohttp_session and not aiohttp_session.closed:
-            logging.info(f"[{call_sid}] Closing aiohttp ClientSession.")
-            await aiohttp_session.close()
-
-
-        if twilio_ws.client_state == WebSocketState.CONNECTED:
+        if is_open(twilio_ws):
             logging.info(f"[{call_sid}] Closing Twilio WS in finally block (aiohttp handler).")
             try: await twilio_ws.close(code=1000, reason="Handler finished cleanup")
             except Exception as close_exc: logging.warning(f"[{call_sid}] Exception during final Twilio WS close: {close_exc}")
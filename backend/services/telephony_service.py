@@ -1,6 +1,8 @@
+import asyncio
+import logging
 import os
-from twilio.rest import Client
-from twilio.twiml.voice_response import VoiceResponse, Connect
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -9,16 +11,37 @@ ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID")
 AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
 TWILIO_NUMBER = os.getenv("TWILIO_PHONE_NUMBER")
 PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL") 
+TWILIO_API_WORKERS = int(os.getenv("TWILIO_API_WORKERS", "8"))
 
-if ACCOUNT_SID and AUTH_TOKEN:
-    client = Client(ACCOUNT_SID, AUTH_TOKEN)
-    print("Twilio Client Initialized.")
-else:
-    client = None
-    print("Warning: Twilio credentials missing in .env file.")
+# The Twilio REST client is synchronous; calls are placed on this pool so the event loop never waits on Twilio.
+_api_executor = ThreadPoolExecutor(max_workers=TWILIO_API_WORKERS, thread_name_prefix="twilio-api")
+
+# The twilio SDK is heavy to import, so it is loaded (and the client built) by init_client(),
+# which the app's startup warm-up runs on a worker thread rather than at import time.
+client = None
+_client_lock = threading.Lock()
+_client_initialized = False
+
+
+def init_client():
+    """Imports the twilio SDK and builds the REST client. Blocking; safe to call more than once."""
+    global client, _client_initialized
+    with _client_lock:
+        if _client_initialized:
+            return client
+        from twilio.rest import Client
+        import twilio.twiml.voice_response  # noqa: F401  (used per call by create_connect_stream_twiml)
+        if ACCOUNT_SID and AUTH_TOKEN:
+            client = Client(ACCOUNT_SID, AUTH_TOKEN)
+            logging.info("Twilio Client Initialized.")
+        else:
+            logging.warning("Twilio credentials missing in .env file.")
+        _client_initialized = True
+        return client
 
 def create_connect_stream_twiml(websocket_url: str) -> str:
     """Generates TwiML to connect the call to a WebSocket stream."""
+    from twilio.twiml.voice_response import VoiceResponse, Connect
     response = VoiceResponse()
     connect = Connect()
     connect.stream(url=websocket_url)
@@ -28,11 +51,12 @@ def create_connect_stream_twiml(websocket_url: str) -> str:
     response.pause(length=15)
     response.say("Sorry, I couldn't connect to the agent. Please try again later. Goodbye.")
     response.hangup()
-    print(f"Generated TwiML for <Connect><Stream> to {websocket_url}:\n{str(response)}")
+    logging.info(f"Generated TwiML for <Connect><Stream> to {websocket_url}:\n{str(response)}")
     return str(response)
 
 def make_call(destination_number: str, call_sid_placeholder: str):
     """Initiates a call that will connect to our backend WebSocket stream."""
+    client = init_client()
     if not client:
         return {"error": "Twilio client not initialized. Check credentials in .env file."}
     if not TWILIO_NUMBER:
@@ -40,7 +64,7 @@ def make_call(destination_number: str, call_sid_placeholder: str):
     if not destination_number:
         return {"error": "Destination phone number is required."}
     if not PUBLIC_BASE_URL or "mycustomname.loca.lt" in PUBLIC_BASE_URL:
-         print(f"Warning: PUBLIC_BASE_URL might be a placeholder or default: {PUBLIC_BASE_URL}")
+         logging.warning(f"PUBLIC_BASE_URL might be a placeholder or default: {PUBLIC_BASE_URL}")
 
 
     backend_websocket_url = f"wss://{PUBLIC_BASE_URL.split('//')[1]}/ws/call/{call_sid_placeholder}"
@@ -48,17 +72,19 @@ def make_call(destination_number: str, call_sid_placeholder: str):
     initial_twiml_fetch_url = f"{PUBLIC_BASE_URL}/handle_call_start/{call_sid_placeholder}"
 
     try:
-        print(f"Attempting to call {destination_number} from {TWILIO_NUMBER}")
-        print(f"Twilio will fetch initial TwiML from: {initial_twiml_fetch_url}")
+        logging.info(f"Attempting to call {destination_number} from {TWILIO_NUMBER}")
+        logging.info(f"Twilio will fetch initial TwiML from: {initial_twiml_fetch_url}")
 
         call = client.calls.create(
             to=destination_number,
             from_=TWILIO_NUMBER,
             url=initial_twiml_fetch_url,
-            record=False
+            record=False,
+            status_callback=f"{PUBLIC_BASE_URL}/call_status",
+            status_callback_event=["completed"]
         )
 
-        print(f"Call initiated successfully. Actual Call SID: {call.sid}")
+        logging.info(f"Call initiated successfully. Actual Call SID: {call.sid}")
         return {
             "success": True,
             "message": f"Call initiated to {destination_number}",
@@ -67,5 +93,11 @@ def make_call(destination_number: str, call_sid_placeholder: str):
 
     except Exception as e:
         error_message = f"Twilio call initiation failed: {str(e)}"
-        print(error_message)
-        return {"error": error_message}
\ No newline at end of file
+        logging.error(error_message)
+        return {"error": error_message}
+
+
+async def make_call_async(destination_number: str, call_sid_placeholder: str):
+    """Runs make_call on the Twilio API worker pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_api_executor, make_call, destination_number, call_sid_placeholder)
@@ -0,0 +1,276 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from services.knowledge_index import KnowledgeIndex
+
+# Tenant-keyed configuration shared by every worker process on a node. SQLite
+# (WAL mode) is the durable store; each process keeps a read-through cache of
+# TenantConfig objects. Every write bumps the tenant's version, and a process
+# notices other processes' commits through `PRAGMA data_version`, which costs no
+# page reads. So calls are served from memory and only a changed tenant is
+# reloaded. Knowledge indexes are synced per document revision, so a reload
+# re-indexes only the documents that actually changed. A reload is built on a
+# copy of the cached config and swapped in when done, so calls already holding
+# the old config keep a consistent index; get_async() does that work on a thread.
+
+TENANT_DB_PATH = os.getenv("TENANT_DB_PATH", "tenant_config.db")
+TENANT_CACHE_CHECK_S = float(os.getenv("TENANT_CACHE_CHECK_S", "1.0"))
+TENANT_CALL_TTL_S = float(os.getenv("TENANT_CALL_TTL_S", str(24 * 3600)))
+DEFAULT_TENANT_ID = os.getenv("DEFAULT_TENANT_ID", "default")
+DEFAULT_COMPANY_NAME = "Default AI Services Inc."
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tenants (
+    tenant_id TEXT PRIMARY KEY,
+    company_name TEXT,
+    version INTEGER NOT NULL DEFAULT 1,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS knowledge_documents (
+    tenant_id TEXT NOT NULL,
+    document_id TEXT NOT NULL,
+    text TEXT NOT NULL,
+    revision INTEGER NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (tenant_id, document_id)
+);
+CREATE TABLE IF NOT EXISTS calls (
+    call_sid TEXT PRIMARY KEY,
+    tenant_id TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS campaign_calls (
+    call_sid TEXT PRIMARY KEY,
+    created_at REAL NOT NULL,
+    final_status TEXT
+);
+"""
+
+
+class TenantConfig:
+    __slots__ = ("tenant_id", "company_name", "version", "knowledge", "document_revisions", "stale")
+
+    def __init__(self, tenant_id: str):
+        self.tenant_id = tenant_id
+        self.company_name = DEFAULT_COMPANY_NAME
+        self.version = 0
+        self.knowledge = KnowledgeIndex()
+        self.document_revisions = {}  # document id -> revision currently in `knowledge`
+        self.stale = True
+
+    def agent_context(self) -> str:
+        return self.knowledge.agent_context(self.company_name)
+
+    def copy(self) -> "TenantConfig":
+        clone = TenantConfig(self.tenant_id)
+        clone.company_name = self.company_name
+        clone.version = self.version
+        clone.knowledge = self.knowledge.copy()
+        clone.document_revisions = dict(self.document_revisions)
+        return clone
+
+
+class TenantStore:
+    """SQLite-backed tenant config with an in-process, version-checked cache."""
+
+    def __init__(self, path: str = TENANT_DB_PATH):
+        self.path = path
+        self._conn: sqlite3.Connection = None
+        self._lock = threading.Lock()
+        self._cache = {}           # tenant id -> TenantConfig
+        self._calls = {}           # call sid -> tenant id, for calls placed or seen by this process
+        self._data_version = None
+        self._checked_at = 0.0
+
+    def open(self):
+        if self._conn is not None:
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        conn.execute("DELETE FROM calls WHERE created_at < ?", (time.time() - TENANT_CALL_TTL_S,))
+        conn.execute("DELETE FROM campaign_calls WHERE created_at < ?", (time.time() - TENANT_CALL_TTL_S,))
+        self._conn = conn
+        logging.info(f"Tenant store opened at {os.path.abspath(self.path)}.")
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.open()
+        return self._conn
+
+    def _check_for_changes(self):
+        """Marks cached tenants stale when another process has committed a newer version."""
+        now = time.monotonic()
+        if now - self._checked_at < TENANT_CACHE_CHECK_S:
+            return
+        self._checked_at = now
+        conn = self._db()
+        data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self._data_version:
+            return
+        self._data_version = data_version
+        versions = dict(conn.execute("SELECT tenant_id, version FROM tenants"))
+        for tenant_id, config in self._cache.items():
+            if versions.get(tenant_id, 0) != config.version:
+                config.stale = True
+
+    def _load(self, config: TenantConfig):
+        """Brings an unpublished config up to date. Only the SQLite reads hold the lock; indexing does not."""
+        with self._lock:
+            conn = self._db()
+            row = conn.execute("SELECT company_name, version FROM tenants WHERE tenant_id = ?", (config.tenant_id,)).fetchone()
+            revisions = dict(conn.execute("SELECT document_id, revision FROM knowledge_documents WHERE tenant_id = ?", (config.tenant_id,)))
+            changed = {}
+            for document_id, revision in revisions.items():
+                if config.document_revisions.get(document_id) != revision:
+                    changed[document_id] = conn.execute(
+                        "SELECT text FROM knowledge_documents WHERE tenant_id = ? AND document_id = ?", (config.tenant_id, document_id)
+                    ).fetchone()[0]
+        if row is not None:
+            config.company_name = row[0] or DEFAULT_COMPANY_NAME
+            config.version = row[1]
+        for document_id in set(config.document_revisions) - set(revisions):
+            config.knowledge.remove_document(document_id)
+            del config.document_revisions[document_id]
+        for document_id, text in changed.items():
+            config.knowledge.add_document(document_id, text)
+            config.document_revisions[document_id] = revisions[document_id]
+        config.stale = False
+
+    def _reload(self, tenant_id: str) -> TenantConfig:
+        """Loads a stale tenant into a fresh copy and publishes it. Blocking; call without holding the lock."""
+        with self._lock:
+            config = self._cache.get(tenant_id)
+            if config is not None and not config.stale:
+                return config   # reloaded by another caller meanwhile
+        fresh = config.copy() if config is not None else TenantConfig(tenant_id)
+        self._load(fresh)
+        with self._lock:
+            row = self._db().execute("SELECT version FROM tenants WHERE tenant_id = ?", (tenant_id,)).fetchone()
+            # A write that landed while we were indexing leaves the new config stale, to be reloaded next time.
+            fresh.stale = (row[0] if row else 0) != fresh.version
+            self._cache[tenant_id] = fresh
+        return fresh
+
+    def _cached(self, tenant_id: str) -> TenantConfig:
+        """The cached config if it is current, else None. Only checks versions, never loads."""
+        with self._lock:
+            self._check_for_changes()
+            config = self._cache.get(tenant_id)
+            return config if config is not None and not config.stale else None
+
+    def get(self, tenant_id: str = DEFAULT_TENANT_ID) -> TenantConfig:
+        """Returns the tenant's config, reloading it only if its version changed. Blocking; see get_async()."""
+        return self._cached(tenant_id) or self._reload(tenant_id)
+
+    async def get_async(self, tenant_id: str = DEFAULT_TENANT_ID) -> TenantConfig:
+        """Like get(), but a reload (SQLite reads and re-indexing) runs off the event loop."""
+        return self._cached(tenant_id) or await asyncio.to_thread(self._reload, tenant_id)
+
+    def _bump_version(self, conn: sqlite3.Connection, tenant_id: str, company_name: str = None):
+        conn.execute(
+            "INSERT INTO tenants (tenant_id, company_name, version, updated_at) VALUES (?, ?, 1, ?) "
+            "ON CONFLICT(tenant_id) DO UPDATE SET version = version + 1, updated_at = excluded.updated_at, "
+            "company_name = COALESCE(excluded.company_name, company_name)",
+            (tenant_id, company_name, time.time()),
+        )
+        return conn.execute("SELECT version FROM tenants WHERE tenant_id = ?", (tenant_id,)).fetchone()[0]
+
+    def set_company_name(self, tenant_id: str, company_name: str):
+        with self._lock:
+            conn = self._db()
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                self._bump_version(conn, tenant_id, company_name)
+            self._invalidate(tenant_id)
+
+    def put_document(self, tenant_id: str, document_id: str, text: str):
+        """Stores (or replaces) one knowledge document of a tenant."""
+        with self._lock:
+            conn = self._db()
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                version = self._bump_version(conn, tenant_id)
+                conn.execute(
+                    "INSERT OR REPLACE INTO knowledge_documents (tenant_id, document_id, text, revision, updated_at) VALUES (?, ?, ?, ?, ?)",
+                    (tenant_id, document_id, text, version, time.time()),
+                )
+            self._invalidate(tenant_id)
+
+    def latest_document_text(self, tenant_id: str) -> str:
+        with self._lock:
+            row = self._db().execute(
+                "SELECT text FROM knowledge_documents WHERE tenant_id = ? ORDER BY updated_at DESC LIMIT 1", (tenant_id,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def _invalidate(self, tenant_id: str):
+        config = self._cache.get(tenant_id)
+        if config is not None:
+            config.stale = True
+
+    def record_call(self, call_sid: str, tenant_id: str):
+        """Remembers which tenant a call belongs to, for whichever worker receives its media stream."""
+        with self._lock:
+            self._calls[call_sid] = tenant_id
+            self._db().execute(
+                "INSERT OR REPLACE INTO calls (call_sid, tenant_id, created_at) VALUES (?, ?, ?)", (call_sid, tenant_id, time.time())
+            )
+
+    def forget_call(self, call_sid: str):
+        with self._lock:
+            self._calls.pop(call_sid, None)
+
+    def track_campaign_call(self, call_sid: str):
+        """Marks a call as owned by a campaign, so other workers report its outcome here."""
+        with self._lock:
+            self._db().execute(
+                "INSERT OR REPLACE INTO campaign_calls (call_sid, created_at, final_status) VALUES (?, ?, NULL)", (call_sid, time.time())
+            )
+
+    def report_campaign_outcome(self, call_sid: str, call_status: str) -> bool:
+        """Records the final status of another worker's campaign call (first report wins). False if it is not one."""
+        with self._lock:
+            cursor = self._db().execute(
+                "UPDATE campaign_calls SET final_status = ? WHERE call_sid = ? AND final_status IS NULL", (call_status, call_sid)
+            )
+        return cursor.rowcount > 0
+
+    def take_campaign_outcomes(self, call_sids) -> dict:
+        """Final statuses reported for any of `call_sids`, removed from the store. {call sid: status}"""
+        with self._lock:
+            conn = self._db()
+            rows = conn.execute("SELECT call_sid, final_status FROM campaign_calls WHERE final_status IS NOT NULL").fetchall()
+            outcomes = {call_sid: status for call_sid, status in rows if call_sid in call_sids}
+            if outcomes:
+                conn.executemany("DELETE FROM campaign_calls WHERE call_sid = ?", [(call_sid,) for call_sid in outcomes])
+        return outcomes
+
+    def forget_campaign_call(self, call_sid: str):
+        with self._lock:
+            self._db().execute("DELETE FROM campaign_calls WHERE call_sid = ?", (call_sid,))
+
+    def tenant_for_call(self, call_sid: str) -> str:
+        """The call's tenant; local map first, then the shared store. Unknown calls belong to the default tenant."""
+        tenant_id = self._calls.get(call_sid)
+        if tenant_id is not None:
+            return tenant_id
+        with self._lock:
+            row = self._db().execute("SELECT tenant_id FROM calls WHERE call_sid = ?", (call_sid,)).fetchone()
+        return row[0] if row else DEFAULT_TENANT_ID
+
+
+tenant_store = TenantStore()
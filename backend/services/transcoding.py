@@ -0,0 +1,261 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+from services import mulaw_codec
+from services.resampler import StreamingResampler
+
+# Audio transcoding for the media bridge, run either inline on the event loop or
+# on a shared worker pool. Each call direction gets a TranscodeLane: a bounded
+# queue with a single consumer, so chunks of one call are transcoded and
+# delivered in order while different calls run in parallel on the pool.
+
+TWILIO_SAMPLE_RATE = 8000
+INPUT_SAMPLE_RATE = 16000
+OUTPUT_SAMPLE_RATE = 24000
+
+TRANSCODE_MODE = os.getenv("TRANSCODE_MODE", "inline").lower()  # inline | thread | process
+TRANSCODE_WORKERS = int(os.getenv("TRANSCODE_WORKERS", str(os.cpu_count() or 1)))
+TRANSCODE_QUEUE_SIZE = int(os.getenv("TRANSCODE_QUEUE_SIZE", "50"))
+TRANSCODE_MAX_BATCH_BYTES = int(os.getenv("TRANSCODE_MAX_BATCH_BYTES", "16000"))
+
+TRANSCODE_MODES = ("inline", "thread", "process")
+
+
+class InboundTranscoder:
+    """Twilio 8 kHz mu-law -> Deepgram 16 kHz linear16. With `timed`, per-stage durations of the last job are kept in `timings`."""
+
+    def __init__(self, timed: bool = False):
+        self.resampler = StreamingResampler(TWILIO_SAMPLE_RATE, INPUT_SAMPLE_RATE)
+        self.timed = timed
+        self.timings = ()
+
+    def __call__(self, mulaw_data: bytes) -> bytes:
+        if not mulaw_data: return b''
+        if not self.timed:
+            return self.resampler.process_array(mulaw_codec.ulaw_to_pcm16_array(mulaw_data)).tobytes()
+        started = time.perf_counter()
+        pcm_8k = mulaw_codec.ulaw_to_pcm16_array(mulaw_data)
+        decoded = time.perf_counter()
+        pcm_16k_data = self.resampler.process_array(pcm_8k).tobytes()
+        self.timings = (("decode", decoded - started), ("resample_in", time.perf_counter() - decoded))
+        return pcm_16k_data
+
+
+class OutboundTranscoder:
+    """Deepgram 24 kHz linear16 -> Twilio 8 kHz mu-law. With `timed`, per-stage durations of the last job are kept in `timings`."""
+
+    def __init__(self, timed: bool = False):
+        self.resampler = StreamingResampler(OUTPUT_SAMPLE_RATE, TWILIO_SAMPLE_RATE)
+        self.timed = timed
+        self.timings = ()
+
+    def __call__(self, pcm_data: bytes) -> bytes:
+        if not pcm_data: return b''
+        if not self.timed:
+            return mulaw_codec.pcm16_to_ulaw(self.resampler.process(pcm_data))
+        started = time.perf_counter()
+        pcm_8k_data = self.resampler.process(pcm_data)
+        resampled = time.perf_counter()
+        mulaw_data = mulaw_codec.pcm16_to_ulaw(pcm_8k_data)
+        self.timings = (("resample_out", resampled - started), ("encode", time.perf_counter() - resampled))
+        return mulaw_data
+
+
+def _run_transcoder(transcoder, data: bytes):
+    """Process-pool entry point. Returns the transcoder too, since its filter state changed in the worker."""
+    return transcoder, transcoder(data)
+
+
+class TranscodeExecutor:
+    """Runs transcoder jobs inline, on a thread pool, or on a process pool."""
+
+    def __init__(self, mode: str = TRANSCODE_MODE, workers: int = TRANSCODE_WORKERS):
+        if mode not in TRANSCODE_MODES:
+            raise ValueError(f"Unknown TRANSCODE_MODE '{mode}', expected one of {TRANSCODE_MODES}")
+        self.mode = mode
+        self.workers = max(1, workers)
+        self._pool: Executor = None
+        if mode == "thread":
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="transcode")
+        elif mode == "process":
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+    @property
+    def inline(self) -> bool:
+        return self._pool is None
+
+    async def run(self, transcoder, data: bytes):
+        """Transcodes `data` and returns (transcoder, result). The transcoder is a new object in process mode."""
+        if self.mode == "inline":
+            return transcoder, transcoder(data)
+        loop = asyncio.get_running_loop()
+        if self.mode == "thread":
+            return transcoder, await loop.run_in_executor(self._pool, transcoder, data)
+        return await loop.run_in_executor(self._pool, _run_transcoder, transcoder, data)
+
+    async def warm_up(self):
+        """Builds the codec tables and runs one small job per worker, so pool threads/processes are started and have imported the codec."""
+        await asyncio.to_thread(mulaw_codec.load_tables)
+        frame = bytes([mulaw_codec.MULAW_SILENCE]) * 160
+        await asyncio.gather(*(self.run(InboundTranscoder(), frame) for _ in range(self.workers if self._pool else 1)))
+        await self.run(OutboundTranscoder(), bytes(960))
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+class TranscodeLane:
+    """Ordered, bounded transcoding pipeline for one direction of one call."""
+
+    _CLOSE = object()
+
+    def __init__(self, executor: TranscodeExecutor, transcoder, sink, name: str,
+                 max_pending: int = TRANSCODE_QUEUE_SIZE, max_batch_bytes: int = TRANSCODE_MAX_BATCH_BYTES, observer=None):
+        self.executor = executor
+        self.transcoder = transcoder
+        self.sink = sink
+        self.observer = observer  # optional (transcoder, job_seconds), called after each job
+        self.name = name
+        self.max_batch_bytes = max_batch_bytes
+        self._queue: asyncio.Queue = None
+        self._task: asyncio.Task = None
+        self._unfinished = 0
+        if not executor.inline:
+            self._queue = asyncio.Queue(maxsize=max_pending)
+            self._task = asyncio.create_task(self._consume(), name=f"transcode-{name}")
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    @property
+    def unfinished(self) -> int:
+        """Chunks submitted but not yet delivered to the sink, including the batch being transcoded."""
+        return self._unfinished
+
+    async def submit(self, data: bytes):
+        """Queues a chunk for transcoding, waiting while the lane is full."""
+        if not data: return
+        if self._task is None:
+            self._unfinished += 1
+            try:
+                await self._run(data)
+            finally:
+                self._unfinished -= 1
+            return
+        if self._task.done():
+            raise RuntimeError(f"Transcode lane {self.name} is no longer running")
+        self._unfinished += 1
+        try:
+            await self._queue.put(data)
+        except BaseException:
+            self._unfinished -= 1
+            raise
+
+    async def _consume(self):
+        queue = self._queue
+        closing = False
+        while not closing:
+            item = await queue.get()
+            if item is self._CLOSE:
+                queue.task_done()
+                break
+            batch = [item]
+            size = len(item)
+            while size < self.max_batch_bytes and not queue.empty():
+                item = queue.get_nowait()
+                if item is self._CLOSE:
+                    queue.task_done()
+                    closing = True
+                    break
+                batch.append(item)
+                size += len(item)
+            data = batch[0] if len(batch) == 1 else b''.join(batch)
+            try:
+                await self._run(data)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"[{self.name}] Transcode lane stopped: {e}", exc_info=True)
+                break
+            finally:
+                self._unfinished -= len(batch)
+                for _ in batch:
+                    queue.task_done()
+
+    async def _run(self, data: bytes):
+        if self.observer is None:
+            self.transcoder, result = await self.executor.run(self.transcoder, data)
+        else:
+            started = time.perf_counter()
+            self.transcoder, result = await self.executor.run(self.transcoder, data)
+            self.observer(self.transcoder, time.perf_counter() - started)
+        await self.sink(result)
+
+    async def drain(self):
+        """Waits until every chunk submitted so far has been delivered to the sink, or the consumer has stopped.
+
+        Chunks left behind by a consumer that stopped on an error are discarded.
+        """
+        if self._task is None:
+            return
+        if not self._task.done():
+            joined = asyncio.ensure_future(self._queue.join())
+            try:
+                await asyncio.wait((joined, self._task), return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                joined.cancel()
+        if self._task.done():
+            self.discard_pending()
+
+    def discard_pending(self) -> int:
+        """Drops chunks that are queued but not yet being transcoded. Returns how many were dropped."""
+        if self._queue is None:
+            return 0
+        dropped = 0
+        closing = False
+        while not self._queue.empty():
+            if self._queue.get_nowait() is self._CLOSE:
+                closing = True
+            else:
+                dropped += 1
+                self._unfinished -= 1
+            self._queue.task_done()
+        if closing:
+            self._queue.put_nowait(self._CLOSE)
+        return dropped
+
+    async def close(self):
+        """Flushes queued chunks and stops the consumer."""
+        if self._task is None or self._task.done():
+            return
+        await self._queue.put(self._CLOSE)
+        await self._task
+
+    def cancel(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+
+
+_executor: TranscodeExecutor = None
+
+
+def get_executor() -> TranscodeExecutor:
+    global _executor
+    if _executor is None:
+        _executor = TranscodeExecutor()
+        logging.info(f"Transcoding executor started (mode: {_executor.mode}, workers: {_executor.workers}).")
+    return _executor
+
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown()
+        _executor = None
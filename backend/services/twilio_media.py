@@ -0,0 +1,70 @@
+import binascii
+import json
+
+from services import metrics
+
+# Framing for Twilio media-stream messages on the hot path. Inbound `media`
+# events (50 per second per call) are recognised by their leading "event" key,
+# and the payload, sequenceNumber and timestamp are read straight out of the
+# text: no dict tree is built and only the base64 payload is copied before it is
+# decoded. Anything else, or a media message laid out differently (Twilio has
+# never been seen to), returns None and goes through json.loads.
+# Outbound media frames are the stream's precomputed JSON prefix, the base64 of
+# the frame, and a fixed suffix.
+
+# Media event prefix and the keys read from it, each up to the opening quote of its string value,
+# as Twilio sends them and as json.dumps writes them with its default separators.
+_COMPACT = ('{"event":"media"', '"payload":"', '"sequenceNumber":"', '"timestamp":"')
+_SPACED = ('{"event": "media"', '"payload": "', '"sequenceNumber": "', '"timestamp": "')
+_MEDIA_SUFFIX = '"}}'
+
+metrics.registry.describe("twilio_media_slow_path_total", "Inbound Twilio media events that needed a full JSON parse.")
+
+
+def parse_media(message: str):
+    """(sequence_number, timestamp, mulaw) of an inbound media event, or None to fall back to json.loads.
+
+    sequence_number is None when the message has none; timestamp defaults to 0.
+    """
+    if message.startswith(_COMPACT[0]):
+        _, payload_key, sequence_key, timestamp_key = _COMPACT
+    elif message.startswith(_SPACED[0]):
+        _, payload_key, sequence_key, timestamp_key = _SPACED
+    else:
+        return None
+    start = message.find(payload_key)
+    if start < 0:
+        return None
+    start += len(payload_key)
+    end = message.find('"', start)
+    encoded = message[start:end]
+    if end < 0 or "\\" in encoded:
+        return None
+    sequence_number = None
+    timestamp = 0
+    try:
+        mulaw = binascii.a2b_base64(encoded)
+        start = message.find(sequence_key)
+        if start >= 0:
+            start += len(sequence_key)
+            sequence_number = int(message[start:message.find('"', start)])
+        start = message.find(timestamp_key)
+        if start >= 0:
+            start += len(timestamp_key)
+            timestamp = int(message[start:message.find('"', start)])
+    except ValueError:
+        return None
+    return sequence_number, timestamp, mulaw
+
+
+class MediaFrameEncoder:
+    """Builds outbound media messages for one stream from a precomputed template."""
+
+    __slots__ = ("stream_sid", "_prefix")
+
+    def __init__(self, stream_sid: str):
+        self.stream_sid = stream_sid
+        self._prefix = '{"event":"media","streamSid":' + json.dumps(stream_sid) + ',"media":{"payload":"'
+
+    def encode(self, mulaw_frame: bytes) -> str:
+        return self._prefix + binascii.b2a_base64(mulaw_frame, newline=False).decode("ascii") + _MEDIA_SUFFIX
@@ -0,0 +1,173 @@
+import os
+import time
+from collections import deque
+
+import numpy as np
+
+from services import mulaw_codec
+
+# Inbound voice-activity detection on Twilio mu-law batches, run before transcoding.
+# Each jitter-buffer batch is split into 10 ms frames, and per-frame energy and
+# zero-crossing rate are computed in one vectorized pass straight from the mu-law
+# bytes (squared-sample lookup table, sign bit). A frame is speech if it is loud
+# enough over an adaptive noise floor, or quieter but with a fricative-like
+# zero-crossing rate. A hangover keeps short pauses inside an utterance as
+# speech. Silent batches are never decoded or resampled. Depending on
+# VAD_SILENCE_MODE they are dropped, turned into periodic KeepAlive messages, or
+# thinned to every Nth batch of digital silence. A short pre-roll of the silence
+# before each onset is sent along with it, so first syllables are not clipped.
+
+VAD_ENABLED = os.getenv("VAD_ENABLED", "false").lower() == "true"
+VAD_SILENCE_MODE = os.getenv("VAD_SILENCE_MODE", "thin")   # thin | keepalive | drop
+VAD_FRAME_MS = 10
+VAD_THRESHOLD_DB = float(os.getenv("VAD_THRESHOLD_DB", "-50"))      # absolute floor, dBFS
+VAD_NOISE_MARGIN_DB = float(os.getenv("VAD_NOISE_MARGIN_DB", "9"))  # speech must be this far above the noise floor
+VAD_UNVOICED_OFFSET_DB = 8.0
+VAD_UNVOICED_MIN_ZCR = 0.3
+VAD_HANGOVER_MS = int(os.getenv("VAD_HANGOVER_MS", "400"))
+VAD_PREROLL_MS = int(os.getenv("VAD_PREROLL_MS", "120"))
+VAD_THIN_EVERY = max(1, int(os.getenv("VAD_THIN_EVERY", "5")))
+VAD_KEEPALIVE_INTERVAL_S = float(os.getenv("VAD_KEEPALIVE_INTERVAL_S", "5"))
+
+SAMPLES_PER_FRAME = 8 * VAD_FRAME_MS
+FULL_SCALE_FRAME_POWER = SAMPLES_PER_FRAME * 32768.0 ** 2
+# Per batch, the noise floor drops to the quietest frame at once but only rises slowly: faster in silence,
+# very slowly during speech, so a line that is noisy from the first frame still gets calibrated.
+NOISE_FLOOR_RISE_SILENT = 10 ** (0.5 / 10)
+NOISE_FLOOR_RISE_ACTIVE = 10 ** (0.1 / 10)
+
+_power_table: np.ndarray = None
+
+
+def power_table() -> np.ndarray:
+    """Per-byte squared sample value, so frame energy needs no int16 decode."""
+    global _power_table
+    if _power_table is None:
+        _power_table = mulaw_codec.decode_table().astype(np.float32) ** 2
+    return _power_table
+
+SPEECH = "speech"
+SILENCE = "silence"
+KEEPALIVE = "keepalive"
+
+
+def _db_to_frame_power(db: float) -> float:
+    return FULL_SCALE_FRAME_POWER * 10 ** (db / 10)
+
+
+class InboundVad:
+    """Energy + zero-crossing VAD with hangover and pre-roll over mu-law batches."""
+
+    def __init__(self, silence_mode: str = VAD_SILENCE_MODE):
+        self.silence_mode = silence_mode
+        self.speaking = False
+        self._min_power = _db_to_frame_power(VAD_THRESHOLD_DB)
+        self._noise_floor = _db_to_frame_power(VAD_THRESHOLD_DB - VAD_NOISE_MARGIN_DB)
+        self._set_thresholds()
+        self._frames_since_active = 1 << 30
+        self._hangover_frames = max(0, VAD_HANGOVER_MS // VAD_FRAME_MS)
+        self._preroll = deque()
+        self._preroll_bytes = 0
+        self._preroll_limit = VAD_PREROLL_MS * 8
+        self._silent_batches = 0
+        self._last_keepalive = time.monotonic()
+        self._tail = b""
+        self.speech_frames = 0
+        self.silence_frames = 0
+        self.onsets = 0
+
+    def _set_thresholds(self):
+        # Voiced speech: clearly above the noise floor. Unvoiced candidates: halfway there, confirmed by ZCR.
+        self._voiced_power = max(self._min_power, self._noise_floor * 10 ** (VAD_NOISE_MARGIN_DB / 10))
+        self._unvoiced_power = max(self._voiced_power * 10 ** (-VAD_UNVOICED_OFFSET_DB / 10),
+                                   self._noise_floor * 10 ** (VAD_NOISE_MARGIN_DB / 20))
+
+    @property
+    def noise_floor_db(self) -> float:
+        return float(10 * np.log10(self._noise_floor / FULL_SCALE_FRAME_POWER + 1e-12))
+
+    def _classify(self, mulaw: np.ndarray) -> bool:
+        """Runs the detector over the whole batch; True if it holds speech or falls within the hangover."""
+        frames = mulaw.reshape(-1, SAMPLES_PER_FRAME)
+        power = power_table()[frames].sum(axis=1)
+        active = power > self._voiced_power
+        if not active.any():
+            candidates = power > self._unvoiced_power
+            if candidates.any():
+                signs = frames[candidates] >= 0x80   # mu-law sign bit: set for non-negative samples
+                zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / (SAMPLES_PER_FRAME - 1)
+                active[candidates] = zcr > VAD_UNVOICED_MIN_ZCR
+
+        count = len(active)
+        any_active = active.any()
+        if any_active:
+            last_active = count - 1 - int(np.argmax(active[::-1]))
+            self._frames_since_active = count - 1 - last_active
+            is_speech = True
+        else:
+            is_speech = self._frames_since_active < self._hangover_frames
+            self._frames_since_active += count
+        quietest = float(power.min())
+        rise = NOISE_FLOOR_RISE_ACTIVE if any_active else NOISE_FLOOR_RISE_SILENT
+        self._noise_floor = quietest if quietest < self._noise_floor else min(quietest, self._noise_floor * rise)
+        self._set_thresholds()
+
+        if is_speech:
+            self.speech_frames += count
+        else:
+            self.silence_frames += count
+        return is_speech
+
+    def process(self, mulaw_batch: bytes):
+        """
+        Classifies a mu-law batch. Returns (SPEECH, mu-law bytes to transcode, pre-roll included),
+        (SILENCE, 16 kHz PCM silence to send as is), (KEEPALIVE, None) or (None, None) to send nothing.
+        """
+        data = self._tail + mulaw_batch if self._tail else mulaw_batch
+        usable = len(data) - len(data) % SAMPLES_PER_FRAME
+        self._tail = data[usable:]
+        if not usable:
+            return None, None
+        batch = data[:usable]
+        is_speech = self._classify(np.frombuffer(batch, dtype=np.uint8))
+
+        if is_speech:
+            if not self.speaking:
+                self.speaking = True
+                self.onsets += 1
+                if self._preroll:
+                    batch = b"".join(self._preroll) + batch
+                    self._preroll.clear()
+                    self._preroll_bytes = 0
+            self._silent_batches = 0
+            return SPEECH, batch
+
+        self.speaking = False
+        self._preroll.append(batch)
+        self._preroll_bytes += len(batch)
+        while self._preroll_bytes - len(self._preroll[0]) >= self._preroll_limit:
+            self._preroll_bytes -= len(self._preroll.popleft())
+        self._silent_batches += 1
+        if self.silence_mode == "thin":
+            if (self._silent_batches - 1) % VAD_THIN_EVERY == 0:
+                return SILENCE, bytes(len(batch) * 4)   # 8 kHz -> 16 kHz samples, two bytes each
+            return None, None
+        if self.silence_mode == "keepalive":
+            now = time.monotonic()
+            if now - self._last_keepalive >= VAD_KEEPALIVE_INTERVAL_S:
+                self._last_keepalive = now
+                return KEEPALIVE, None
+        return None, None
+
+    def flush(self) -> bytes:
+        """Leftover sub-frame bytes, if the call is currently in speech."""
+        tail, self._tail = self._tail, b""
+        return tail if self.speaking else b""
+
+    def stats(self) -> dict:
+        total = self.speech_frames + self.silence_frames
+        return {
+            "speech_frames": self.speech_frames, "silence_frames": self.silence_frames,
+            "suppressed_pct": round(100.0 * self.silence_frames / total, 1) if total else 0.0,
+            "onsets": self.onsets, "noise_floor_db": round(self.noise_floor_db, 1),
+        }
@@ -0,0 +1,87 @@
+import asyncio
+
+from services.campaign_service import Campaign, CampaignManager
+from services.tenant_store import TenantStore
+
+
+def test_cancel_while_rate_limited_releases_slot():
+    async def scenario():
+        manager = CampaignManager(max_live_calls=5)
+        placed = []
+
+        async def dialer(phone_number, user_name, tenant_id):
+            placed.append(phone_number)
+            return {"success": True, "call_sid": f"CA{len(placed)}"}
+
+        manager.configure(dialer)
+        contacts = [{"phone_number": f"+1555000000{i}", "user_name": "x"} for i in range(3)]
+        campaign = manager.create("regression", contacts, calls_per_second=0.1)
+        campaign.start()
+        # The first call uses the bucket's burst; the scheduler then holds a slot while waiting for the next token.
+        await asyncio.sleep(0.2)
+        assert manager.live_calls == 2
+        campaign.cancel()
+        await asyncio.sleep(0)
+        for index in range(len(placed)):
+            manager.on_call_finished(f"CA{index + 1}", "completed")
+        await asyncio.sleep(0)
+        return manager, campaign, placed
+
+    manager, campaign, placed = asyncio.run(scenario())
+    assert placed == ["+15550000000"]
+    assert manager.live_calls == 0
+    assert campaign.live_calls == 0
+    assert campaign.counts() == {"completed": 1, "cancelled": 2}
+
+
+def test_refused_call_is_requeued_without_spending_an_attempt():
+    async def scenario():
+        manager = CampaignManager(max_live_calls=5)
+        results = [{"error": "at capacity", "refused": True}, {"success": True, "call_sid": "CA1"}]
+
+        async def dialer(phone_number, user_name, tenant_id):
+            return results.pop(0)
+
+        manager.configure(dialer)
+        campaign = manager.create("refused", [{"phone_number": "+15550000000", "user_name": "x"}],
+                                  calls_per_second=100, max_attempts=1)
+        # Lift the CPS caps (TWILIO_MAX_CPS) so the re-queued contact is dialled right away.
+        campaign.bucket.rate = manager.account_bucket.rate = 100
+        campaign.start()
+        for _ in range(50):
+            await asyncio.sleep(0.01)
+            if not results:
+                break
+        manager.on_call_finished("CA1", "completed")
+        await asyncio.sleep(0.05)
+        return manager, campaign
+
+    manager, campaign = asyncio.run(scenario())
+    contact = campaign.contacts[0]
+    assert contact.attempts == 1
+    assert contact.status == "completed"
+    assert manager.live_calls == 0
+
+
+def test_outcome_reported_by_another_worker_reaches_the_owner(tmp_path):
+    async def scenario():
+        owner, other = CampaignManager(), CampaignManager()
+        released = []
+        for manager in (owner, other):
+            manager.configure(dialer=None, outcome_store=TenantStore(str(tmp_path / "tenants.db")), release_call=released.append)
+        campaign = Campaign(owner, "shared", [{"phone_number": "+15550000000", "user_name": "x"}], 1, 5, 3, "default")
+        contact = campaign.contacts[0]
+        contact.attempts = 1
+        await owner.acquire_slot(campaign)
+        owner.track_call("CA1", campaign, contact)
+
+        assert other.on_call_finished("CA1", "busy") is False
+        owner._collect_outcomes()
+        await asyncio.sleep(0)
+        return owner, campaign, contact, released
+
+    owner, campaign, contact, released = asyncio.run(scenario())
+    assert released == ["CA1"]
+    assert owner.live_calls == 0
+    assert contact.status == "retry_wait" and contact.last_error == "busy"
+    assert not owner._calls
@@ -0,0 +1,27 @@
+import asyncio
+
+from services.clip_cache import ClipCache
+from services.playback import FRAME_BYTES
+
+
+def test_concurrent_disk_loads_are_counted_once(tmp_path):
+    writer = ClipCache(str(tmp_path), max_bytes=FRAME_BYTES * 150)
+    writer.put("acme", "Hello there", "voice", b"\x7f" * FRAME_BYTES * 100)
+
+    cache = ClipCache(str(tmp_path), max_bytes=FRAME_BYTES * 150)
+    cache.open()
+
+    async def get_twice():
+        return await asyncio.gather(cache.get("acme", "Hello there", "voice"), cache.get("acme", "Hello there", "voice"))
+
+    first, second = asyncio.run(get_twice())
+    assert first == second and len(first) == 100
+    assert list(cache._memory) == [next(iter(cache._index))]
+    assert cache.stats()["memory_bytes"] == FRAME_BYTES * 100
+    assert cache.stats()["disk_loads"] == 1
+
+
+def test_unknown_clip_is_a_miss(tmp_path):
+    cache = ClipCache(str(tmp_path))
+    assert asyncio.run(cache.get("acme", "Nothing here", "voice")) is None
+    assert cache.stats()["misses"] == 1
@@ -0,0 +1,38 @@
+import asyncio
+
+from services import deepgram_pool
+
+
+class FakeSocket:
+    def __init__(self):
+        self.closed = False
+
+    async def close(self):
+        self.closed = True
+
+
+def test_claim_timeout_closes_late_socket(monkeypatch):
+    sockets = []
+
+    async def slow_connect(settings):
+        await asyncio.sleep(0.1)
+        sockets.append(FakeSocket())
+        return sockets[-1]
+
+    monkeypatch.setattr(deepgram_pool, "connect_agent", slow_connect)
+    monkeypatch.setattr(deepgram_pool, "AGENT_PREWARM_ENABLED", True)
+    monkeypatch.setattr(deepgram_pool, "AGENT_POOL_IDLE_PER_KEY", 0)
+    monkeypatch.setattr(deepgram_pool, "DEEPGRAM_API_KEY", "test")
+    monkeypatch.setattr(deepgram_pool, "DEEPGRAM_CONNECT_TIMEOUT_S", 0.01)
+
+    async def scenario():
+        pool = deepgram_pool.AgentSessionPool()
+        settings = {"agent": {}}
+        assert pool.reserve("CA1", "Acme", settings)
+        assert await pool.claim("CA1", settings) is None
+        await asyncio.sleep(0.2)
+        return pool
+
+    pool = asyncio.run(scenario())
+    assert pool.reservation_count == 0
+    assert len(sockets) == 1 and sockets[0].closed
@@ -0,0 +1,38 @@
+from services.jitter_buffer import InboundJitterBuffer
+from services.mulaw_codec import MULAW_SILENCE
+
+SILENCE_MS = bytes([MULAW_SILENCE]) * 8
+
+
+def frame(seq: int) -> tuple:
+    """A 20 ms frame whose bytes identify its sequence number; timestamps follow Twilio's 20 ms spacing."""
+    return seq, (seq - 1) * 20, bytes([seq]) * 160
+
+
+def test_out_of_order_frames_come_out_in_sequence():
+    buffer = InboundJitterBuffer(window_ms=60)
+    assert buffer.push(*frame(2)) is None
+    assert buffer.push(*frame(1)) is None
+    batch = buffer.push(*frame(3))
+    assert batch == bytes([1]) * 160 + bytes([2]) * 160 + bytes([3]) * 160
+
+
+def test_missing_frame_is_filled_with_silence_and_capped():
+    buffer = InboundJitterBuffer(window_ms=40, max_gap_fill_ms=30)
+    buffer.push(*frame(1)) or buffer.push(*frame(2))
+    assert buffer.push(*frame(4)) is None          # frame 3 never arrives
+    batch = buffer.push(*frame(5))
+    assert batch == SILENCE_MS * 20 + bytes([4]) * 160 + bytes([5]) * 160
+    assert buffer.push(*frame(8)) is None and buffer.flush() == SILENCE_MS * 30 + bytes([8]) * 160
+    assert buffer.stats()["gap_fill_ms"] == 50
+
+
+def test_late_and_duplicate_frames_are_dropped():
+    buffer = InboundJitterBuffer(window_ms=40)
+    buffer.push(*frame(1))
+    assert buffer.push(*frame(1)) is None
+    assert buffer.push(*frame(2)) == bytes([1]) * 160 + bytes([2]) * 160
+    assert buffer.push(*frame(1)) is None
+    assert buffer.push(*frame(3)) is None
+    assert buffer.flush() == bytes([3]) * 160
+    assert buffer.stats() == {"frames_in": 5, "late_frames": 1, "duplicate_frames": 1, "gap_fill_ms": 0}
@@ -0,0 +1,45 @@
+from services.knowledge_index import KnowledgeIndex, chunk_text
+
+
+def test_overlap_not_smaller_than_the_passage_still_advances():
+    text = " ".join(f"w{i}" for i in range(50)) + "."
+    passages = chunk_text(text, chunk_words=4, overlap_words=4)
+    assert passages[0] == "w0 w1 w2 w3" and passages[1] == "w1 w2 w3 w4"
+    assert passages[-1].endswith("w49.")
+    assert len(passages) == 47
+
+
+PRICING = "Starter plan costs 20 dollars a month. Pro plan costs 90 dollars and adds call analytics."
+SUPPORT = "Support is open weekdays. Enterprise customers get a named account manager."
+
+
+def ranked(index, query):
+    return [(hit["document_id"], hit["text"], hit["score"]) for hit in index.search(query)]
+
+
+def test_reuploading_a_document_only_touches_its_own_passages():
+    index = KnowledgeIndex()
+    index.add_document("pricing", PRICING)
+    index.add_document("support", SUPPORT)
+    support_ids = [hit["passage_id"] for hit in index.search("account manager weekdays")]
+
+    index.add_document("pricing", "Pricing is now a flat 50 dollars per seat.")
+    assert [hit["passage_id"] for hit in index.search("account manager weekdays")] == support_ids
+    assert index.search("analytics") == []
+    assert index.document_count == 2
+
+    rebuilt = KnowledgeIndex()
+    rebuilt.add_document("support", SUPPORT)
+    rebuilt.add_document("pricing", "Pricing is now a flat 50 dollars per seat.")
+    for query in ("dollars seat", "account manager", "plans"):
+        assert ranked(index, query) == ranked(rebuilt, query)
+
+
+def test_removed_document_leaves_no_postings_behind():
+    index = KnowledgeIndex()
+    index.add_document("pricing", PRICING)
+    version = index.version
+    assert index.remove_document("pricing") and not index.remove_document("pricing")
+    assert index.version > version
+    assert (index.passage_count, index._postings, index._total_tokens) == (0, {}, 0)
+    assert index.agent_context("Acme") is None
@@ -0,0 +1,31 @@
+from io import BytesIO
+
+import numpy as np
+import pytest
+
+from services import mulaw_codec
+
+sf = pytest.importorskip("soundfile")
+
+
+def sf_raw(data: bytes, read_subtype: str, write_subtype: str) -> bytes:
+    samples, _ = sf.read(BytesIO(data), dtype="int16", channels=1, samplerate=8000, format="RAW", subtype=read_subtype)
+    out = BytesIO()
+    sf.write(out, samples, 8000, format="RAW", subtype=write_subtype)
+    return out.getvalue()
+
+
+def test_every_code_decodes_like_libsndfile():
+    codes = bytes(range(256))
+    assert mulaw_codec.ulaw_to_pcm16(codes) == sf_raw(codes, "ULAW", "PCM_16")
+
+
+def test_every_sample_encodes_like_libsndfile():
+    pcm = np.arange(-32768, 32768, dtype="<i2").tobytes()
+    assert mulaw_codec.pcm16_to_ulaw(pcm) == sf_raw(pcm, "PCM_16", "ULAW")
+
+
+def test_odd_trailing_byte_and_empty_input():
+    assert mulaw_codec.pcm16_to_ulaw(b"\x00\x00\x01") == mulaw_codec.pcm16_to_ulaw(b"\x00\x00")
+    assert mulaw_codec.pcm16_to_ulaw(b"") == b"" and mulaw_codec.ulaw_to_pcm16(b"") == b""
+    assert mulaw_codec.ulaw_to_pcm16(bytes([mulaw_codec.MULAW_SILENCE])) == b"\x00\x00"
@@ -0,0 +1,25 @@
+import asyncio
+
+from services.playback import FRAME_BYTES, PlaybackQueue
+
+
+def test_clip_frames_are_flagged_apart_from_agent_audio():
+    async def scenario():
+        sent = []
+
+        async def send_media(frame: bytes, from_clip: bool):
+            sent.append(from_clip)
+
+        async def noop(*args):
+            pass
+
+        playback = PlaybackQueue(send_media, noop, noop, name="test", lead_ms=1000)
+        assert playback.play_clip([b"\xff" * FRAME_BYTES] * 2)
+        playback.start()
+        await asyncio.sleep(0.05)
+        playback.enqueue(b"\x7f" * FRAME_BYTES * 2)
+        await asyncio.sleep(0.05)
+        await playback.close()
+        return sent
+
+    assert asyncio.run(scenario()) == [True, True, False, False]
@@ -0,0 +1,57 @@
+import asyncio
+import time
+
+from services.tenant_store import TenantStore
+
+
+def catalogue(words: int) -> str:
+    sentences = [f"Plan {i} includes feature{i % 97} and support tier {i % 13} for team{i % 31}." for i in range(words // 10)]
+    return " ".join(sentences)
+
+
+def test_reload_after_another_workers_upload_runs_off_the_event_loop(tmp_path):
+    path = str(tmp_path / "tenants.db")
+    serving, uploader = TenantStore(path), TenantStore(path)
+    serving.put_document("acme", "intro", "Acme sells anvils. Delivery is free.")
+    before = serving.get("acme")
+    uploader.put_document("acme", "catalogue", catalogue(150_000))
+    serving._checked_at = 0.0   # skip TENANT_CACHE_CHECK_S
+
+    async def reload_while_ticking():
+        gaps = []
+        stop = False
+
+        async def ticker():
+            last = time.perf_counter()
+            while not stop:
+                await asyncio.sleep(0.001)
+                now = time.perf_counter()
+                gaps.append(now - last)
+                last = now
+
+        ticking = asyncio.create_task(ticker())
+        started = time.perf_counter()
+        config = await serving.get_async("acme")
+        elapsed = time.perf_counter() - started
+        stop = True
+        await ticking
+        return config, elapsed, max(gaps)
+
+    after, reload_s, worst_gap = asyncio.run(reload_while_ticking())
+    assert after is not before
+    assert before.knowledge.document_count == 1            # calls holding the old config are unaffected
+    assert after.knowledge.document_count == 2 and not after.stale
+    assert serving.get("acme") is after
+    assert worst_gap < reload_s / 2, (worst_gap, reload_s)
+
+
+def test_reload_swaps_in_a_copy_and_keeps_the_old_index_intact(tmp_path):
+    store = TenantStore(str(tmp_path / "tenants.db"))
+    store.put_document("acme", "intro", "Acme sells anvils.")
+    old = store.get("acme")
+    store.put_document("acme", "intro", "Acme now sells rockets.")
+    store.set_company_name("acme", "Acme Corp")
+    new = store.get("acme")
+    assert new is not old and new.company_name == "Acme Corp" and not new.stale
+    assert [hit["text"] for hit in old.knowledge.search("anvils")] == ["Acme sells anvils."]
+    assert old.knowledge.search("rockets") == [] and new.knowledge.search("anvils") == []
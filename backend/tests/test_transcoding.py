@@ -0,0 +1,62 @@
+import asyncio
+import time
+
+from services.transcoding import TranscodeExecutor, TranscodeLane
+
+
+class SlowTranscoder:
+    def __call__(self, data: bytes) -> bytes:
+        time.sleep(0.05)
+        return data
+
+
+def test_unfinished_counts_the_batch_being_transcoded():
+    async def scenario():
+        executor = TranscodeExecutor(mode="thread", workers=1)
+        delivered = []
+
+        async def sink(data: bytes):
+            delivered.append(data)
+
+        lane = TranscodeLane(executor, SlowTranscoder(), sink, name="test")
+        await lane.submit(b"speech")
+        await asyncio.sleep(0.01)   # the consumer has taken the chunk off the queue
+        counts = (lane.pending, lane.unfinished)
+        await lane.close()
+        executor.shutdown()
+        return counts, lane.unfinished, delivered
+
+    counts, unfinished_after, delivered = asyncio.run(scenario())
+    assert counts == (0, 1)
+    assert unfinished_after == 0
+    assert delivered == [b"speech"]
+
+
+class FailsOn:
+    def __init__(self, bad: bytes):
+        self.bad = bad
+
+    def __call__(self, data: bytes) -> bytes:
+        if data == self.bad:
+            raise ValueError("corrupt chunk")
+        return data
+
+
+def test_drain_returns_when_the_consumer_dies_with_chunks_queued():
+    async def scenario():
+        executor = TranscodeExecutor(mode="thread", workers=1)
+        delivered = []
+
+        async def sink(data: bytes):
+            delivered.append(data)
+
+        lane = TranscodeLane(executor, FailsOn(b"bad"), sink, name="test", max_batch_bytes=1)
+        for chunk in (b"ok", b"bad", b"later", b"never"):
+            await lane.submit(chunk)
+        await asyncio.wait_for(lane.drain(), timeout=2.0)
+        executor.shutdown()
+        return lane, delivered
+
+    lane, delivered = asyncio.run(scenario())
+    assert delivered == [b"ok"]
+    assert lane.pending == 0 and lane.unfinished == 0
@@ -0,0 +1,48 @@
+import base64
+import json
+
+import pytest
+
+from services.twilio_media import MediaFrameEncoder, parse_media
+
+AUDIO = bytes(range(160))
+PAYLOAD = base64.b64encode(AUDIO).decode()
+
+
+@pytest.mark.parametrize("separators", [(",", ":"), None])
+def test_media_event_in_either_layout(separators):
+    message = json.dumps({"event": "media", "sequenceNumber": "42", "media": {"track": "inbound", "timestamp": "820", "payload": PAYLOAD},
+                          "streamSid": "MZ1"}, separators=separators)
+    assert parse_media(message) == (42, 820, AUDIO)
+
+
+def test_missing_sequence_number_and_timestamp_use_defaults():
+    assert parse_media('{"event":"media","media":{"payload":"' + PAYLOAD + '"}}') == (None, 0, AUDIO)
+
+
+@pytest.mark.parametrize("message", [
+    '{"event":"start","start":{"streamSid":"MZ1"}}',
+    '{"event":"mark","streamSid":"MZ1","mark":{"name":"utterance-1"}}',
+    '{"event":"stop","streamSid":"MZ1"}',
+    '{"streamSid":"MZ1","event":"media","media":{"payload":"' + PAYLOAD + '"}}',   # keys in another order
+], ids=["start", "mark", "stop", "reordered"])
+def test_anything_but_a_plain_media_event_falls_back(message):
+    assert parse_media(message) is None
+    json.loads(message)
+
+
+@pytest.mark.parametrize("message", [
+    '{"event":"media","sequenceNumber":"1","media":{"timestamp":"0"}}',                   # no payload
+    '{"event":"media","media":{"payload":"' + PAYLOAD[:40],                                  # truncated
+    '{"event":"media","media":{"payload":"AAAA\\u0041"}}',                                 # escaped payload
+    '{"event":"media","media":{"payload":"not base64!"}}',
+    '{"event":"media","sequenceNumber":"x1","media":{"payload":"' + PAYLOAD + '"}}',
+    '{"event":"media","media":{"timestamp":"","payload":"' + PAYLOAD + '"}}',
+], ids=["no-payload", "truncated", "escaped", "bad-base64", "bad-sequence", "empty-timestamp"])
+def test_malformed_media_is_left_to_json_loads(message):
+    assert parse_media(message) is None
+
+
+def test_encoded_frame_is_valid_json():
+    message = MediaFrameEncoder('MZ"quoted"').encode(AUDIO)
+    assert json.loads(message) == {"event": "media", "streamSid": 'MZ"quoted"', "media": {"payload": PAYLOAD}}
@@ -0,0 +1,65 @@
+import numpy as np
+
+from services import vad
+from services.mulaw_codec import pcm16_array_to_ulaw
+
+BATCH_MS = 40
+rng = np.random.default_rng(7)
+
+
+def batch(level_dbfs: float = None, kind: str = "tone") -> bytes:
+    """40 ms of mu-law: digital silence, a 300 Hz vowel-like tone, or white noise at the given level."""
+    samples = np.zeros(BATCH_MS * 8)
+    if level_dbfs is not None:
+        amplitude = 32767 * 10 ** (level_dbfs / 20)
+        if kind == "tone":
+            samples = amplitude * np.sqrt(2) * np.sin(2 * np.pi * 300 * np.arange(len(samples)) / 8000)
+        else:
+            samples = amplitude * rng.standard_normal(len(samples))
+    return pcm16_array_to_ulaw(np.clip(samples, -32768, 32767).astype(np.int16)).tobytes()
+
+
+def kinds(detector, batches):
+    return [detector.process(b)[0] for b in batches]
+
+
+def test_speech_onset_carries_the_preroll_and_hangover_bridges_pauses():
+    detector = vad.InboundVad(silence_mode="drop")
+    assert kinds(detector, [batch()] * 10) == [None] * 10
+    kind, audio = detector.process(batch(-20))
+    assert kind == vad.SPEECH and detector.onsets == 1
+    assert len(audio) == BATCH_MS * 8 + vad.VAD_PREROLL_MS * 8   # pre-roll of the silence just before
+
+    hangover_batches = vad.VAD_HANGOVER_MS // BATCH_MS
+    pause = kinds(detector, [batch()] * (hangover_batches + 2))
+    assert pause[:hangover_batches] == [vad.SPEECH] * hangover_batches
+    assert pause[hangover_batches:] == [None, None]
+    assert detector.process(batch(-20))[0] == vad.SPEECH and detector.onsets == 2
+
+
+def test_steady_line_noise_is_learned_as_the_floor():
+    detector = vad.InboundVad(silence_mode="drop")
+    first = detector.process(batch(-35, "noise"))[0]
+    assert first == vad.SPEECH                    # loud for a fresh floor, so it passes through at first
+    decisions = kinds(detector, [batch(-35, "noise")] * 300)
+    assert decisions[-50:] == [None] * 50         # the floor rises slowly while "active"; by ~10 s the hiss is the floor
+    assert -40 < detector.noise_floor_db < -30
+    assert detector.process(batch(-10))[0] == vad.SPEECH
+
+
+def test_thin_mode_sends_every_nth_silent_batch_as_pcm():
+    detector = vad.InboundVad(silence_mode="thin")
+    results = [detector.process(batch()) for _ in range(2 * vad.VAD_THIN_EVERY)]
+    sent = [i for i, (kind, _) in enumerate(results) if kind == vad.SILENCE]
+    assert sent == [0, vad.VAD_THIN_EVERY]
+    assert results[0][1] == bytes(BATCH_MS * 8 * 4)     # 16 kHz, 16-bit zeros
+    assert detector.stats()["suppressed_pct"] == 100.0
+
+
+def test_sub_frame_remainders_are_carried_to_the_next_batch():
+    detector = vad.InboundVad(silence_mode="drop")
+    speech = batch(-20)
+    assert detector.process(speech[:50]) == (None, None)
+    kind, audio = detector.process(speech[50:] + speech[:30])
+    assert kind == vad.SPEECH and audio == speech
+    assert detector.flush() == speech[:30]
@@ -0,0 +1,29 @@
+// Live call events pushed by the backend over /ws/events (see backend/services/event_hub.py).
+
+export function subscribeToCallEvents({ callSid } = {}, onEvent) {
+  const params = callSid ? `?call_sid=${encodeURIComponent(callSid)}` : '';
+  const socket = new WebSocket(`ws://localhost:8000/ws/events${params}`);
+  socket.onmessage = (message) => onEvent(JSON.parse(message.data));
+  return () => socket.close();
+}
+
+export function describeCallEvent(event) {
+  switch (event.type) {
+    case 'CallInitiated':
+      return `Calling ${event.user_name || event.phone_number}...`;
+    case 'CallStarted':
+      return 'Call connected.';
+    case 'ConversationText':
+      return `${event.role === 'user' ? 'User' : 'Agent'}: ${event.content}`;
+    case 'UserStartedSpeaking':
+      return event.interrupted_agent ? '(user interrupted the agent)' : null;
+    case 'CallEnded':
+      return `Call ended after ${Math.round(event.duration_s || 0)}s.`;
+    case 'TwilioCallStatus':
+      return `Call status: ${event.CallStatus}`;
+    case 'EventsDropped':
+      return `(${event.count} updates skipped)`;
+    default:
+      return null;
+  }
+}
@@ -1,6 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import { useNavigate } from 'react-router-dom';
 import './components.css';
+import { describeCallEvent, subscribeToCallEvents } from '../callEvents';
 
 function CompanyDashboard() {
   const [knowledgeText, setKnowledgeText] = useState('');
@@ -11,6 +12,7 @@ function CompanyDashboard() {
   const [companyName, setCompanyName] = useState('');
   const [newCompanyName, setNewCompanyName] = useState('');
   const [companyNameStatus, setCompanyNameStatus] = useState('');
+  const [callActivity, setCallActivity] = useState([]);
   const navigate = useNavigate();
 
   useEffect(() => {
@@ -22,6 +24,11 @@ function CompanyDashboard() {
     }
   }, [navigate]);
 
+  useEffect(() => subscribeToCallEvents({}, (event) => {
+    const line = describeCallEvent(event);
+    if (line) setCallActivity((lines) => [`${event.call_sid}: ${line}`, ...lines].slice(0, 50));
+  }), []);
+
   const fetchCompanyName = async () => {
     try {
       const response = await fetch('http://localhost:8000/company_info');
@@ -157,11 +164,14 @@ function CompanyDashboard() {
       </div>
 
       <div className="dashboard-section">
-        <h2>User Activity</h2>
-        <ul>
-          <li>User A - Last call: 3/28/2025</li>
-          <li>User B - Last call: 3/27/2025</li>
-        </ul>
+        <h2>Live Call Activity</h2>
+        {callActivity.length > 0 ? (
+          <ul>
+            {callActivity.map((line, index) => <li key={index}>{line}</li>)}
+          </ul>
+        ) : (
+          <p>No call activity yet.</p>
+        )}
       </div>
     </div>
   );
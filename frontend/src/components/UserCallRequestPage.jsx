@@ -1,6 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import { useNavigate } from 'react-router-dom';
 import './components.css';
+import { describeCallEvent, subscribeToCallEvents } from '../callEvents';
 
 function UserCallRequestPage() {
   const [userName, setUserName] = useState('');
@@ -10,6 +11,7 @@ function UserCallRequestPage() {
   const [isLoadingCall, setIsLoadingCall] = useState(false);
   const [conversationLog, setConversationLog] = useState(null);
   const [isFetchingLog, setIsFetchingLog] = useState(false);
+  const [liveTranscript, setLiveTranscript] = useState([]);
   const [companyName, setCompanyName] = useState('Our Company');
   const navigate = useNavigate();
 
@@ -35,6 +37,14 @@ function UserCallRequestPage() {
     fetchInfo();
   }, [navigate]);
 
+  useEffect(() => {
+    if (!callSid) return undefined;
+    return subscribeToCallEvents({ callSid }, (event) => {
+      const line = describeCallEvent(event);
+      if (line) setLiveTranscript((lines) => [...lines, line].slice(-200));
+    });
+  }, [callSid]);
+
   const handleInitiateCall = async () => {
     if (!phoneNumber || !userName) {
       setCallStatus('Please enter your name and phone number.');
@@ -44,6 +54,7 @@ function UserCallRequestPage() {
     setCallStatus('Initiating call...');
     setCallSid(null);
     setConversationLog(null);
+    setLiveTranscript([]);
     try {
       const response = await fetch('http://localhost:8000/initiate_call', {
         method: 'POST',
@@ -132,6 +143,11 @@ function UserCallRequestPage() {
       {callSid && (
         <div className="conversation-log-section">
           <h2>Call Log</h2>
+          {liveTranscript.length > 0 && (
+            <div className="conversation-log-result">
+              <pre>{liveTranscript.join('\n')}</pre>
+            </div>
+          )}
           <button onClick={handleFetchConversationLog} disabled={isFetchingLog}>
             {isFetchingLog ? 'Fetching...' : 'View Log'}
           </button>